@@ -1,7 +1,69 @@
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
+
+from callculator.models import (
+    Call,
+    CallRecord,
+    Holiday,
+    HolidayCalendar,
+    MonthlyBill,
+    QueuedRecord,
+    TariffBand,
+    TariffPlan,
+)
+
+
+class TariffBandFormSet(BaseInlineFormSet):
+    def clean(self):
+        """Bands of a plan can't overlap on the same day."""
+        super().clean()
+
+        bands = sorted(
+            (
+                form.cleaned_data["day"],
+                form.cleaned_data["start_minute"],
+                form.cleaned_data["end_minute"],
+            )
+            for form in self.forms
+            if form.cleaned_data
+            and not form.cleaned_data.get("DELETE")
+            and not form.errors
+        )
+        for (day, first, last), (next_day, next_first, next_last) in zip(
+            bands, bands[1:]
+        ):
+            if day == next_day and next_first < last:
+                raise ValidationError(
+                    f"{TariffBand.Day(day).label} bands {first}-{last} and "
+                    f"{next_first}-{next_last} overlap."
+                )
+
+
+class TariffBandInline(admin.TabularInline):
+    model = TariffBand
+    formset = TariffBandFormSet
+    extra = 0
+
+
+class HolidayInline(admin.TabularInline):
+    model = Holiday
+    extra = 0
+
+
+@admin.register(TariffPlan)
+class TariffPlanAdmin(admin.ModelAdmin):
+    list_display = ["name", "initial_cost", "is_default", "holiday_calendar"]
+    inlines = [TariffBandInline]
+
+
+@admin.register(HolidayCalendar)
+class HolidayCalendarAdmin(admin.ModelAdmin):
+    inlines = [HolidayInline]
 
-from callculator.models import Call, CallRecord
 
 # Register your models here.
 admin.site.register(Call)
 admin.site.register(CallRecord)
+admin.site.register(MonthlyBill)
+admin.site.register(QueuedRecord)
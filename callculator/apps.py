@@ -6,9 +6,11 @@ class CallculatorConfig(AppConfig):
     name = "callculator"
 
     def ready(self):
-        from callculator.urls import router
+        from callculator import metrics, tariffs  # noqa: F401
+        from callculator.urls import router, urlpatterns
         from core.urls import urlpatterns as base_urls
 
         base_urls.extend(router.urls)
+        base_urls.extend(urlpatterns)
 
         super().ready()
@@ -0,0 +1,352 @@
+"""
+Compressed columnar archives of closed billing months.
+
+``archive_period`` writes the completed calls of a month to
+``ARCHIVE_DIR/calls-YYYY-MM.cca``, sorted by source, then by ``(end, id)``
+as bills list them. Calls are packed in blocks of whole subscribers, each
+column of a block compressed on its own with zlib. The file ends with an
+uncompressed index of the sources, fixed width and sorted, pointing at the
+block and rows of each subscriber, then a JSON header and a footer locating
+the header::
+
+    MAGIC | blocks | sources | entries | header | header offset, size | MAGIC
+
+``Archive`` maps the file in memory, finds a subscriber with a binary
+search over the index and decompresses its block only, so serving a bill
+never touches the database.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+
+from callculator.records import RECORD_COLUMNS
+from callculator.tools import EPOCH, MICROSECOND
+
+MAGIC = b"CCAR1\n"
+VERSION = 1
+BLOCK_ROWS = 1024
+ENTRY = struct.Struct("<III")  # block, first row in the block, row count
+FOOTER = struct.Struct("<QQ")  # header offset and size
+
+# (column, array typecode), destinations go in a blob after their lengths
+COLUMNS = [
+    ("id", "q"),
+    ("end", "q"),
+    ("start", "q"),
+    ("duration", "q"),
+    ("cost", "d"),
+    ("destination_length", "q"),
+    ("day_minutes", "q"),
+    ("night_minutes", "q"),
+]
+NULL = -(2**63)
+
+# Columns of the calls given to ``Writer``
+ROW_COLUMNS = (
+    "source",
+    *RECORD_COLUMNS,
+    "end",
+    "id",
+    "day_minutes",
+    "night_minutes",
+)
+
+_archives = {}
+
+
+class ArchivedPeriodError(ValueError):
+    """A change to the calls of an archived month."""
+
+
+def archive_path(period: date) -> Path:
+    return Path(settings.ARCHIVE_DIR) / f"calls-{period:%Y-%m}.cca"
+
+
+def check_not_archived(periods):
+    """
+    Refuse changes to the calls of archived months: their bills are served
+    from the archive and would never show them.
+    """
+    archived = sorted(
+        {period for period in periods if archive_path(period).exists()}
+    )
+    if archived:
+        raise ArchivedPeriodError(
+            "Calls of archived months can't change: "
+            + ", ".join(f"{period:%Y-%m}" for period in archived)
+        )
+
+
+def to_microseconds(value: datetime) -> int:
+    return (value - EPOCH) // MICROSECOND
+
+
+def to_nullable(value: None | int) -> int:
+    return NULL if value is None else value
+
+
+def from_nullable(value: int) -> None | int:
+    return None if value == NULL else value
+
+
+def pack(typecode: str, values) -> bytes:
+    column = array(typecode, values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return zlib.compress(column.tobytes())
+
+
+def unpack(typecode: str, data) -> array:
+    column = array(typecode)
+    column.frombytes(zlib.decompress(data))
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+class Writer:
+    """Write rows of ``ROW_COLUMNS``, grouped by source, to a file."""
+
+    def __init__(self, file, period: date, block_rows: int = BLOCK_ROWS):
+        self.file = file
+        self.period = period
+        self.block_rows = block_rows
+        self.blocks = []
+        self.entries = {}
+        self.rows = 0
+        self.block = []
+        self.file.write(MAGIC)
+
+    def add(self, source: str, rows: list):
+        """Add the calls of one subscriber, in bill order."""
+        self.entries[source.encode()] = (
+            len(self.blocks),
+            len(self.block),
+            len(rows),
+        )
+        self.block.extend(rows)
+        self.rows += len(rows)
+        if len(self.block) >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.block:
+            return
+
+        (
+            _,
+            destinations,
+            starts,
+            durations,
+            costs,
+            ends,
+            ids,
+            day_minutes,
+            night_minutes,
+        ) = zip(*self.block)
+        destinations = [destination.encode() for destination in destinations]
+        columns = [
+            pack("q", ids),
+            pack("q", map(to_microseconds, ends)),
+            pack("q", map(to_microseconds, starts)),
+            pack(
+                "q",
+                (
+                    NULL if duration is None else duration // MICROSECOND
+                    for duration in durations
+                ),
+            ),
+            pack(
+                "d", (float("nan") if cost is None else cost for cost in costs)
+            ),
+            pack("q", map(len, destinations)),
+            pack("q", map(to_nullable, day_minutes)),
+            pack("q", map(to_nullable, night_minutes)),
+            zlib.compress(b"".join(destinations)),
+        ]
+
+        extents = []
+        for data in columns:
+            extents.append((self.file.tell(), len(data)))
+            self.file.write(data)
+        self.blocks.append(extents)
+        self.block = []
+
+    def close(self):
+        self.flush()
+
+        # Byte order of the padded sources is the order of the sources.
+        sources = sorted(self.entries)
+        width = max(map(len, sources), default=0)
+        index = self.file.tell()
+        for source in sources:
+            self.file.write(source.ljust(width, b"\0"))
+        for source in sources:
+            self.file.write(ENTRY.pack(*self.entries[source]))
+
+        header = json.dumps(
+            {
+                "version": VERSION,
+                "period": self.period.isoformat(),
+                "rows": self.rows,
+                "sources": len(sources),
+                "width": width,
+                "index": index,
+                "blocks": self.blocks,
+            }
+        ).encode()
+        offset = self.file.tell()
+        self.file.write(header)
+        self.file.write(FOOTER.pack(offset, len(header)))
+        self.file.write(MAGIC)
+
+
+class Sources:
+    """Sorted fixed width sources of an archive, read from the map."""
+
+    def __init__(self, buffer, offset: int, width: int, count: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.width = width
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position: int) -> bytes:
+        start = self.offset + position * self.width
+        return self.buffer[start : start + self.width]
+
+
+class Archive:
+    def __init__(self, path: Path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.modified = datetime.fromtimestamp(
+                os.fstat(file.fileno()).st_mtime, tz=dt_timezone.utc
+            )
+
+        trailer = FOOTER.size + len(MAGIC)
+        if self.map[: len(MAGIC)] != MAGIC or self.map[-len(MAGIC) :] != MAGIC:
+            raise ValueError(f"{path} is not a call archive")
+        offset, size = FOOTER.unpack_from(self.map, len(self.map) - trailer)
+        self.header = json.loads(self.map[offset : offset + size])
+
+        self.period = date.fromisoformat(self.header["period"])
+        width, count = self.header["width"], self.header["sources"]
+        self.sources = Sources(self.map, self.header["index"], width, count)
+        self.entries = self.header["index"] + width * count
+        self.cached = None
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def block(self, number: int) -> list:
+        """Decompressed columns of a block, the last one is kept."""
+        cached = self.cached
+        if cached is not None and cached[0] == number:
+            return cached[1]
+
+        extents = self.header["blocks"][number]
+        columns = [
+            unpack(typecode, self.map[offset : offset + size])
+            for (_, typecode), (offset, size) in zip(COLUMNS, extents)
+        ]
+        offset, size = extents[-1]
+        columns.append(zlib.decompress(self.map[offset : offset + size]))
+
+        self.cached = number, columns
+        return columns
+
+    def rows(self, source: str) -> list[tuple]:
+        """
+        Calls of ``source`` in bill order, as ``(destination, start,
+        duration, cost, end, id, day_minutes, night_minutes)`` rows.
+        """
+        return list(self.iter_rows(source))
+
+    def iter_rows(self, source: str):
+        """``rows`` one at a time, holding a single block in memory."""
+        key = source.encode()
+        sources = self.sources
+        if len(key) > sources.width:
+            return
+        key = key.ljust(sources.width, b"\0")
+        position = bisect_left(sources, key)
+        if position == len(sources) or sources[position] != key:
+            return
+
+        number, first, count = ENTRY.unpack_from(
+            self.map, self.entries + position * ENTRY.size
+        )
+        *columns, blob = self.block(number)
+        (
+            ids,
+            ends,
+            starts,
+            durations,
+            costs,
+            lengths,
+            day_minutes,
+            night_minutes,
+        ) = columns
+
+        offset = sum(lengths[:first])
+        for row in range(first, first + count):
+            length = lengths[row]
+            duration, cost = from_nullable(durations[row]), costs[row]
+            yield (
+                blob[offset : offset + length].decode(),
+                EPOCH + starts[row] * MICROSECOND,
+                None if duration is None else duration * MICROSECOND,
+                None if cost != cost else cost,
+                EPOCH + ends[row] * MICROSECOND,
+                ids[row],
+                from_nullable(day_minutes[row]),
+                from_nullable(night_minutes[row]),
+            )
+            offset += length
+
+
+def write_archive(path: Path, period: date, subscribers, block_rows=None):
+    """
+    Write ``(source, rows)`` pairs to the archive at ``path``, through a
+    temporary file so readers never see a partial archive. Returns the
+    numbers of rows and subscribers written.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + ".partial")
+    with open(partial, "wb") as file:
+        writer = Writer(file, period, block_rows or BLOCK_ROWS)
+        for source, rows in subscribers:
+            writer.add(source, rows)
+        writer.close()
+    os.replace(partial, path)
+    return writer.rows, len(writer.entries)
+
+
+def open_archive(period: date) -> None | Archive:
+    """The archive of ``period``, reopened when the file changes."""
+    path = archive_path(period)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        _archives.pop(path, None)
+        return None
+
+    version = stat.st_mtime_ns, stat.st_size
+    cached = _archives.get(path)
+    if cached is None or cached[0] != version:
+        cached = _archives[path] = version, Archive(path)
+    return cached[1]
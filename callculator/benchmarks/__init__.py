@@ -0,0 +1,68 @@
+"""Benchmark suites run by ``manage.py benchmark``."""
+
+import time
+from contextlib import contextmanager
+from importlib import import_module
+
+SUITES = {
+    "rating": "callculator.benchmarks.rating",
+    "ingest": "callculator.benchmarks.ingest",
+    "billing": "callculator.benchmarks.billing",
+    "concurrency": "callculator.benchmarks.concurrency",
+    "pooling": "callculator.benchmarks.pooling",
+    "batch_billing": "callculator.benchmarks.batch_billing",
+}
+
+
+def load(name: str):
+    return import_module(SUITES[name])
+
+
+def measure(func, calls: int, repeat: int = 3) -> dict:
+    """Best of ``repeat`` runs of ``func``, which performs ``calls`` calls."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+
+    return {
+        "calls": calls,
+        "seconds": round(best, 6),
+        "calls_per_second": round(calls / best, 1) if best else None,
+    }
+
+
+def regressions(baseline: dict, results: dict, threshold: float):
+    """
+    Yield ``(suite, case, baseline, current)`` calls per second for every
+    case of ``results`` more than ``threshold`` (a fraction) slower than in
+    ``baseline``. Cases missing from either side are ignored.
+    """
+    for suite, cases in results.items():
+        for case, result in cases.items():
+            before = baseline.get(suite, {}).get(case, {})
+            old = before.get("calls_per_second")
+            new = result["calls_per_second"]
+            if old and new is not None and new < old * (1 - threshold):
+                yield suite, case, old, new
+
+
+@contextmanager
+def test_database(verbosity: int = 0):
+    """Run against a throwaway test copy of the configured database."""
+    from django.db import connection
+    from django.test.utils import (
+        setup_test_environment,
+        teardown_test_environment,
+    )
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(
+        verbosity=verbosity, autoclobber=True
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity)
+        teardown_test_environment()
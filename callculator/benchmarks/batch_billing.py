@@ -0,0 +1,92 @@
+"""
+Bills of corporate accounts with 10, 100 and 1000 lines of 20 calls each:
+one batch billing request against one billing request per line, both on a
+cold bill cache.
+"""
+
+from datetime import date, datetime, timedelta
+
+from django.test import Client
+from django.utils import timezone
+
+from callculator.benchmarks import measure
+from callculator.bills import rebuild
+from callculator.cache import billing_cache
+from callculator.models import Call
+from callculator.tools import call_cost_calculator
+
+USES_DATABASE = True
+ACCOUNTS = (10, 100, 1000)
+CALLS_PER_LINE = 20
+PERIOD = date(2024, 1, 1)
+
+
+def phone_numbers(account: int, lines: int) -> list[str]:
+    """Lines of the ``account``-th account, an area code of its own each."""
+    return [f"{11 + account}{line:09d}" for line in range(lines)]
+
+
+def seed(numbers: list[str], batch_size: int = 5000):
+    """Completed calls of every line of an account spread over the month."""
+    month_start = timezone.make_aware(datetime(2024, 1, 1))
+    spacing = timedelta(days=31) / CALLS_PER_LINE
+    duration = timedelta(minutes=3, seconds=30)
+
+    batch = []
+    for source in numbers:
+        for position in range(CALLS_PER_LINE):
+            start = month_start + spacing * position
+            end = start + duration
+            batch.append(
+                Call(
+                    source=source,
+                    destination="21998765432",
+                    start=start,
+                    end=end,
+                    duration=duration,
+                    cost=call_cost_calculator(start, end),
+                )
+            )
+            if len(batch) >= batch_size:
+                Call.objects.bulk_create(batch)
+                batch = []
+    Call.objects.bulk_create(batch)
+
+
+def run(size: None | int = None, **options) -> dict:
+    """``size`` replaces the number of lines of the largest account."""
+    accounts = [
+        phone_numbers(account, lines)
+        for account, lines in enumerate((*ACCOUNTS[:-1], size or ACCOUNTS[-1]))
+    ]
+    for numbers in accounts:
+        seed(numbers)
+    rebuild(PERIOD)
+
+    client = Client()
+
+    def single(numbers):
+        billing_cache().clear()
+        for phone_number in numbers:
+            response = client.get(
+                "/callculator/billing/",
+                {"phone_number": phone_number, "dateref": "2024-01"},
+            )
+            assert response.status_code == 200, response.status_code
+
+    def batch(numbers):
+        billing_cache().clear()
+        response = client.post(
+            "/callculator/billing/batch/",
+            {"phone_numbers": numbers, "dateref": "2024-01"},
+            content_type="application/json",
+        )
+        assert response.status_code == 200, response.status_code
+
+    results = {}
+    for numbers in accounts:
+        for case, func in (("single", single), ("batch", batch)):
+            results[f"batch_billing_{len(numbers)}_{case}"] = measure(
+                lambda: func(numbers), len(numbers)
+            )
+    return results
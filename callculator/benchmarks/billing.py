@@ -0,0 +1,92 @@
+"""
+Billing requests for subscribers with 10, 10k and 500k calls in a month.
+
+Every subscriber is measured on a cold bill cache, a warm one, the first
+page of a paginated bill, a streamed bill and the summary of the bill.
+"""
+
+from datetime import date, datetime, timedelta
+
+from django.test import Client
+from django.utils import timezone
+
+from callculator.benchmarks import measure
+from callculator.bills import rebuild
+from callculator.cache import billing_cache
+from callculator.models import Call
+from callculator.tools import call_cost_calculator, day_night_minutes
+
+USES_DATABASE = True
+SUBSCRIBERS = (10, 10_000, 500_000)
+PERIOD = date(2024, 1, 1)
+
+
+def phone_number(calls: int) -> str:
+    return f"11{calls:09d}"
+
+
+def seed(calls: int, batch_size: int = 5000):
+    """Completed calls of ``phone_number(calls)`` spread over the month."""
+    month_start = timezone.make_aware(datetime(2024, 1, 1))
+    spacing = timedelta(days=31) / calls
+    duration = timedelta(minutes=3, seconds=30)
+    source = phone_number(calls)
+
+    batch = []
+    for position in range(calls):
+        start = month_start + spacing * position
+        end = start + duration
+        day_minutes, night_minutes = day_night_minutes(start, end)
+        batch.append(
+            Call(
+                source=source,
+                destination="21998765432",
+                start=start,
+                end=end,
+                duration=duration,
+                cost=call_cost_calculator(start, end),
+                day_minutes=day_minutes,
+                night_minutes=night_minutes,
+            )
+        )
+        if len(batch) >= batch_size:
+            Call.objects.bulk_create(batch)
+            batch = []
+    Call.objects.bulk_create(batch)
+
+
+def run(size: None | int = None, **options) -> dict:
+    """``size`` replaces the largest subscriber's number of calls."""
+    subscribers = (*SUBSCRIBERS[:-1], size or SUBSCRIBERS[-1])
+    for calls in subscribers:
+        seed(calls)
+    rebuild(PERIOD)
+
+    client = Client()
+
+    def get(requests, clear_cache=False, **params):
+        for _ in range(requests):
+            if clear_cache:
+                billing_cache().clear()
+            response = client.get("/callculator/billing/", params)
+            assert response.status_code == 200, response.status_code
+            if response.streaming:
+                b"".join(response.streaming_content)
+
+    results = {}
+    for calls in subscribers:
+        params = {"phone_number": phone_number(calls), "dateref": "2024-01"}
+        requests = min(max(10_000 // calls, 1), 200)
+        cases = {
+            "cold": {"clear_cache": True},
+            "cached": {},
+            "page": {"page_size": 100},
+            "stream": {"stream": "true"},
+            "summary": {"summary": "true"},
+        }
+        for case, extra in cases.items():
+            results[f"billing_{calls}_{case}"] = measure(
+                lambda: get(requests, **params, **extra), requests
+            )
+
+    return results
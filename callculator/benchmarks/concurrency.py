@@ -0,0 +1,103 @@
+"""
+Concurrent requests through the ASGI handler, sync views against async ones.
+
+Sync DRF views are run by the handler in its thread executor, the async
+views stay on the event loop.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from django.test import AsyncClient
+from django.utils import timezone
+
+from callculator.benchmarks import measure
+from callculator.models import Call
+
+USES_DATABASE = True
+CONCURRENCY = 50
+PHONE_NUMBER = "11987654321"
+
+
+def seed(calls: int = 1000):
+    first_end = timezone.make_aware(datetime(2024, 1, 1, 12, 0, 0))
+    Call.objects.bulk_create(
+        Call(
+            source=PHONE_NUMBER,
+            destination="21998765432",
+            start=first_end + timedelta(minutes=position - 5),
+            end=first_end + timedelta(minutes=position),
+            duration=timedelta(minutes=5),
+            cost=0.81,
+        )
+        for position in range(calls)
+    )
+
+
+def load(requests: list, concurrency: int = CONCURRENCY):
+    """Send ``requests`` with at most ``concurrency`` of them in flight."""
+
+    async def send_all():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(method, path, data):
+            async with semaphore:
+                if method == "post":
+                    response = await client.post(
+                        path, data, content_type="application/json"
+                    )
+                else:
+                    response = await client.get(path, data)
+                assert response.status_code == 200, response.content
+
+        await asyncio.gather(*(send(*request) for request in requests))
+
+    asyncio.run(send_all())
+
+
+def run(size: None | int = None, **options) -> dict:
+    size = size or 2000
+    seed()
+
+    billing = {"phone_number": PHONE_NUMBER, "dateref": "2024-01"}
+    results = {}
+    for name, prefix in (("sync", ""), ("async", "async/")):
+        results[f"billing_{name}"] = measure(
+            lambda: load(
+                [
+                    (
+                        "get",
+                        f"/callculator/{prefix}billing/",
+                        {**billing, "page_size": 50},
+                    )
+                    for _ in range(size)
+                ]
+            ),
+            size,
+            repeat=1,
+        )
+
+        offset = 10_000_000 if name == "sync" else 20_000_000
+        results[f"callrecord_{name}"] = measure(
+            lambda: load(
+                [
+                    (
+                        "post",
+                        f"/callculator/{prefix}callrecord/",
+                        {
+                            "type": "START",
+                            "timestamp": "2024-01-01T12:00:00Z",
+                            "call_id": offset + call_id,
+                            "source": PHONE_NUMBER,
+                            "destination": "21998765432",
+                        },
+                    )
+                    for call_id in range(size)
+                ]
+            ),
+            size,
+            repeat=1,
+        )
+
+    return results
@@ -0,0 +1,72 @@
+"""
+Call record ingestion through the sync endpoints, one record per request
+and in bulk.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+from itertools import count
+
+from django.conf import settings
+from django.test import Client
+
+from callculator.benchmarks import measure
+from callculator.ingest import TIMESTAMP_FORMAT
+
+USES_DATABASE = True
+PHONE_PREFIX = "119876"
+SUBSCRIBERS = 1000
+
+
+def records(call_ids):
+    """START and END records of calls of 1 to 60 minutes."""
+    origin = datetime(2024, 1, 1, 8, tzinfo=timezone.utc)
+    for call_id in call_ids:
+        start = origin + timedelta(seconds=call_id % 86_400)
+        end = start + timedelta(minutes=call_id % 60 + 1)
+        yield {
+            "type": "START",
+            "timestamp": start.strftime(TIMESTAMP_FORMAT),
+            "call_id": call_id,
+            "source": f"{PHONE_PREFIX}{call_id % SUBSCRIBERS:05d}",
+            "destination": "21998765432",
+        }
+        yield {
+            "type": "END",
+            "timestamp": end.strftime(TIMESTAMP_FORMAT),
+            "call_id": call_id,
+        }
+
+
+def run(size: None | int = None, **options) -> dict:
+    size = size or 10_000
+    client = Client()
+    call_ids = count(1)
+
+    def post(path, data):
+        response = client.post(
+            path, json.dumps(data), content_type="application/json"
+        )
+        assert response.status_code == 200, response.content
+
+    def single(requests):
+        calls = [next(call_ids) for _ in range(requests // 2)]
+        for record in records(calls):
+            post("/callculator/callrecord/", record)
+
+    def bulk():
+        chunk = settings.CALLRECORD_BULK_CHUNK_SIZE
+        batch = list(records(next(call_ids) for _ in range(size // 2)))
+        for position in range(0, len(batch), chunk):
+            post(
+                "/callculator/callrecord/bulk/",
+                batch[position : position + chunk],
+            )
+
+    single_size = max(2, size // 10)
+    return {
+        "callrecord_single": measure(
+            lambda: single(single_size), single_size, repeat=1
+        ),
+        "callrecord_bulk": measure(bulk, size // 2 * 2, repeat=1),
+    }
@@ -0,0 +1,87 @@
+"""
+Latency of single call record requests with a new database connection per
+request, with persistent connections and with a psycopg pool. PostgreSQL
+only: the suite has no cases on other databases.
+
+The test client keeps Django from closing connections after a request, so
+each request is wrapped in ``close_old_connections()``, as the
+``request_started`` and ``request_finished`` signals do under a server.
+"""
+
+import json
+from contextlib import contextmanager
+from itertools import count
+
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    close_old_connections,
+    connection,
+    connections,
+)
+from django.db.utils import load_backend
+from django.test import Client
+
+from callculator.benchmarks import measure
+from callculator.benchmarks.ingest import records
+
+USES_DATABASE = True
+MODES = {
+    "no_reuse": {"CONN_MAX_AGE": 0},
+    "persistent": {"CONN_MAX_AGE": 600, "CONN_HEALTH_CHECKS": True},
+    "pool": {
+        "CONN_MAX_AGE": 0,
+        "OPTIONS": {"pool": {"min_size": 1, "max_size": 4}},
+    },
+}
+
+
+@contextmanager
+def default_connection(overrides: dict):
+    """Serve the default database through a new, reconfigured connection."""
+    original = connections[DEFAULT_DB_ALIAS]
+    settings_dict = {
+        **original.settings_dict,
+        **overrides,
+        "OPTIONS": {
+            **original.settings_dict["OPTIONS"],
+            **overrides.get("OPTIONS", {}),
+        },
+    }
+    backend = load_backend(settings_dict["ENGINE"])
+    wrapper = backend.DatabaseWrapper(settings_dict, DEFAULT_DB_ALIAS)
+    connections[DEFAULT_DB_ALIAS] = wrapper
+    try:
+        yield
+    finally:
+        wrapper.close()
+        if "pool" in settings_dict["OPTIONS"]:
+            wrapper.close_pool()
+        connections[DEFAULT_DB_ALIAS] = original
+
+
+def run(size: None | int = None, **options) -> dict:
+    if connection.vendor != "postgresql":
+        return {}
+
+    size = size or 1000
+    client = Client()
+    call_ids = count(1)
+
+    def requests():
+        for record in records(next(call_ids) for _ in range(size // 2)):
+            close_old_connections()
+            response = client.post(
+                "/callculator/callrecord/",
+                json.dumps(record),
+                content_type="application/json",
+            )
+            assert response.status_code == 200, response.content
+            close_old_connections()
+
+    results = {}
+    for mode, overrides in MODES.items():
+        with default_connection(overrides):
+            results[f"callrecord_{mode}"] = measure(
+                requests, size // 2 * 2, repeat=1
+            )
+    return results
@@ -0,0 +1,81 @@
+import random
+from datetime import datetime, timezone
+
+from callculator.benchmarks import measure
+from callculator.models import TariffBand, TariffPlan
+from callculator.tariffs import CompiledPlan
+from callculator.tools import (
+    batch_call_cost_calculator,
+    call_cost_calculator,
+    np,
+)
+
+
+def calls(size: int, seed: int = 0, max_duration: int = 4 * 3600):
+    rng = random.Random(seed)
+    origin = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+
+    starts = [origin + rng.randrange(366 * 86_400) for _ in range(size)]
+    ends = [start + rng.randrange(max_duration) for start in starts]
+    return starts, ends
+
+
+def compiled_plan(bands_per_day: int = 48) -> CompiledPlan:
+    """An unsaved plan with ``bands_per_day`` bands on every weekday."""
+    width = 24 * 60 // bands_per_day
+    plan = TariffPlan(pk=0, name="benchmark", initial_cost=0.36)
+    bands = [
+        TariffBand(
+            day=day,
+            start_minute=position * width,
+            end_minute=(position + 1) * width,
+            minute_cost=position / 100,
+        )
+        for day in range(7)
+        for position in range(bands_per_day)
+    ]
+    return CompiledPlan.compile(plan, bands)
+
+
+def run(size: None | int = None, **options) -> dict:
+    size = size or 100_000
+    starts, ends = calls(size)
+    start_dts = [datetime.fromtimestamp(ts, timezone.utc) for ts in starts]
+    end_dts = [datetime.fromtimestamp(ts, timezone.utc) for ts in ends]
+
+    long_starts, long_ends = calls(size, max_duration=30 * 86_400)
+    long_start_dts = [
+        datetime.fromtimestamp(ts, timezone.utc) for ts in long_starts
+    ]
+    long_end_dts = [
+        datetime.fromtimestamp(ts, timezone.utc) for ts in long_ends
+    ]
+    plan = compiled_plan()
+
+    def scalar(starts, ends):
+        for start, end in zip(starts, ends):
+            call_cost_calculator(start, end)
+
+    def tariff_plan():
+        for start, end in zip(start_dts, end_dts):
+            plan.cost(start, end)
+
+    results = {
+        "scalar": measure(lambda: scalar(start_dts, end_dts), size),
+        "scalar_long": measure(
+            lambda: scalar(long_start_dts, long_end_dts), size
+        ),
+        "tariff_plan": measure(tariff_plan, size),
+        "batch_array": measure(
+            lambda: batch_call_cost_calculator(starts, ends), size
+        ),
+    }
+
+    if np is not None:
+        start_array = np.array(starts, dtype=np.int64)
+        end_array = np.array(ends, dtype=np.int64)
+        results["batch_numpy"] = measure(
+            lambda: batch_call_cost_calculator(start_array, end_array), size
+        )
+
+    return results
@@ -0,0 +1,252 @@
+import math
+from datetime import date, timedelta
+from itertools import groupby
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from callculator.archive import check_not_archived
+from callculator.models import Call, CallRecord, MonthlyBill, MonthlyBillLine
+from callculator.records import RECORD_COLUMNS, call_record, record_of
+from callculator.serializers import BillingResponseSerializer
+from callculator.tools import month_range
+
+
+def make_line(call: Call, bill_id: str) -> MonthlyBillLine:
+    end = call.end
+    if timezone.is_naive(end):
+        end = timezone.make_aware(end)
+
+    return MonthlyBillLine(
+        bill_id=bill_id,
+        call_id=call.pk,
+        end=end,
+        cost=call.cost or 0,
+        duration=call.duration or timedelta(),
+        record=record_of(call),
+    )
+
+
+def bill_lines(bill_id: str):
+    """Lines of a bill in bill order, ``(end, id)`` of their calls."""
+    return MonthlyBillLine.objects.filter(bill_id=bill_id).order_by(
+        "end", "call_id"
+    )
+
+
+def record_calls(calls):
+    """
+    Bring the monthly bills in line with freshly saved calls.
+
+    Each call gets a new line in the bill of its month, replacing the one it
+    had in any bill, or loses it if it is not complete. The totals of the
+    bills involved move by the difference, so the cost of recording a call
+    does not depend on the size of its bill.
+    """
+    # Only calls on a bill, or going on one, change any.
+    calls = [call for call in calls if call._billed_in or call.bill_key()]
+    if not calls:
+        return
+
+    keys = {}
+    for call in calls:
+        keys[call.pk] = call._billed_in = call.bill_key()
+    bills = {MonthlyBill.make_key(*key): key for key in keys.values() if key}
+    old = list(
+        MonthlyBillLine.objects.filter(call_id__in=keys).values_list(
+            "call_id", "bill_id", "bill__period", "cost", "duration"
+        )
+    )
+    check_not_archived(
+        {line[2] for line in old} | {period for _, period in bills.values()}
+    )
+
+    lines = [
+        make_line(call, MonthlyBill.make_key(*keys[call.pk]))
+        for call in calls
+        if keys[call.pk]
+    ]
+    deltas = {}
+
+    def move(bill_id, sign, cost, duration):
+        count, total_cost, total_duration = deltas.get(
+            bill_id, (0, 0.0, timedelta())
+        )
+        deltas[bill_id] = (
+            count + sign,
+            total_cost + sign * cost,
+            total_duration + sign * duration,
+        )
+
+    for _, bill_id, _, cost, duration in old:
+        move(bill_id, -1, cost, duration)
+    for line in lines:
+        move(line.bill_id, 1, line.cost, line.duration)
+
+    with transaction.atomic(savepoint=False):
+        apply_changes([line[0] for line in old], bills, lines, deltas)
+
+
+def pending_calls():
+    """Calls rated by ``ingest_record`` and not on their bills yet."""
+    return Call.objects.filter(bill_pending=True)
+
+
+def record_pending(batch_size: int = 1000) -> int:
+    """
+    Put the calls rated by ``ingest_record`` on their monthly bills and give
+    their earlier records their period, ``batch_size`` calls per
+    transaction. Returns the number of calls recorded.
+    """
+    recorded = 0
+    while call_ids := list(
+        pending_calls()
+        .order_by("pk")
+        .values_list("pk", flat=True)[:batch_size]
+    ):
+        with transaction.atomic():
+            calls = pending_calls().filter(pk__in=call_ids).order_by("pk")
+            if connection.features.has_select_for_update_skip_locked:
+                # Calls being recorded by another process are left to it.
+                calls = calls.select_for_update(skip_locked=True)
+            calls = list(calls)
+            if not calls:
+                break
+
+            CallRecord.settle(calls)
+            record_calls(calls)
+            Call.objects.filter(pk__in=[call.pk for call in calls]).update(
+                bill_pending=False
+            )
+        recorded += len(calls)
+
+    return recorded
+
+
+def apply_changes(replaced: list, bills: dict, lines: list, deltas: dict):
+    """
+    Drop the lines of the ``replaced`` calls, make sure the ``bills`` exist,
+    insert the new ``lines`` and move the totals of the bills by ``deltas``.
+    """
+    if replaced:
+        MonthlyBillLine.objects.filter(call_id__in=replaced).delete()
+    MonthlyBill.objects.bulk_create(
+        [
+            MonthlyBill(id=bill_id, phone_number=phone_number, period=period)
+            for bill_id, (phone_number, period) in bills.items()
+        ],
+        ignore_conflicts=True,
+    )
+    MonthlyBillLine.objects.bulk_create(lines)
+
+    now = timezone.now()
+    MonthlyBill.objects.bulk_update(
+        [
+            MonthlyBill(
+                pk=bill_id,
+                call_count=F("call_count") + count,
+                total_cost=F("total_cost") + cost,
+                total_duration=F("total_duration") + duration,
+                updated_at=now,
+            )
+            for bill_id, (count, cost, duration) in sorted(deltas.items())
+        ],
+        ["call_count", "total_cost", "total_duration", "updated_at"],
+    )
+
+
+def completed_calls(period: None | date = None):
+    calls = Call.objects.filter(start__isnull=False, end__isnull=False)
+    if period:
+        month_start, next_month_start = month_range(period)
+        calls = calls.filter(end__gte=month_start, end__lt=next_month_start)
+    return calls
+
+
+def rebuild(period: None | date = None, batch_size: int = 500) -> int:
+    """Recompute monthly bills from scratch, for one period or all of them."""
+    record_pending()
+    bills = MonthlyBill.objects.all()
+    calls = completed_calls(period).order_by("source", "end", "id")
+    lines = MonthlyBillLine.objects.all()
+    if period:
+        bills = bills.filter(period=period)
+        # Calls of the month may have been on a bill of another one.
+        lines = lines.filter(call_id__in=calls.values("pk"))
+
+    created = 0
+    with transaction.atomic():
+        lines.delete()
+        bills.delete()
+
+        batch, batch_lines = [], []
+        for (phone_number, month), group in groupby(
+            calls.iterator(chunk_size=2000), key=Call.bill_key
+        ):
+            bill = MonthlyBill(phone_number=phone_number, period=month)
+            bill.id = MonthlyBill.make_key(phone_number, month)
+            for call in group:
+                line = make_line(call, bill.id)
+                bill.call_count += 1
+                bill.total_cost += line.cost
+                bill.total_duration += line.duration
+                batch_lines.append(line)
+            batch.append(bill)
+
+            # Foreign keys are checked on commit, lines can go first.
+            if len(batch_lines) >= 2000:
+                MonthlyBillLine.objects.bulk_create(batch_lines)
+                batch_lines = []
+
+            if len(batch) >= batch_size:
+                created += len(MonthlyBill.objects.bulk_create(batch))
+                batch = []
+
+        created += len(MonthlyBill.objects.bulk_create(batch))
+        MonthlyBillLine.objects.bulk_create(batch_lines)
+
+    return created
+
+
+def live_bill(phone_number: str, period: date) -> tuple[list, float]:
+    """Records and total cost as computed by the billing endpoint."""
+    rows = list(
+        BillingResponseSerializer.get_filtered_calls(
+            phone_number, period
+        ).values_list(*RECORD_COLUMNS)
+    )
+    records = [call_record(*row) for row in rows]
+    return records, sum(row[3] or 0 for row in rows)
+
+
+def check(period: None | date = None):
+    """Yield ``(key, problem)`` for every bill out of line with live data."""
+    record_pending()
+    bills = MonthlyBill.objects.all()
+    if period:
+        bills = bills.filter(period=period)
+
+    expected = {
+        MonthlyBill.make_key(phone_number, timezone.localtime(month).date())
+        for phone_number, month in completed_calls(period)
+        .annotate(month=TruncMonth("end"))
+        .values_list("source", "month")
+        .distinct()
+    }
+
+    for bill in bills.iterator(chunk_size=100):
+        expected.discard(bill.pk)
+        records, total_cost = live_bill(bill.phone_number, bill.period)
+
+        lines = bill_lines(bill.pk).values_list("record", flat=True)
+        if records != list(lines):
+            yield bill.pk, "records differ"
+        elif bill.call_count != len(records):
+            yield bill.pk, "call count differs"
+        elif not math.isclose(bill.total_cost, total_cost, abs_tol=1e-6):
+            yield bill.pk, "total cost differs"
+
+    for key in sorted(expected):
+        yield key, "missing"
@@ -0,0 +1,20 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def billing_cache():
+    """
+    Cache holding rendered bills, keyed by ``MonthlyBill.make_key`` and the
+    version of the bill, so changed bills are never read from it.
+    """
+    return caches[settings.BILLING_CACHE]
+
+
+def make_etag(data) -> str:
+    """Strong ETag of a response payload."""
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True)
+    return f'"{hashlib.sha256(payload.encode()).hexdigest()}"'
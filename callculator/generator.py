@@ -0,0 +1,214 @@
+"""Deterministic synthetic call data for load and capacity testing."""
+
+import math
+import random
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from io import StringIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import connection
+
+from callculator.ingest import TIMESTAMP_FORMAT
+from callculator.tools import EPOCH, month_range
+
+NAIVE_EPOCH = datetime(1970, 1, 1)
+# Characters escaped by the COPY text format
+COPY_ESCAPES = str.maketrans(
+    {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+)
+
+# Share of the calls starting at each hour of the day.
+HOURLY_WEIGHTS = [
+    1, 1, 1, 1, 1, 2, 3, 6, 9, 10, 10, 10,
+    9, 9, 10, 10, 10, 10, 9, 8, 7, 5, 3, 2,
+]  # fmt: skip
+DURATIONS = ["exponential", "lognormal", "uniform"]
+LONG_CALL = (3600, 12 * 3600)
+
+
+@dataclass
+class Profile:
+    subscribers: int = 1000
+    calls_per_subscriber: int = 10
+    period: date = date(2024, 1, 1)
+    duration: str = "exponential"
+    mean_duration: float = 180
+    long_share: float = 0.01
+    boundary_share: float = 0.05
+    orphan_share: float = 0.01
+    out_of_order_share: float = 0.05
+    seed: int = 0
+
+
+def phone_number(subscriber: int) -> str:
+    return f"11{subscriber:09d}"
+
+
+class Generator:
+    """
+    Generate ``(call_id, source, destination, start, end)`` tuples, with
+    epoch seconds (UTC) as times and ``None`` as the end of orphaned calls.
+
+    The same profile and seed always give the same calls. Start times
+    follow ``HOURLY_WEIGHTS``, ``boundary_share`` of the calls are placed
+    across ``RATE_START`` or ``RATE_END`` and ``long_share`` last one to
+    twelve hours.
+    """
+
+    def __init__(self, profile: Profile, first_id: int = 1):
+        self.profile = profile
+        self.first_id = first_id
+
+        month_start, next_month_start = month_range(profile.period)
+        self.month_start = int(month_start.timestamp())
+        self.days = (next_month_start - month_start).days
+        self.cum_weights = list(accumulate(HOURLY_WEIGHTS))
+        self.boundaries = [
+            int(settings.RATE_START) * 3600,
+            int(settings.RATE_END) * 3600,
+        ]
+
+    @property
+    def total(self) -> int:
+        return self.profile.subscribers * self.profile.calls_per_subscriber
+
+    def duration(self) -> int:
+        profile, rng = self.profile, self.rng
+        if rng.random() < profile.long_share:
+            shortest, longest = LONG_CALL
+            return shortest + int(rng.random() * (longest - shortest))
+
+        match profile.duration:
+            case "exponential":
+                seconds = rng.expovariate(1 / profile.mean_duration)
+            case "lognormal":
+                sigma = 1.0
+                mu = math.log(profile.mean_duration) - sigma**2 / 2
+                seconds = rng.lognormvariate(mu, sigma)
+            case "uniform":
+                seconds = rng.uniform(0, 2 * profile.mean_duration)
+            case _:
+                raise ValueError(f"Unknown duration {profile.duration!r}")
+        return max(1, round(seconds))
+
+    def call(self, position: int) -> tuple:
+        # Plain random() draws are several times cheaper than randrange().
+        profile, random = self.profile, self.rng.random
+        source = position // profile.calls_per_subscriber
+        destination = int(random() * profile.subscribers)
+
+        duration = self.duration()
+        day = self.month_start + int(random() * self.days) * 86_400
+        if random() < profile.boundary_share:
+            boundary = self.boundaries[random() < 0.5]
+            start = day + boundary - 1 - int(random() * duration)
+        else:
+            weights = self.cum_weights
+            hour = bisect_right(weights, random() * weights[-1])
+            start = day + hour * 3600 + int(random() * 3600)
+
+        end = None if random() < profile.orphan_share else start + duration
+        return (
+            self.first_id + position,
+            phone_number(source),
+            phone_number(destination),
+            start,
+            end,
+        )
+
+    def __iter__(self):
+        self.rng = random.Random(self.profile.seed)
+        return map(self.call, range(self.total))
+
+    def records(self):
+        """
+        Yield the START and END call records of every call. The END comes
+        first for ``out_of_order_share`` of them.
+        """
+        order = random.Random(self.profile.seed + 1)
+        for call_id, source, destination, start, end in self:
+            records = [
+                {
+                    "type": "START",
+                    "timestamp": timestamp(start),
+                    "call_id": call_id,
+                    "source": source,
+                    "destination": destination,
+                }
+            ]
+            if end is not None:
+                records.append(
+                    {
+                        "type": "END",
+                        "timestamp": timestamp(end),
+                        "call_id": call_id,
+                    }
+                )
+                if order.random() < self.profile.out_of_order_share:
+                    records.reverse()
+            yield from records
+
+
+def timestamp(seconds: int) -> str:
+    return to_datetime(seconds).strftime(TIMESTAMP_FORMAT)
+
+
+def to_datetime(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def copy_text(value) -> str:
+    """``value`` as a field of PostgreSQL's ``COPY`` text format."""
+    if value is None:
+        return r"\N"
+    if isinstance(value, timedelta):
+        return (
+            f"{value.days} days {value.seconds} seconds "
+            f"{value.microseconds} microseconds"
+        )
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_rows(model, columns: list[str], rows):
+    """
+    Insert ``rows`` of database-ready values into ``model``'s table without
+    going through the ORM: with ``COPY`` on PostgreSQL, with one
+    ``executemany`` elsewhere.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    names = ", ".join(quote(column) for column in columns)
+
+    if not rows:
+        return
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql" and hasattr(
+            cursor.cursor, "copy"
+        ):
+            with cursor.cursor.copy(
+                f"COPY {table} ({names}) FROM STDIN"
+            ) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return
+
+        if connection.vendor == "postgresql":
+            # psycopg2 copies from a file of rows in the text format.
+            data = StringIO(
+                "".join("\t".join(map(copy_text, row)) + "\n" for row in rows)
+            )
+            cursor.cursor.copy_expert(
+                f"COPY {table} ({names}) FROM STDIN", data
+            )
+            return
+
+        placeholders = ", ".join(["%s"] * len(columns))
+        cursor.executemany(
+            f"INSERT INTO {table} ({names}) VALUES ({placeholders})", rows
+        )
@@ -0,0 +1,150 @@
+"""
+Readiness of the service, checked off the request path.
+
+``readiness.get()`` hands out the result of the last ``check()``, which a
+daemon thread refreshes every ``HEALTH_CHECK_INTERVAL`` seconds. Probes only
+run the check themselves when no fresh result is there (before the first
+refresh, or with ``HEALTH_CHECK_BACKGROUND`` off), one at a time, so a burst
+of probes costs at most one round of queries per interval.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils import timezone
+
+from callculator import queue
+
+_migration_nodes = None
+_migrated = False
+
+
+def ping(timeout: float) -> float:
+    """Run ``SELECT 1`` and return its latency in seconds."""
+    started = time.perf_counter()
+    if connection.vendor == "postgresql":
+        # The timeout only lasts for this transaction.
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"SET LOCAL statement_timeout = {int(timeout * 1000)}"
+            )
+            cursor.execute("SELECT 1")
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    return time.perf_counter() - started
+
+
+def unapplied_migrations() -> list[str]:
+    """
+    Migrations on disk missing from the database. The graph is read from
+    disk once per process, and the check stops once everything is applied.
+    """
+    global _migration_nodes, _migrated
+
+    if _migrated:
+        return []
+    if _migration_nodes is None:
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        _migration_nodes = set(loader.graph.nodes)
+
+    applied = MigrationRecorder(connection).applied_migrations()
+    unapplied = sorted(
+        f"{app}.{name}" for app, name in _migration_nodes - applied.keys()
+    )
+    _migrated = not unapplied
+    return unapplied
+
+
+def check() -> dict:
+    result = {"status": "OK", "checked_at": timezone.now()}
+    try:
+        latency = ping(settings.HEALTH_CHECK_TIMEOUT)
+        unapplied = unapplied_migrations()
+        lag = queue.lag()
+    except DatabaseError as exc:
+        # Start over with a new connection next time, unless an enclosing
+        # transaction still needs this one.
+        if not connection.in_atomic_block:
+            connection.close()
+        result["status"] = "FAIL"
+        result["database"] = {"status": "FAIL", "error": type(exc).__name__}
+        return result
+
+    result["database"] = {
+        "status": "OK",
+        "latency_ms": round(latency * 1000, 3),
+    }
+    result["migrations"] = {
+        "status": "FAIL" if unapplied else "OK",
+        "unapplied": unapplied,
+    }
+    max_lag = settings.HEALTH_CHECK_MAX_QUEUE_LAG
+    result["queue"] = {
+        "status": "FAIL" if max_lag and lag > max_lag else "OK",
+        "lag": round(lag, 3),
+    }
+    if "FAIL" in (result["migrations"]["status"], result["queue"]["status"]):
+        result["status"] = "FAIL"
+    return result
+
+
+class Readiness:
+    def __init__(self):
+        self.result = None
+        self.checked = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def is_fresh(self) -> bool:
+        if self.checked is None:
+            return False
+        interval = settings.HEALTH_CHECK_INTERVAL
+        if settings.HEALTH_CHECK_BACKGROUND:
+            # Leave the refresher some slack before doing its job.
+            interval *= 2
+        return time.monotonic() - self.checked < interval
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked
+
+    def refresh(self):
+        result = check()
+        self.result, self.checked = result, time.monotonic()
+
+    def get(self) -> dict:
+        """Result of the last check, running it first when it is stale."""
+        if not self.is_fresh():
+            with self.lock:
+                # Another probe may have refreshed it while we waited.
+                if not self.is_fresh():
+                    self.refresh()
+        self.start()
+        return self.result
+
+    def start(self):
+        """Start the refresher, once per process (and again after a fork)."""
+        if not settings.HEALTH_CHECK_BACKGROUND:
+            return
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="readiness", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while settings.HEALTH_CHECK_BACKGROUND:
+            time.sleep(settings.HEALTH_CHECK_INTERVAL)
+            connection.close_if_unusable_or_obsolete()
+            with self.lock:
+                self.refresh()
+
+
+readiness = Readiness()
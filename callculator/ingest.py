@@ -0,0 +1,184 @@
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from callculator.archive import check_not_archived
+from callculator.models import Call, CallRecord
+from callculator.partitions import is_partitioned, lock_calls
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+CALL_FIELDS = [
+    "source",
+    "destination",
+    "start",
+    "end",
+    "duration",
+    "cost",
+    "day_minutes",
+    "night_minutes",
+    "period",
+    "tariff_plan",
+]
+RATING_FIELDS = [
+    "duration",
+    "cost",
+    "day_minutes",
+    "night_minutes",
+    "period",
+]
+RECORD_FIELDS = {
+    "START": ["source", "destination", "start"],
+    "END": ["end"],
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    return timezone.make_aware(datetime.strptime(value, TIMESTAMP_FORMAT))
+
+
+def apply_record(call: Call, data: dict):
+    match data["type"]:
+        case "START":
+            call.source = data["source"]
+            call.destination = data["destination"]
+            call.start = parse_timestamp(data["timestamp"])
+        case "END":
+            call.end = parse_timestamp(data["timestamp"])
+        case _:
+            raise ValueError(f"Unknown record type {data['type']!r}")
+
+
+def supports_upsert() -> bool:
+    """
+    Whether records can be written with ``upsert_call``. Only on SQLite: on
+    PostgreSQL the call table is partitioned by period and has no unique
+    index on the call id for ``ON CONFLICT`` to use.
+    """
+    features = connection.features
+    return (
+        features.supports_update_conflicts_with_target
+        and features.can_return_columns_from_insert
+        # ON CONFLICT needs a unique index on the call id.
+        and not is_partitioned(Call._meta.db_table)
+    )
+
+
+def upsert_call(data: dict) -> Call:
+    """
+    Write a record onto its call with one ``INSERT ... ON CONFLICT``.
+
+    A new call is inserted with the record's fields, an existing one only
+    gets the fields the record type sets. Returns the call as stored, still
+    with the period it was rated in before the record.
+    """
+    call = Call(pk=data["call_id"])
+    apply_record(call, data)
+
+    meta = Call._meta
+    quote = connection.ops.quote_name
+    fields = [meta.pk, *(meta.get_field(name) for name in CALL_FIELDS)]
+    updated = [meta.get_field(name) for name in RECORD_FIELDS[data["type"]]]
+
+    sql = (
+        "INSERT INTO {table} ({columns}) VALUES ({values}) "
+        "ON CONFLICT ({pk}) DO UPDATE SET {updates} RETURNING {columns}"
+    ).format(
+        table=quote(meta.db_table),
+        columns=", ".join(quote(field.column) for field in fields),
+        values=", ".join(["%s"] * len(fields)),
+        pk=quote(meta.pk.column),
+        updates=", ".join(
+            f"{quote(field.column)} = EXCLUDED.{quote(field.column)}"
+            for field in updated
+        ),
+    )
+    params = [
+        field.get_db_prep_save(field.pre_save(call, True), connection)
+        for field in fields
+    ]
+    return next(iter(Call.objects.raw(sql, params)))
+
+
+def ingest_record(data: dict) -> CallRecord:
+    """
+    Store one validated record with as few statements as possible.
+
+    The call is upserted in a single statement and only rated, with an
+    update of its rating fields, once both of its ends are known. That
+    update also marks the call for ``bills.record_pending``, which puts it
+    on its monthly bill and moves its earlier records to its period in
+    batches. Nothing is written unless everything is.
+    """
+    with transaction.atomic():
+        call = upsert_call(data)
+        if call.start and call.end:
+            rated_in = call.period
+            call.rate()
+            check_not_archived(
+                period for period in (rated_in, call.period) if period
+            )
+            Call.objects.filter(pk=call.pk).update(
+                bill_pending=True,
+                **{name: getattr(call, name) for name in RATING_FIELDS},
+            )
+
+        return CallRecord.objects.create(
+            record_type=data["type"], call=call, period=call.period
+        )
+
+
+def apply_records(records: list[dict]) -> list[CallRecord]:
+    """
+    Apply validated call records in one transaction.
+
+    Referenced calls are fetched and locked with a single query, records
+    are applied in order, every touched call is rated once and everything
+    is written back with bulk statements. Returns the created records, in
+    input order.
+    """
+    from callculator.bills import record_calls
+
+    with transaction.atomic():
+        call_ids = {data["call_id"] for data in records}
+        lock_calls(call_ids)
+        # Rows are written back whole, concurrent workers must not interleave.
+        # In id order, so that two batches can't deadlock.
+        calls = {
+            call.pk: call
+            for call in Call.objects.select_for_update()
+            .filter(pk__in=call_ids)
+            .order_by("pk")
+        }
+        existing = set(calls)
+
+        call_records = []
+        for data in records:
+            call = calls.get(data["call_id"])
+            if call is None:
+                call = calls[data["call_id"]] = Call(pk=data["call_id"])
+
+            apply_record(call, data)
+            call_records.append(
+                CallRecord(record_type=data["type"], call=call)
+            )
+
+        for call in calls.values():
+            call.rate()
+        for call_record in call_records:
+            call_record.period = call_record.call.period
+
+        Call.objects.bulk_create(
+            [call for pk, call in calls.items() if pk not in existing]
+        )
+        Call.objects.bulk_update(
+            [call for pk, call in calls.items() if pk in existing],
+            CALL_FIELDS,
+        )
+        CallRecord.settle(
+            call
+            for pk, call in calls.items()
+            if pk in existing and call.changed_period()
+        )
+        record_calls(calls.values())
+        return CallRecord.objects.bulk_create(call_records)
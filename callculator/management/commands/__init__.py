@@ -0,0 +1,16 @@
+from argparse import ArgumentTypeError
+from datetime import date
+
+from django.utils.dateparse import parse_date
+
+
+def period(value: str) -> date:
+    """Argument type for a billing period in the format 'YYYY-MM'."""
+    try:
+        parsed = parse_date(value + "-01")
+    except ValueError:
+        parsed = None
+
+    if not parsed:
+        raise ArgumentTypeError("Invalid period format. Use 'YYYY-MM'.")
+    return parsed
@@ -0,0 +1,67 @@
+from itertools import groupby
+from operator import itemgetter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from callculator.archive import (
+    BLOCK_ROWS,
+    ROW_COLUMNS,
+    archive_path,
+    write_archive,
+)
+from callculator.bills import completed_calls
+from callculator.management.commands import period
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the calls of a closed month to a compressed columnar "
+        "archive, which bills of that month are then served from."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("period", type=period, help="Month (YYYY-MM)")
+        parser.add_argument(
+            "--block-rows",
+            type=int,
+            default=BLOCK_ROWS,
+            help=f"Calls per compressed block (default: {BLOCK_ROWS})",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Replace an existing archive of the month",
+        )
+
+    def handle(self, *args, **options):
+        month = options["period"]
+        if month >= timezone.localdate().replace(day=1):
+            raise CommandError(f"{month:%Y-%m} is not a closed month")
+
+        path = archive_path(month)
+        if path.exists() and not options["force"]:
+            raise CommandError(f"{path} exists, use --force to replace it")
+
+        rows = (
+            completed_calls(month)
+            .order_by("source", "end", "id")
+            .values_list(*ROW_COLUMNS)
+            .iterator(chunk_size=2000)
+        )
+        calls, subscribers = write_archive(
+            path,
+            month,
+            (
+                (source, list(group))
+                for source, group in groupby(rows, key=itemgetter(0))
+            ),
+            options["block_rows"],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {calls} calls of {subscribers} subscribers to "
+                f"{path} ({path.stat().st_size:,} bytes)"
+            )
+        )
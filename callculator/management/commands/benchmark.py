@@ -0,0 +1,114 @@
+import json
+import platform
+import sys
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from callculator import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Run performance benchmarks and print calls per second."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "suites",
+            nargs="*",
+            help=f"Suites to run: {', '.join(benchmarks.SUITES)} (default: all)",
+        )
+        parser.add_argument(
+            "--size",
+            type=int,
+            help="Number of calls per measurement (default: per suite)",
+        )
+        parser.add_argument(
+            "--output",
+            help="Save the results to this JSON file",
+        )
+        parser.add_argument(
+            "--compare",
+            help="JSON file of earlier results to compare against",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help=(
+                "Fail when a case is slower than in --compare by more than "
+                "this fraction (default: 0.2)"
+            ),
+        )
+
+    def handle(self, *args, **options):
+        suites = options["suites"] or list(benchmarks.SUITES)
+        unknown = set(suites) - set(benchmarks.SUITES)
+        if unknown:
+            raise CommandError(f"Unknown suites: {', '.join(sorted(unknown))}")
+
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as stream:
+                    baseline = json.load(stream)["suites"]
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read {options['compare']}: {exc}")
+
+        results = {}
+        for name in suites:
+            suite = benchmarks.load(name)
+            if getattr(suite, "USES_DATABASE", False):
+                with benchmarks.test_database():
+                    results[name] = suite.run(size=options["size"])
+            else:
+                results[name] = suite.run(size=options["size"])
+
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if not results[name]:
+                self.stdout.write(f"  no cases on {connection.vendor}")
+            for case, result in results[name].items():
+                self.stdout.write(
+                    f"  {case:<24} {result['calls_per_second']:>14,.1f} calls/s"
+                    f"  ({result['calls']} calls in {result['seconds']}s)"
+                )
+
+        if options["output"]:
+            with open(options["output"], "w") as stream:
+                json.dump(
+                    {
+                        "created_at": timezone.now().isoformat(),
+                        "environment": {
+                            "python": platform.python_version(),
+                            "django": django.get_version(),
+                            "database": connection.vendor,
+                            "platform": sys.platform,
+                        },
+                        "size": options["size"],
+                        "suites": results,
+                    },
+                    stream,
+                    indent=2,
+                )
+
+        if baseline is not None:
+            self.compare(baseline, results, options["threshold"])
+
+    def compare(self, baseline, results, threshold):
+        slower = list(benchmarks.regressions(baseline, results, threshold))
+        for suite, case, old, new in slower:
+            self.stderr.write(
+                f"{suite}.{case}: {new:,.1f} calls/s, was {old:,.1f} "
+                f"({new / old - 1:+.0%})"
+            )
+
+        if slower:
+            raise CommandError(
+                f"{len(slower)} cases regressed by more than {threshold:.0%}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"No case regressed by more than {threshold:.0%}"
+            )
+        )
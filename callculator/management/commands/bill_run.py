@@ -0,0 +1,225 @@
+import gzip
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import groupby
+from operator import itemgetter
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from callculator.bills import completed_calls
+from callculator.management.commands import period
+from callculator.management.commands.rerate import setup_worker
+from callculator.records import RECORD_COLUMNS, call_record, dumps
+
+INVOICE_COLUMNS = ("source", *RECORD_COLUMNS)
+
+
+def source_ranges(calls, count: int) -> list[list]:
+    """
+    Split the sources of ``calls`` into up to ``count`` ``[first, last)``
+    ranges with as many subscribers each, ``None`` ending the last one.
+    """
+    sources = list(
+        calls.order_by("source").values_list("source", flat=True).distinct()
+    )
+    if not sources:
+        return []
+
+    bounds = sources[:: math.ceil(len(sources) / count)]
+    return [list(pair) for pair in zip(bounds, [*bounds[1:], None])]
+
+
+def bill_range(month, first, last, path, chunk_size) -> tuple[int, int]:
+    """
+    Write the invoices of the sources in ``[first, last)`` to ``path``, one
+    JSON line each, from a single scan of their calls. Returns the numbers
+    of subscribers and calls.
+    """
+    calls = completed_calls(month).filter(source__gte=first)
+    if last is not None:
+        calls = calls.filter(source__lt=last)
+    rows = (
+        calls.order_by("source", "end", "id")
+        .values_list(*INVOICE_COLUMNS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    path = Path(path)
+    partial = path.with_name(path.name + ".partial")
+    opener = gzip.open if path.suffix == ".gz" else open
+
+    subscribers = count = 0
+    with opener(partial, "wb") as file:
+        for source, group in groupby(rows, key=itemgetter(0)):
+            records = [call_record(*row[1:]) for row in group]
+            invoice = {
+                "phone_number": source,
+                "dateref": month,
+                "records": records,
+            }
+            file.write(dumps(invoice) + b"\n")
+            subscribers += 1
+            count += len(records)
+
+    # Only complete shards carry their final name, and are skipped on resume.
+    os.replace(partial, path)
+    return subscribers, count
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the monthly invoice of every subscriber, as returned by the "
+        "billing endpoint, to sharded NDJSON files. Source ranges are billed "
+        "by a pool of worker processes, and an interrupted run resumes from "
+        "the shards it has not finished."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--period",
+            type=period,
+            required=True,
+            help="Month to bill (YYYY-MM)",
+        )
+        parser.add_argument(
+            "--output",
+            default="bills",
+            help="Directory of the shards and their manifest (default: bills)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes, 1 bills in this process (default: 1)",
+        )
+        parser.add_argument(
+            "--shards",
+            type=int,
+            help=(
+                "Source ranges to split the month in (default: 4 per worker, "
+                "or those of the resumed run)"
+            ),
+        )
+        parser.add_argument(
+            "--compress",
+            action="store_true",
+            help="Write gzip compressed shards",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Calls read per query",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start over instead of resuming a previous run",
+        )
+
+    def handle(self, *args, **options):
+        month = options["period"]
+        workers = options["workers"]
+        shard_count = options["shards"] or workers * 4
+        if min(workers, shard_count, options["chunk_size"]) < 1:
+            raise CommandError(
+                "--workers, --shards and --chunk-size must be positive"
+            )
+        if month >= timezone.localdate().replace(day=1):
+            raise CommandError(f"{month:%Y-%m} is not a closed month")
+
+        output = Path(options["output"])
+        manifest = self.manifest(
+            output, month, shard_count, options["compress"], options["restart"]
+        )
+        # A resumed run must write the shards it was planned with.
+        planned = manifest["compress"], manifest["shard_count"]
+        if planned != (options["compress"], options["shards"] or planned[1]):
+            raise CommandError(
+                f"The {month:%Y-%m} run in {output} was started with "
+                f"--shards={manifest['shard_count']}"
+                f"{' --compress' if manifest['compress'] else ''}, resume it "
+                "with the same options or start over with --restart"
+            )
+
+        suffix = ".ndjson.gz" if manifest["compress"] else ".ndjson"
+        arguments = []
+        for number, (first, last) in enumerate(manifest["shards"]):
+            path = output / f"bills-{month:%Y-%m}-{number:04d}{suffix}"
+            if not path.exists():
+                arguments.append(
+                    (month, first, last, str(path), options["chunk_size"])
+                )
+        done = len(manifest["shards"]) - len(arguments)
+        if done:
+            self.stdout.write(f"Resuming, {done} shards already written")
+
+        started = time.perf_counter()
+        subscribers = calls = 0
+        for result in self.run(arguments, workers):
+            done += 1
+            subscribers += result[0]
+            calls += result[1]
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Billed {done}/{len(manifest['shards'])} shards, "
+                f"{subscribers} subscribers, "
+                f"{subscribers / elapsed:,.0f} subscribers/s"
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {subscribers} invoices ({calls} calls) to {output} in "
+                f"{elapsed:.1f}s ({subscribers / (elapsed or 1):,.0f} "
+                "subscribers/s)"
+            )
+        )
+
+    @staticmethod
+    def manifest(output: Path, month, shard_count, compress, restart) -> dict:
+        """
+        Source ranges of the run, read back from its manifest when resuming
+        so that shards keep their bounds even if calls came in since.
+        """
+        path = output / f"bills-{month:%Y-%m}.json"
+        if restart:
+            for shard in output.glob(f"bills-{month:%Y-%m}-*"):
+                shard.unlink()
+            path.unlink(missing_ok=True)
+
+        if path.exists():
+            return json.loads(path.read_text())
+
+        manifest = {
+            "period": month.isoformat(),
+            "compress": compress,
+            "shard_count": shard_count,
+            "shards": source_ranges(completed_calls(month), shard_count),
+        }
+        output.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(manifest))
+        return manifest
+
+    @staticmethod
+    def run(arguments, workers):
+        """Yield ``(subscribers, calls)`` of every shard once written."""
+        if workers == 1:
+            for argument in arguments:
+                yield bill_range(*argument)
+            return
+
+        # Forked workers must not share the parent's connections.
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=setup_worker) as pool:
+            futures = [
+                pool.submit(bill_range, *argument) for argument in arguments
+            ]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from callculator.bills import check
+from callculator.management.commands import period
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the materialized monthly bills with the live billing "
+        "computation and report every bill out of line."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--period",
+            type=period,
+            help="Only check bills of this month (YYYY-MM)",
+        )
+
+    def handle(self, *args, **options):
+        problems = 0
+        for key, problem in check(options["period"]):
+            problems += 1
+            self.stdout.write(f"{key}: {problem}")
+
+        if problems:
+            raise CommandError(
+                f"{problems} bills out of line, run rebuild_monthly_bills"
+            )
+        self.stdout.write(self.style.SUCCESS("Monthly bills are consistent"))
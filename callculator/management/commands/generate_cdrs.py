@@ -0,0 +1,299 @@
+import json
+import sys
+import time
+from argparse import ArgumentTypeError
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from callculator import tariffs
+from callculator.bills import rebuild
+from callculator.generator import (
+    DURATIONS,
+    NAIVE_EPOCH,
+    Generator,
+    Profile,
+    copy_rows,
+    to_datetime,
+)
+from callculator.management.commands import period
+from callculator.management.commands.import_cdrs import chunked
+from callculator.models import Call, CallRecord
+from callculator.tools import (
+    MINUTES_PER_DAY,
+    batch_call_cost_calculator,
+    month_range,
+    np,
+)
+
+CALL_COLUMNS = [
+    "id",
+    "source",
+    "destination",
+    "start",
+    "end",
+    "duration",
+    "cost",
+    "day_minutes",
+    "night_minutes",
+    "period",
+]
+RECORD_COLUMNS = ["record_type", "call_id", "timestamp", "period"]
+
+
+def share(value: str) -> float:
+    """Argument type for a fraction between 0 and 1."""
+    try:
+        parsed = float(value)
+    except ValueError:
+        parsed = -1
+    if not 0 <= parsed <= 1:
+        raise ArgumentTypeError("Must be a number between 0 and 1.")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic month of calls, straight into "
+        "the database with bulk inserts or as NDJSON call records."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--subscribers", type=int, default=1000)
+        parser.add_argument("--calls-per-subscriber", type=int, default=10)
+        parser.add_argument(
+            "--period",
+            type=period,
+            default=Profile.period,
+            help="Month the calls start in (YYYY-MM, default: 2024-01)",
+        )
+        parser.add_argument(
+            "--duration",
+            choices=DURATIONS,
+            default=Profile.duration,
+            help="Distribution of the call durations",
+        )
+        parser.add_argument(
+            "--mean-duration",
+            type=float,
+            default=Profile.mean_duration,
+            help="Mean call duration in seconds",
+        )
+        parser.add_argument(
+            "--long-share",
+            type=share,
+            default=Profile.long_share,
+            help="Share of calls lasting 1 to 12 hours",
+        )
+        parser.add_argument(
+            "--boundary-share",
+            type=share,
+            default=Profile.boundary_share,
+            help="Share of calls crossing RATE_START or RATE_END",
+        )
+        parser.add_argument(
+            "--orphan-share",
+            type=share,
+            default=Profile.orphan_share,
+            help="Share of calls with a START and no END",
+        )
+        parser.add_argument(
+            "--out-of-order-share",
+            type=share,
+            default=Profile.out_of_order_share,
+            help="Share of calls whose END comes first (NDJSON only)",
+        )
+        parser.add_argument("--seed", type=int, default=Profile.seed)
+        parser.add_argument(
+            "--output",
+            help="Write NDJSON call records to this file ('-' for stdout) "
+            "instead of the database",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10_000,
+            help="Calls inserted per transaction",
+        )
+        parser.add_argument(
+            "--no-records",
+            action="store_true",
+            help="Only insert calls, without their START/END call records",
+        )
+        parser.add_argument(
+            "--no-bills",
+            action="store_true",
+            help="Do not rebuild the monthly bills afterwards",
+        )
+
+    def handle(self, *args, **options):
+        if (
+            min(
+                options["subscribers"],
+                options["calls_per_subscriber"],
+                options["batch_size"],
+                options["mean_duration"],
+            )
+            <= 0
+        ):
+            raise CommandError(
+                "--subscribers, --calls-per-subscriber, --batch-size and "
+                "--mean-duration must be positive"
+            )
+
+        profile = Profile(
+            **{name: options[name] for name in Profile.__dataclass_fields__}
+        )
+        started = time.perf_counter()
+
+        if options["output"]:
+            count = self.write(profile, options["output"])
+            unit = "records"
+        else:
+            count = self.load(profile, options)
+            unit = "rows"
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {count} {unit} in {elapsed:.1f}s "
+                f"({count / elapsed:,.0f} {unit}/s)"
+            )
+        )
+
+    def write(self, profile, path):
+        stream = sys.stdout if path == "-" else open(path, "w")
+        count = 0
+        try:
+            for record in Generator(profile).records():
+                stream.write(json.dumps(record, separators=(",", ":")))
+                stream.write("\n")
+                count += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        return count
+
+    def load(self, profile, options):
+        first_id = (Call.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+        generator = Generator(profile, first_id)
+
+        plan_id = tariffs.default_plan_id()
+        plan = tariffs.get_plan(plan_id) if plan_id else None
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        started = time.perf_counter()
+        calls = rows = 0
+        for chunk in chunked(generator, options["batch_size"]):
+            call_rows = self.make_rows(chunk, plan, profile.period)
+            record_rows = []
+            if not options["no_records"]:
+                record_rows = [
+                    (record_type, row[0], created_at, row[-1])
+                    for row in call_rows
+                    for record_type, value in (
+                        (CallRecord.Type.START, row[3]),
+                        (CallRecord.Type.END, row[4]),
+                    )
+                    if value is not None
+                ]
+
+            with transaction.atomic():
+                copy_rows(Call, CALL_COLUMNS, call_rows)
+                copy_rows(CallRecord, RECORD_COLUMNS, record_rows)
+
+            calls += len(call_rows)
+            rows += len(call_rows) + len(record_rows)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Inserted {calls}/{generator.total} calls ({rows} rows), "
+                f"{rows / elapsed:,.0f} rows/s"
+            )
+
+        if not options["no_bills"]:
+            # Calls may end in the following month.
+            _, next_month_start = month_range(profile.period)
+            for month in (profile.period, next_month_start.date()):
+                self.stdout.write(f"Rebuilt {rebuild(month)} bills of {month}")
+
+        return rows
+
+    @staticmethod
+    def make_rows(chunk, plan, month):
+        """Rate ``chunk`` and return rows of ``CALL_COLUMNS`` values."""
+        completed = [row for row in chunk if row[4] is not None]
+        starts = [row[3] for row in completed]
+        ends = [row[4] for row in completed]
+        if np is not None:
+            starts, ends = np.array(starts), np.array(ends)
+        day_minutes, costs = batch_call_cost_calculator(starts, ends)
+        all_minutes, _ = batch_call_cost_calculator(
+            starts, ends, (0, MINUTES_PER_DAY)
+        )
+        if plan is None:
+            costs, day_minutes = costs.tolist(), day_minutes.tolist()
+        else:
+            minutes = [
+                plan.minutes(to_datetime(start), to_datetime(end))
+                for _, _, _, start, end in completed
+            ]
+            costs = [plan.initial_cost + cost for cost, _ in minutes]
+            day_minutes = [charged for _, charged in minutes]
+        rated = zip(costs, day_minutes, all_minutes.tolist())
+
+        adapt_datetime = connection.ops.adapt_datetimefield_value
+        native_duration = connection.features.has_native_duration_field
+
+        # Calls start in ``month``, so they are billed in it or the next one.
+        _, next_month_start = month_range(month)
+        periods = [month, next_month_start.date()]
+        next_month_start = int(next_month_start.timestamp())
+
+        def db_datetime(seconds):
+            return adapt_datetime(NAIVE_EPOCH + timedelta(seconds=seconds))
+
+        rows = []
+        for call_id, source, destination, start, end in chunk:
+            if end is None:
+                rows.append(
+                    (
+                        call_id,
+                        source,
+                        destination,
+                        db_datetime(start),
+                        None,
+                        None,
+                        None,
+                        None,
+                        None,
+                        None,
+                    )
+                )
+                continue
+
+            cost, day, minutes = next(rated)
+            # As ``day_night_minutes`` splits them.
+            minutes = max(minutes, 0)
+            day = min(max(day, 0), minutes)
+            rows.append(
+                (
+                    call_id,
+                    source,
+                    destination,
+                    db_datetime(start),
+                    db_datetime(end),
+                    (
+                        timedelta(seconds=end - start)
+                        if native_duration
+                        else (end - start) * 1_000_000
+                    ),
+                    cost,
+                    day,
+                    minutes - day,
+                    periods[end >= next_month_start],
+                )
+            )
+        return rows
@@ -0,0 +1,170 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from callculator.archive import ArchivedPeriodError
+from callculator.ingest import apply_records
+from callculator.serializers import CallRecordSerializer
+
+CSV_COLUMNS = ["type", "timestamp", "call_id", "source", "destination"]
+
+
+def read_lines(stream, offset=0):
+    """Yield ``(offset after line, line)`` for every non-empty line."""
+    for line in stream:
+        offset += len(line)
+        if line.strip():
+            yield offset, line
+
+
+def parse_records(lines, file_format, columns=CSV_COLUMNS):
+    for offset, line in lines:
+        try:
+            line = line.decode()
+            if file_format == "csv":
+                values = next(csv.reader([line]))
+                record = {
+                    column: value
+                    for column, value in zip(columns, values)
+                    if value != ""
+                }
+            else:
+                record = json.loads(line)
+        except ValueError as exc:
+            yield offset, None, {"line": [str(exc)]}
+            continue
+
+        yield offset, record, None
+
+
+def validate_records(records):
+    for offset, record, errors in records:
+        if errors is None:
+            serializer = CallRecordSerializer(data=record)
+            if serializer.is_valid():
+                yield offset, serializer.validated_data, None
+                continue
+            errors = serializer.errors
+
+        yield offset, None, errors
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Import START/END call records from a CSV or NDJSON file (or stdin) "
+        "in bounded memory. Progress lines report the byte offset of the "
+        "last committed chunk, pass it to --offset to resume after a crash."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", help="File to import, or '-' to read from stdin"
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "ndjson"],
+            help="Input format (default: guessed from the file extension)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Records committed per transaction",
+        )
+        parser.add_argument(
+            "--offset",
+            type=int,
+            default=0,
+            help="Byte offset to resume from",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "csv" if path.lower().endswith(".csv") else "ndjson"
+        )
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        if path == "-":
+            self.import_stream(sys.stdin.buffer, file_format, options)
+            return
+
+        try:
+            with open(path, "rb") as stream:
+                self.import_stream(stream, file_format, options)
+        except FileNotFoundError as exc:
+            raise CommandError(exc)
+
+    def import_stream(self, stream, file_format, options):
+        offset = options["offset"]
+        columns = CSV_COLUMNS
+
+        if file_format == "csv":
+            header = stream.readline()
+            columns = next(csv.reader([header.decode()]))
+            offset = max(offset, len(header))
+            self.skip(stream, offset - len(header))
+        else:
+            self.skip(stream, offset)
+
+        records = validate_records(
+            parse_records(read_lines(stream, offset), file_format, columns)
+        )
+
+        started = time.perf_counter()
+        stored = failed = 0
+        for chunk in chunked(records, options["chunk_size"]):
+            valid = []
+            for line_offset, data, errors in chunk:
+                if errors is None:
+                    valid.append(data)
+                else:
+                    failed += 1
+                    self.stderr.write(
+                        f"Skipping record ending at byte {line_offset}: "
+                        f"{json.dumps(errors)}"
+                    )
+
+            if valid:
+                try:
+                    apply_records(valid)
+                except ArchivedPeriodError as exc:
+                    raise CommandError(
+                        f"{exc}. Committed up to offset {offset}."
+                    )
+            stored += len(valid)
+            offset = chunk[-1][0]
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Committed {stored} records ({failed} skipped), "
+                f"offset {offset}, {stored / elapsed:,.0f} records/s"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {stored} records ({failed} skipped) up to "
+                f"offset {offset}"
+            )
+        )
+
+    @staticmethod
+    def skip(stream, size):
+        if size <= 0:
+            return
+        if stream.seekable():
+            stream.seek(size, 1)
+            return
+        while size > 0 and (data := stream.read(min(size, 1 << 20))):
+            size -= len(data)
@@ -0,0 +1,111 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from callculator import partitions
+from callculator.management.commands import period
+from callculator.models import Call, CallRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage the monthly partitions of the call tables: create upcoming "
+        "months ahead of time, list them, or archive an expired month."
+    )
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest="action", required=True)
+
+        create = actions.add_parser(
+            "create", help="Create partitions for the coming months"
+        )
+        create.add_argument(
+            "--months",
+            type=int,
+            default=3,
+            help="Months to create after the current one (default: 3)",
+        )
+
+        actions.add_parser("list", help="List the partitions")
+
+        detach = actions.add_parser(
+            "detach",
+            help=(
+                "Detach the partitions of a month, leaving standalone "
+                "tables behind, or drop them"
+            ),
+        )
+        detach.add_argument(
+            "--period", type=period, required=True, help="Month (YYYY-MM)"
+        )
+        detach.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop the calls of the month instead of keeping them",
+        )
+
+    def handle(self, *args, **options):
+        partitioned = partitions.is_partitioned(
+            partitions.PARTITIONED_TABLES[0]
+        )
+        action = options["action"]
+
+        if action == "detach":
+            if partitioned:
+                self.detach(options["period"], options["drop"])
+            elif options["drop"]:
+                self.delete(options["period"])
+            else:
+                raise CommandError(
+                    "Detaching needs a partitioned PostgreSQL database, "
+                    "use --drop to delete the calls of the month."
+                )
+            return
+
+        if not partitioned:
+            self.stdout.write(
+                f"The call tables are not partitioned on {connection.vendor}, "
+                "partitioning needs PostgreSQL."
+            )
+            return
+
+        if action == "create":
+            self.create(options["months"])
+        else:
+            for table in partitions.PARTITIONED_TABLES:
+                for name, month in partitions.partitions(table):
+                    self.stdout.write(f"{name}\t{month or 'default'}")
+
+    def create(self, months: int):
+        month = timezone.localdate().replace(day=1)
+        created = 0
+        for _ in range(months + 1):
+            for table in partitions.PARTITIONED_TABLES:
+                created += partitions.create_partition(table, month)
+            month = partitions.next_period(month)
+        self.stdout.write(self.style.SUCCESS(f"Created {created} partitions"))
+
+    def detach(self, month, drop: bool):
+        found = 0
+        with transaction.atomic():
+            # Records first, they point at the calls.
+            for table in reversed(partitions.PARTITIONED_TABLES):
+                found += partitions.detach_partition(table, month, drop)
+
+        if not found:
+            raise CommandError(f"No partitions for {month:%Y-%m}")
+        verb = "Dropped" if drop else "Detached"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} the partitions of {month:%Y-%m}")
+        )
+
+    def delete(self, month):
+        with transaction.atomic():
+            records, _ = CallRecord.objects.filter(period=month).delete()
+            calls, _ = Call.objects.filter(period=month).delete()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {calls} calls and {records} call records "
+                f"of {month:%Y-%m}"
+            )
+        )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from callculator.bills import rebuild
+from callculator.management.commands import period
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized monthly bills from the call table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--period",
+            type=period,
+            help="Only rebuild bills of this month (YYYY-MM)",
+        )
+
+    def handle(self, *args, **options):
+        created = rebuild(options["period"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} bills"))
@@ -0,0 +1,184 @@
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Max, Min
+
+from callculator.archive import ArchivedPeriodError, check_not_archived
+from callculator.bills import completed_calls, rebuild
+from callculator.ingest import RATING_FIELDS
+from callculator.management.commands import period
+from callculator.management.commands.import_cdrs import chunked
+from callculator.models import Call
+
+
+@dataclass
+class Totals:
+    calls: int = 0
+    changed: int = 0
+    old_cost: float = 0.0
+    new_cost: float = 0.0
+
+    def __add__(self, other):
+        return Totals(
+            self.calls + other.calls,
+            self.changed + other.changed,
+            self.old_cost + other.old_cost,
+            self.new_cost + other.new_cost,
+        )
+
+
+def pk_ranges(calls, count):
+    """Split ``calls`` into up to ``count`` ``[first, last)`` pk ranges."""
+    bounds = calls.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return []
+
+    first, last = bounds["first"], bounds["last"] + 1
+    step = math.ceil((last - first) / count)
+    return [(pk, min(pk + step, last)) for pk in range(first, last, step)]
+
+
+def rating(call) -> tuple:
+    return (
+        call.duration,
+        call.cost,
+        call.day_minutes,
+        call.night_minutes,
+    )
+
+
+def rerate_range(month, first, last, chunk_size, dry_run) -> Totals:
+    """Rate the calls of ``month`` in the pk range ``[first, last)``."""
+    calls = (
+        completed_calls(month)
+        .filter(pk__gte=first, pk__lt=last)
+        .order_by("pk")
+        .iterator(chunk_size=chunk_size)
+    )
+
+    totals = Totals()
+    for chunk in chunked(calls, chunk_size):
+        changed = []
+        for call in chunk:
+            old = rating(call)
+            call.rate()
+
+            totals.calls += 1
+            totals.old_cost += old[1] or 0
+            totals.new_cost += call.cost
+            if rating(call) != old:
+                changed.append(call)
+        totals.changed += len(changed)
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                Call.objects.bulk_update(changed, RATING_FIELDS)
+
+    return totals
+
+
+def setup_worker():
+    """Give a worker process its own database connections."""
+    if not apps.ready:
+        import django
+
+        django.setup()
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the duration, cost and charged minutes of the calls of a "
+        "month, in pk ranges rated by a pool of worker processes, then "
+        "rebuild that month's bills."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--period",
+            type=period,
+            required=True,
+            help="Month of the calls to re-rate (YYYY-MM)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Worker processes, 1 rates in this process (default: 1)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Calls read and written per query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the differences without writing anything",
+        )
+
+    def handle(self, *args, **options):
+        month = options["period"]
+        workers = options["workers"]
+        if workers < 1 or options["chunk_size"] < 1:
+            raise CommandError("--workers and --chunk-size must be positive")
+        try:
+            check_not_archived([month])
+        except ArchivedPeriodError as exc:
+            raise CommandError(exc)
+
+        ranges = pk_ranges(completed_calls(month), workers * 4)
+        arguments = [
+            (month, first, last, options["chunk_size"], options["dry_run"])
+            for first, last in ranges
+        ]
+
+        started = time.perf_counter()
+        totals = Totals()
+        for done, result in enumerate(self.run(arguments, workers), 1):
+            totals += result
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Rated {done}/{len(ranges)} ranges, {totals.calls} calls, "
+                f"{totals.calls / elapsed:,.0f} calls/s"
+            )
+
+        if totals.calls and not options["dry_run"]:
+            rebuild(month)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Old total {totals.old_cost:.2f}, new total "
+            f"{totals.new_cost:.2f}, difference "
+            f"{totals.new_cost - totals.old_cost:+.2f}"
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would change' if options['dry_run'] else 'Changed'} "
+                f"{totals.changed} of {totals.calls} calls in {elapsed:.1f}s"
+            )
+        )
+
+    @staticmethod
+    def run(arguments, workers):
+        """Yield the totals of every range as soon as it is rated."""
+        if workers == 1:
+            for argument in arguments:
+                yield rerate_range(*argument)
+            return
+
+        # Forked workers must not share the parent's connections.
+        connections.close_all()
+        with ProcessPoolExecutor(workers, initializer=setup_worker) as pool:
+            futures = [
+                pool.submit(rerate_range, *argument) for argument in arguments
+            ]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from callculator import queue
+from callculator.bills import record_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Drain the ingest queue: pair START/END records into calls and rate "
+        "them, in batches. Calls rated by single records are put on their "
+        "monthly bills."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Records applied per transaction",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is drained",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                applied, failed = queue.process_batch(options["batch_size"])
+                recorded = record_pending(options["batch_size"])
+            except OperationalError as exc:
+                if options["once"]:
+                    raise
+                # The database went away or the batch lost a deadlock, its
+                # records are still pending.
+                self.stderr.write(f"Batch failed, retrying: {exc}")
+                close_old_connections()
+                time.sleep(options["interval"])
+                continue
+
+            if recorded:
+                self.stdout.write(f"Recorded {recorded} calls on their bills")
+
+            if applied or failed:
+                stats = queue.stats()
+                self.stdout.write(
+                    f"Applied {applied} records ({failed} failed), "
+                    f"depth {stats['depth']}, lag {stats['lag']:.1f}s"
+                )
+                continue
+
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
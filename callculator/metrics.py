@@ -0,0 +1,396 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Every thread records into its own shard, so the hot path only updates
+plain dicts and never takes a lock; shards are summed when ``/metrics``
+is scraped. Per-request figures (DB queries, rating) are accumulated on a
+context variable, which follows the request into ``sync_to_async`` threads,
+and flushed once the response is ready.
+"""
+
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)  # fmt: skip
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, help, buckets)
+METRICS = {
+    "callculator_requests_total": (
+        "counter",
+        "Requests served, by endpoint, method and status code.",
+        None,
+    ),
+    "callculator_request_duration_seconds": (
+        "histogram",
+        "Time to build the response of a request.",
+        LATENCY_BUCKETS,
+    ),
+    "callculator_db_queries": (
+        "histogram",
+        "Database queries run by a request.",
+        QUERY_BUCKETS,
+    ),
+    "callculator_db_duration_seconds_total": (
+        "counter",
+        "Time spent running database queries.",
+        None,
+    ),
+    "callculator_db_connections_total": (
+        "counter",
+        "Database connections opened, by database alias.",
+        None,
+    ),
+    "callculator_db_pool_size": (
+        "gauge",
+        "Connections held by the pool, busy or idle.",
+        None,
+    ),
+    "callculator_db_pool_max_size": (
+        "gauge",
+        "Connections the pool may hold at most.",
+        None,
+    ),
+    "callculator_db_pool_available": (
+        "gauge",
+        "Idle connections in the pool.",
+        None,
+    ),
+    "callculator_db_pool_waiting": (
+        "gauge",
+        "Requests waiting for a connection, the pool being saturated.",
+        None,
+    ),
+    "callculator_db_pool_requests_total": (
+        "counter",
+        "Connections requested from the pool.",
+        None,
+    ),
+    "callculator_db_pool_queued_total": (
+        "counter",
+        "Connection requests that had to wait for a connection.",
+        None,
+    ),
+    "callculator_db_pool_wait_seconds_total": (
+        "counter",
+        "Time spent waiting for a connection.",
+        None,
+    ),
+    "callculator_db_pool_errors_total": (
+        "counter",
+        "Connection requests that timed out or failed.",
+        None,
+    ),
+    "callculator_rating_calls_total": (
+        "counter",
+        "Calls rated, with call_cost_calculator or a tariff plan.",
+        None,
+    ),
+    "callculator_rating_duration_seconds_total": (
+        "counter",
+        "Time spent rating calls.",
+        None,
+    ),
+    "callculator_ingest_records_total": (
+        "counter",
+        "Valid call records received, by record type.",
+        None,
+    ),
+    "callculator_ingest_failures_total": (
+        "counter",
+        "Invalid call records received, by field in error.",
+        None,
+    ),
+}
+
+
+class Shard:
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters = {}
+        # key: [count per bucket..., count above the last bucket, sum]
+        self.histograms = {}
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def shard() -> Shard:
+    try:
+        return _local.shard
+    except AttributeError:
+        _local.shard = Shard()
+        with _shards_lock:
+            _shards.append(_local.shard)
+        return _local.shard
+
+
+def inc(name: str, labels: tuple, value: float = 1):
+    counters = shard().counters
+    key = name, labels
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name: str, labels: tuple, value: float):
+    histograms = shard().histograms
+    key = name, labels
+    buckets = METRICS[name][2]
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [0] * (len(buckets) + 2)
+    histogram[bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+class RequestStats:
+    __slots__ = (
+        "queries",
+        "db_seconds",
+        "ratings",
+        "rating_seconds",
+        "ingested",
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.ratings = 0
+        self.rating_seconds = 0.0
+        # (metric, label) -> count, labelled by endpoint when flushed
+        self.ingested = {}
+
+
+current = ContextVar("callculator_request_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    inc("callculator_db_connections_total", (("alias", connection.alias),))
+    # First in line, so that execute_wrapper() blocks still pop their own.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def record_rating(seconds: float):
+    """Count a rated call, only while serving a request."""
+    stats = current.get()
+    if stats is not None:
+        stats.ratings += 1
+        stats.rating_seconds += seconds
+
+
+def record_ingest(record_type: None | str, errors=None):
+    """Count a validated call record, or its failures by field in error."""
+    if errors:
+        keys = [
+            ("callculator_ingest_failures_total", ("reason", field))
+            for field in errors
+        ]
+    else:
+        keys = [("callculator_ingest_records_total", ("type", record_type))]
+
+    stats = current.get()
+    for key in keys:
+        if stats is None:
+            inc(key[0], (("endpoint", "other"), key[1]))
+        else:
+            stats.ingested[key] = stats.ingested.get(key, 0) + 1
+
+
+def endpoint_name(request) -> str:
+    """Name of the view serving ``request``, its action for viewsets."""
+    match = request.resolver_match
+    if match is None:
+        return "unmatched"
+    actions = getattr(match.func, "actions", None)
+    if actions and request.method.lower() in actions:
+        return actions[request.method.lower()]
+    return (match.url_name or match.view_name).replace("-", "_")
+
+
+def flush(request, response, stats: RequestStats, seconds: float):
+    endpoint = endpoint_name(request)
+    labels = (("endpoint", endpoint),)
+
+    inc(
+        "callculator_requests_total",
+        (
+            *labels,
+            ("method", request.method),
+            ("status", response.status_code),
+        ),
+    )
+    observe("callculator_request_duration_seconds", labels, seconds)
+    observe("callculator_db_queries", labels, stats.queries)
+    inc("callculator_db_duration_seconds_total", labels, stats.db_seconds)
+    for (name, label), count in stats.ingested.items():
+        inc(name, (*labels, label), count)
+    if stats.ratings:
+        inc("callculator_rating_calls_total", labels, stats.ratings)
+        inc(
+            "callculator_rating_duration_seconds_total",
+            labels,
+            stats.rating_seconds,
+        )
+
+
+class MetricsMiddleware:
+    """Time every request and record its metrics, sync or async."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = current.set(stats)
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        flush(request, response, stats, perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        flush(request, response, stats, perf_counter() - started)
+        return response
+
+
+# metric: key of psycopg_pool's ConnectionPool.get_stats(), and its scale
+POOL_STATS = {
+    "callculator_db_pool_size": ("pool_size", 1),
+    "callculator_db_pool_max_size": ("pool_max", 1),
+    "callculator_db_pool_available": ("pool_available", 1),
+    "callculator_db_pool_waiting": ("requests_waiting", 1),
+    "callculator_db_pool_requests_total": ("requests_num", 1),
+    "callculator_db_pool_queued_total": ("requests_queued", 1),
+    "callculator_db_pool_wait_seconds_total": ("requests_wait_ms", 0.001),
+    "callculator_db_pool_errors_total": ("requests_errors", 1),
+}
+
+
+def pool_samples() -> dict:
+    """Gauges and counters of the connection pools, read when scraped."""
+    samples = {}
+    for alias in connections:
+        if "pool" not in connections.settings[alias].get("OPTIONS", {}):
+            continue
+        pool = connections[alias].pool
+        if pool is None:
+            continue
+        # Counters are only present once they are non-zero.
+        stats = pool.get_stats()
+        labels = (("alias", alias),)
+        for name, (key, scale) in POOL_STATS.items():
+            samples[name, labels] = stats.get(key, 0) * scale
+    return samples
+
+
+def collect() -> tuple[dict, dict]:
+    """
+    Sum the counters and histograms of every shard, gauges included with
+    the counters.
+    """
+    with _shards_lock:
+        shards = list(_shards)
+
+    counters, histograms = pool_samples(), {}
+    for part in shards:
+        for key, value in list(part.counters.items()):
+            counters[key] = counters.get(key, 0) + value
+        for key, values in list(part.histograms.items()):
+            total = histograms.setdefault(key, [0] * len(values))
+            for position, value in enumerate(list(values)):
+                total[position] += value
+    return counters, histograms
+
+
+def escape(value) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def format_labels(labels, *extra) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+def render() -> str:
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if kind in ("counter", "gauge"):
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+            continue
+
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, "+Inf"), values):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket"
+                    f"{format_labels(labels, ('le', bound))} {cumulative}"
+                )
+            lines.append(f"{name}_sum{format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0002_billing_call_duration"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="call",
+            index=models.Index(
+                fields=["source", "end"], name="call_source_end_idx"
+            ),
+        ),
+    ]
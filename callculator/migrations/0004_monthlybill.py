@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:09
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0003_call_source_end_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyBill",
+            fields=[
+                (
+                    "id",
+                    models.CharField(
+                        editable=False,
+                        max_length=19,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("phone_number", models.CharField(max_length=11)),
+                (
+                    "period",
+                    models.DateField(
+                        help_text="First day of the billed month"
+                    ),
+                ),
+                ("records", models.JSONField(default=list)),
+                (
+                    "entries",
+                    models.JSONField(
+                        default=list,
+                        help_text="[end, call id, cost, duration] of each record, times in µs",
+                    ),
+                ),
+                ("call_count", models.PositiveIntegerField(default=0)),
+                (
+                    "total_duration",
+                    models.DurationField(default=datetime.timedelta),
+                ),
+                ("total_cost", models.FloatField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
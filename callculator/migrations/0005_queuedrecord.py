@@ -0,0 +1,45 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0004_monthlybill"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedRecord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payload", models.JSONField()),
+                ("received_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "error",
+                    models.JSONField(
+                        blank=True,
+                        help_text="Why the worker could not apply the record",
+                        null=True,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="queuedrecord",
+            index=models.Index(
+                condition=models.Q(("error__isnull", True)),
+                fields=["id"],
+                name="queued_record_pending_idx",
+            ),
+        ),
+    ]
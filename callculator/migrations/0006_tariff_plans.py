@@ -0,0 +1,168 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0005_queuedrecord"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Holiday",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("name", models.CharField(blank=True, max_length=100)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="HolidayCalendar",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TariffBand",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "day",
+                    models.PositiveSmallIntegerField(
+                        choices=[
+                            (0, "Monday"),
+                            (1, "Tuesday"),
+                            (2, "Wednesday"),
+                            (3, "Thursday"),
+                            (4, "Friday"),
+                            (5, "Saturday"),
+                            (6, "Sunday"),
+                            (7, "Holiday"),
+                        ]
+                    ),
+                ),
+                (
+                    "start_minute",
+                    models.PositiveSmallIntegerField(
+                        help_text="First minute of the day in the band (0-1439)"
+                    ),
+                ),
+                (
+                    "end_minute",
+                    models.PositiveSmallIntegerField(
+                        help_text="Minute of the day the band ends at, exclusive (1-1440)"
+                    ),
+                ),
+                ("minute_cost", models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TariffPlan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                (
+                    "initial_cost",
+                    models.FloatField(help_text="Fixed fee of every call"),
+                ),
+                (
+                    "is_default",
+                    models.BooleanField(
+                        default=False,
+                        help_text="Rate calls without a plan with this one",
+                    ),
+                ),
+                (
+                    "holiday_calendar",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Days rated with the holiday bands",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="plans",
+                        to="callculator.holidaycalendar",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="holiday",
+            name="calendar",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="holidays",
+                to="callculator.holidaycalendar",
+            ),
+        ),
+        migrations.AddField(
+            model_name="tariffband",
+            name="plan",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bands",
+                to="callculator.tariffplan",
+            ),
+        ),
+        migrations.AddField(
+            model_name="call",
+            name="tariff_plan",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Plan the call was rated with, the default one if empty",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="calls",
+                to="callculator.tariffplan",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="holiday",
+            constraint=models.UniqueConstraint(
+                fields=("calendar", "date"), name="holiday_calendar_date"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="tariffplan",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_default", True)),
+                fields=("is_default",),
+                name="tariff_plan_single_default",
+            ),
+        ),
+    ]
@@ -0,0 +1,213 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:52
+
+from django.db import migrations, models
+from django.db.models import DateField, OuterRef, Subquery
+from django.db.models.functions import TruncMonth
+
+from callculator import partitions
+
+# (model, partition key), records first as they reference calls
+PARTITIONED_MODELS = [("callrecord", "period"), ("call", "period")]
+
+
+def set_periods(apps, schema_editor):
+    Call = apps.get_model("callculator", "Call")
+    CallRecord = apps.get_model("callculator", "CallRecord")
+
+    Call.objects.filter(start__isnull=False, end__isnull=False).update(
+        period=TruncMonth("end", output_field=DateField())
+    )
+    CallRecord.objects.update(
+        period=Subquery(
+            Call.objects.filter(pk=OuterRef("call_id")).values("period")[:1]
+        )
+    )
+
+
+def foreign_keys(model, partitioned):
+    """Foreign keys of ``model`` a partitioned table can keep."""
+    return [
+        field
+        for field in model._meta.local_fields
+        if field.remote_field
+        and field.db_constraint
+        and field.related_model._meta.db_table not in partitioned
+    ]
+
+
+def partition_tables(apps, schema_editor):
+    """
+    Rebuild the call tables as tables partitioned by period, on PostgreSQL.
+
+    Partitioned tables can't keep a primary key on ``id``, nor the foreign
+    key from call records to it: ``id`` gets a plain index and a sequence.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    models_ = [
+        (apps.get_model("callculator", name), key)
+        for name, key in PARTITIONED_MODELS
+    ]
+    partitioned = {model._meta.db_table for model, _ in models_}
+    quote = schema_editor.quote_name
+
+    # Foreign keys pointing at the tables to rebuild go first.
+    for model, _ in models_:
+        for field in model._meta.local_fields:
+            if (
+                field.remote_field
+                and field.db_constraint
+                and field.related_model._meta.db_table in partitioned
+            ):
+                for name in schema_editor._constraint_names(
+                    model, [field.column], foreign_key=True
+                ):
+                    schema_editor.execute(
+                        schema_editor._delete_fk_sql(model, name)
+                    )
+
+    for model, key in models_:
+        table = model._meta.db_table
+        old = f"{table}_unpartitioned"
+        sequence = f"{table}_id_seq"
+
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} RENAME TO {quote(old)}"
+        )
+        # The identity sequence keeps the name of the table, the new one is
+        # created under that name below.
+        schema_editor.execute(
+            f"ALTER TABLE {quote(old)} ALTER COLUMN id "
+            "DROP IDENTITY IF EXISTS"
+        )
+        schema_editor.execute(
+            f"CREATE TABLE {quote(table)} (LIKE {quote(old)} "
+            f"INCLUDING DEFAULTS) PARTITION BY RANGE ({quote(key)})"
+        )
+        schema_editor.execute(
+            f"CREATE TABLE {quote(table + partitions.DEFAULT_SUFFIX)} "
+            f"PARTITION OF {quote(table)} DEFAULT"
+        )
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT DISTINCT {quote(key)} FROM {quote(old)} "
+                f"WHERE {quote(key)} IS NOT NULL"
+            )
+            for (period,) in cursor.fetchall():
+                partitions.create_partition(table, period)
+
+        schema_editor.execute(
+            f"INSERT INTO {quote(table)} SELECT * FROM {quote(old)}"
+        )
+        schema_editor.execute(f"CREATE SEQUENCE {quote(sequence)}")
+        schema_editor.execute(
+            f"SELECT setval('{sequence}', COALESCE(MAX(id), 0) + 1, false) "
+            f"FROM {quote(old)}"
+        )
+        schema_editor.execute(f"DROP TABLE {quote(old)}")
+        schema_editor.execute(
+            f"ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.id"
+        )
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} ALTER COLUMN id "
+            f"SET DEFAULT nextval('{sequence}')"
+        )
+
+        schema_editor.execute(
+            f"CREATE INDEX {quote(table + '_id_idx')} ON {quote(table)} (id)"
+        )
+        for statement in schema_editor._model_indexes_sql(model):
+            schema_editor.execute(statement)
+        for field in foreign_keys(model, partitioned):
+            schema_editor.execute(
+                schema_editor._create_fk_sql(
+                    model, field, "_fk_%(to_table)s_%(to_column)s"
+                )
+            )
+
+    partitions.forget()
+
+
+def unpartition_tables(apps, schema_editor):
+    """Inverse of ``partition_tables``, back to plain tables."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    quote = schema_editor.quote_name
+    models_ = [
+        apps.get_model("callculator", name)
+        for name, _ in reversed(PARTITIONED_MODELS)
+    ]
+
+    for model in models_:
+        table = model._meta.db_table
+        old = f"{table}_partitioned"
+
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} RENAME TO {quote(old)}"
+        )
+        schema_editor.execute(
+            f"CREATE TABLE {quote(table)} (LIKE {quote(old)})"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {quote(table)} SELECT * FROM {quote(old)}"
+        )
+        # Drops the partitions, not the detached ones, and the id sequence.
+        schema_editor.execute(f"DROP TABLE {quote(old)}")
+        # Back to the identity column Django creates.
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} ALTER COLUMN id "
+            "ADD GENERATED BY DEFAULT AS IDENTITY"
+        )
+        schema_editor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE(MAX(id), 0) + 1, false) FROM {quote(table)}"
+        )
+        schema_editor.execute(
+            f"ALTER TABLE {quote(table)} ADD PRIMARY KEY (id)"
+        )
+        for statement in schema_editor._model_indexes_sql(model):
+            schema_editor.execute(statement)
+
+    for model in models_:
+        for field in foreign_keys(model, set()):
+            schema_editor.execute(
+                schema_editor._create_fk_sql(
+                    model, field, "_fk_%(to_table)s_%(to_column)s"
+                )
+            )
+
+    partitions.forget()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0006_tariff_plans"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="call",
+            name="period",
+            field=models.DateField(
+                blank=True,
+                editable=False,
+                help_text="First day of the billed month, once the call is complete",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="callrecord",
+            name="period",
+            field=models.DateField(
+                blank=True,
+                editable=False,
+                help_text="Billing period of the call, once it is complete",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(set_periods, migrations.RunPython.noop),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
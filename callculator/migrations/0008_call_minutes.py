@@ -0,0 +1,79 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+from callculator.tariffs import CompiledPlan
+from callculator.tools import day_night_minutes, payable_minutes
+
+
+def set_minutes(apps, schema_editor, batch_size=2000):
+    """Split the charged minutes of every call as ``Call.rate`` does."""
+    Call = apps.get_model("callculator", "Call")
+    Holiday = apps.get_model("callculator", "Holiday")
+    TariffPlan = apps.get_model("callculator", "TariffPlan")
+
+    plans = {
+        plan.pk: CompiledPlan.compile(
+            plan,
+            plan.bands.all(),
+            Holiday.objects.filter(
+                calendar_id=plan.holiday_calendar_id
+            ).values_list("date", flat=True),
+        )
+        for plan in TariffPlan.objects.all()
+    }
+    default = (
+        TariffPlan.objects.filter(is_default=True)
+        .values_list("pk", flat=True)
+        .first()
+    )
+
+    calls = Call.objects.filter(start__isnull=False, end__isnull=False).only(
+        "start", "end", "tariff_plan"
+    )
+    batch = []
+    for call in calls.iterator(chunk_size=batch_size):
+        plan = plans.get(call.tariff_plan_id or default)
+        if plan is None:
+            charged = payable_minutes(call.start, call.end)
+        else:
+            charged = plan.minutes(call.start, call.end)[1]
+        call.day_minutes, call.night_minutes = day_night_minutes(
+            call.start, call.end, charged
+        )
+        batch.append(call)
+        if len(batch) >= batch_size:
+            Call.objects.bulk_update(batch, ["day_minutes", "night_minutes"])
+            batch = []
+    Call.objects.bulk_update(batch, ["day_minutes", "night_minutes"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0007_call_period"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="call",
+            name="day_minutes",
+            field=models.IntegerField(
+                blank=True,
+                editable=False,
+                help_text="Minutes charged inside the standard rate band",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="call",
+            name="night_minutes",
+            field=models.IntegerField(
+                blank=True,
+                editable=False,
+                help_text="Minutes charged outside the standard rate band",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(set_minutes, migrations.RunPython.noop),
+    ]
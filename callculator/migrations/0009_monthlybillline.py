@@ -0,0 +1,111 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:51
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from callculator.tools import EPOCH, MICROSECOND
+
+
+def split_bills(apps, schema_editor, batch_size=2000):
+    """Turn the entries and records of every bill into lines."""
+    MonthlyBill = apps.get_model("callculator", "MonthlyBill")
+    MonthlyBillLine = apps.get_model("callculator", "MonthlyBillLine")
+
+    batch = []
+    for bill in MonthlyBill.objects.iterator(chunk_size=100):
+        for (end, call_id, cost, duration), record in zip(
+            bill.entries, bill.records
+        ):
+            batch.append(
+                MonthlyBillLine(
+                    bill_id=bill.pk,
+                    call_id=call_id,
+                    end=EPOCH + end * MICROSECOND,
+                    cost=cost,
+                    duration=duration * MICROSECOND,
+                    record=record,
+                )
+            )
+        if len(batch) >= batch_size:
+            MonthlyBillLine.objects.bulk_create(batch)
+            batch = []
+    MonthlyBillLine.objects.bulk_create(batch)
+
+
+def join_lines(apps, schema_editor):
+    MonthlyBill = apps.get_model("callculator", "MonthlyBill")
+
+    for bill in MonthlyBill.objects.iterator(chunk_size=100):
+        lines = bill.lines.order_by("end", "call_id")
+        bill.entries = [
+            [
+                (line.end - EPOCH) // MICROSECOND,
+                line.call_id,
+                line.cost,
+                line.duration // MICROSECOND,
+            ]
+            for line in lines
+        ]
+        bill.records = [line.record for line in lines]
+        bill.save(update_fields=["entries", "records"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0008_call_minutes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyBillLine",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "call_id",
+                    models.BigIntegerField(
+                        help_text="A call is on one bill at most", unique=True
+                    ),
+                ),
+                ("end", models.DateTimeField()),
+                ("cost", models.FloatField(default=0)),
+                ("duration", models.DurationField(default=datetime.timedelta)),
+                ("record", models.JSONField()),
+                (
+                    "bill",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lines",
+                        to="callculator.monthlybill",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["bill", "end", "call_id"],
+                        name="bill_line_order_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(split_bills, join_lines),
+        migrations.RemoveField(
+            model_name="monthlybill",
+            name="entries",
+        ),
+        migrations.RemoveField(
+            model_name="monthlybill",
+            name="records",
+        ),
+    ]
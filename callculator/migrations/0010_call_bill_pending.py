@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("callculator", "0009_monthlybillline"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="call",
+            name="bill_pending",
+            field=models.BooleanField(
+                db_default=False,
+                default=False,
+                editable=False,
+                help_text="Rated from one record, not on its bill yet",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="call",
+            index=models.Index(
+                condition=models.Q(("bill_pending", True)),
+                fields=["id"],
+                name="call_bill_pending_idx",
+            ),
+        ),
+    ]
@@ -1,6 +1,16 @@
-from django.db import models
+from datetime import date, timedelta
+from time import perf_counter
 
-from callculator.tools import call_cost_calculator
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+
+from callculator.metrics import record_rating
+from callculator.tools import (
+    call_cost_calculator,
+    day_night_minutes,
+    payable_minutes,
+)
 
 
 class Call(models.Model):
@@ -12,13 +22,108 @@ class Call(models.Model):
 
     duration = models.DurationField(blank=True, null=True)
     cost = models.FloatField(blank=True, null=True)
+    day_minutes = models.IntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="Minutes charged inside the standard rate band",
+    )
+    night_minutes = models.IntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="Minutes charged outside the standard rate band",
+    )
+    period = models.DateField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="First day of the billed month, once the call is complete",
+    )
+    tariff_plan = models.ForeignKey(
+        "TariffPlan",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="calls",
+        help_text="Plan the call was rated with, the default one if empty",
+    )
+    bill_pending = models.BooleanField(
+        default=False,
+        db_default=False,
+        editable=False,
+        help_text="Rated from one record, not on its bill yet",
+    )
+
+    _billed_in = None
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["source", "end"], name="call_source_end_idx"),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(bill_pending=True),
+                name="call_bill_pending_idx",
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._billed_in = instance.bill_key()
+        return instance
+
+    def bill_key(self) -> None | tuple[str, date]:
+        """Phone number and period of the monthly bill holding this call."""
+        if not (self.start and self.end):
+            return None
+
+        end = self.end
+        if timezone.is_aware(end):
+            end = timezone.localtime(end)
+
+        return self.source, end.date().replace(day=1)
+
+    def changed_period(self) -> bool:
+        """Whether the call got another billing period since it was loaded."""
+        return self.period != (self._billed_in and self._billed_in[1])
+
+    def rate(self):
+        from callculator.tariffs import plan_for
 
-    def save(self, *args, **kwargs):
         if self.start and self.end:
+            started = perf_counter()
             self.duration = self.end - self.start
-            self.cost = call_cost_calculator(self.start, self.end)
+            self.period = self.bill_key()[1]
+
+            plan = plan_for(self)
+            if plan is None:
+                self.cost = call_cost_calculator(self.start, self.end)
+                charged = payable_minutes(self.start, self.end)
+            else:
+                cost, charged = plan.minutes(self.start, self.end)
+                self.cost = plan.initial_cost + cost
+
+            # Split as the rate that priced the call charged it.
+            self.day_minutes, self.night_minutes = day_night_minutes(
+                self.start, self.end, charged
+            )
+
+            record_rating(perf_counter() - started)
 
-        super().save()
+    def save(self, *args, **kwargs):
+        from callculator.bills import record_calls
+
+        self.rate()
+        moved = not self._state.adding and self.changed_period()
+
+        # The call and its bill are written together or not at all.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            if moved:
+                CallRecord.settle([self])
+            record_calls([self])
 
 
 class CallRecord(models.Model):
@@ -29,3 +134,182 @@ class CallRecord(models.Model):
     record_type = models.CharField(max_length=5, choices=Type.choices)
     call = models.ForeignKey(Call, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True, editable=False)
+    period = models.DateField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="Billing period of the call, once it is complete",
+    )
+
+    @classmethod
+    def settle(cls, calls):
+        """
+        Give the records of freshly completed calls, or of calls moved to
+        another month, the billing period of their call. On PostgreSQL this
+        moves them out of the open partition, or of the old month's one.
+        """
+        periods = {}
+        for call in calls:
+            if call.period:
+                periods.setdefault(call.period, []).append(call.pk)
+
+        for period, call_ids in periods.items():
+            cls.objects.filter(call_id__in=call_ids).exclude(
+                period=period
+            ).update(period=period)
+
+
+class MonthlyBill(models.Model):
+    """
+    Totals of the bill of a phone number for a closed or running month, its
+    calls are in ``lines``.
+    """
+
+    id = models.CharField(max_length=19, primary_key=True, editable=False)
+    phone_number = models.CharField(max_length=11)
+    period = models.DateField(help_text="First day of the billed month")
+
+    call_count = models.PositiveIntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+    total_cost = models.FloatField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @staticmethod
+    def make_key(phone_number: str, period: date) -> str:
+        return f"{phone_number}:{period:%Y-%m}"
+
+    def save(self, *args, **kwargs):
+        self.id = self.make_key(self.phone_number, self.period)
+        super().save(*args, **kwargs)
+
+
+class MonthlyBillLine(models.Model):
+    """A call of a monthly bill, with its record as the bill renders it."""
+
+    bill = models.ForeignKey(
+        MonthlyBill, on_delete=models.CASCADE, related_name="lines"
+    )
+    call_id = models.BigIntegerField(
+        unique=True, help_text="A call is on one bill at most"
+    )
+    end = models.DateTimeField()
+    cost = models.FloatField(default=0)
+    duration = models.DurationField(default=timedelta)
+    record = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["bill", "end", "call_id"], name="bill_line_order_idx"
+            ),
+        ]
+
+
+class QueuedRecord(models.Model):
+    """Raw call record accepted for ingestion, waiting for the worker."""
+
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True, editable=False)
+    error = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Why the worker could not apply the record",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["id"],
+                name="queued_record_pending_idx",
+                condition=models.Q(error__isnull=True),
+            ),
+        ]
+
+
+class HolidayCalendar(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Holiday(models.Model):
+    calendar = models.ForeignKey(
+        HolidayCalendar, on_delete=models.CASCADE, related_name="holidays"
+    )
+    date = models.DateField()
+    name = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["calendar", "date"], name="holiday_calendar_date"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.name}"
+
+
+class TariffPlan(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    initial_cost = models.FloatField(help_text="Fixed fee of every call")
+    is_default = models.BooleanField(
+        default=False, help_text="Rate calls without a plan with this one"
+    )
+    holiday_calendar = models.ForeignKey(
+        HolidayCalendar,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="plans",
+        help_text="Days rated with the holiday bands",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["is_default"],
+                condition=models.Q(is_default=True),
+                name="tariff_plan_single_default",
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class TariffBand(models.Model):
+    class Day(models.IntegerChoices):
+        MONDAY = 0
+        TUESDAY = 1
+        WEDNESDAY = 2
+        THURSDAY = 3
+        FRIDAY = 4
+        SATURDAY = 5
+        SUNDAY = 6
+        HOLIDAY = 7
+
+    plan = models.ForeignKey(
+        TariffPlan, on_delete=models.CASCADE, related_name="bands"
+    )
+    day = models.PositiveSmallIntegerField(choices=Day.choices)
+    start_minute = models.PositiveSmallIntegerField(
+        help_text="First minute of the day in the band (0-1439)"
+    )
+    end_minute = models.PositiveSmallIntegerField(
+        help_text="Minute of the day the band ends at, exclusive (1-1440)"
+    )
+    minute_cost = models.FloatField()
+
+    def clean(self):
+        if not 0 <= self.start_minute < self.end_minute <= 24 * 60:
+            raise ValidationError(
+                {"end_minute": "Bands must end after they start, in a day."}
+            )
+
+    def __str__(self):
+        return (
+            f"{self.get_day_display()} {self.start_minute}-{self.end_minute}"
+        )
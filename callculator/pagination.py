@@ -0,0 +1,28 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from callculator.tools import EPOCH, MICROSECOND
+
+
+def encode_cursor(end: datetime, pk: int) -> str:
+    """Opaque cursor pointing right after the call with ``(end, pk)``."""
+    value = f"{(end - EPOCH) // MICROSECOND}:{pk}"
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of ``encode_cursor``, raises ``ValueError`` on bad input."""
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        end, pk = value.decode().split(":")
+        return EPOCH + int(end) * MICROSECOND, int(pk)
+    except (TypeError, UnicodeDecodeError, OverflowError) as exc:
+        raise ValueError(f"Invalid cursor {cursor!r}") from exc
+
+
+def after_cursor(calls, cursor: str):
+    """Keyset filter on ``(end, id)`` for calls ordered by those fields."""
+    end, pk = decode_cursor(cursor)
+    return calls.filter(Q(end__gt=end) | Q(end=end, id__gt=pk))
@@ -0,0 +1,149 @@
+"""
+Monthly range partitions of the call tables on PostgreSQL.
+
+``Call`` and ``CallRecord`` are partitioned by ``period``, the billing month
+of the call: one ``<table>_pYYYY_MM`` partition per month, plus a
+``<table>_default`` partition holding open calls, which have no period yet,
+and months nobody created a partition for. Completing a call moves it, and
+its records, to the partition of its month. An expired month is archived
+by detaching or dropping its partitions, which only touches the catalog.
+
+A partitioned table can't have a unique index on ``id`` alone: writers of
+the same call are serialized with advisory locks instead. On other
+databases the tables stay plain tables, and archiving a month falls back to
+deleting its rows.
+"""
+
+from datetime import date
+
+from django.db import connection, transaction
+
+from callculator.tools import month_range
+
+PARTITIONED_TABLES = ["callculator_call", "callculator_callrecord"]
+DEFAULT_SUFFIX = "_default"
+
+_partitioned = {}
+
+
+def is_partitioned(table: str) -> bool:
+    """Whether ``table`` is partitioned, looked up once per connection."""
+    if connection.vendor != "postgresql":
+        return False
+
+    key = connection.alias, table
+    if key not in _partitioned:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass(%s))",
+                [table],
+            )
+            _partitioned[key] = cursor.fetchone()[0]
+    return _partitioned[key]
+
+
+def forget():
+    """Drop what ``is_partitioned`` remembers, after a schema change."""
+    _partitioned.clear()
+
+
+def partition_name(table: str, period: date) -> str:
+    return f"{table}_p{period:%Y_%m}"
+
+
+def next_period(period: date) -> date:
+    return month_range(period)[1].date()
+
+
+def partitions(table: str) -> list[tuple[str, None | date]]:
+    """``(name, period)`` of the partitions of ``table``, None for default."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s) "
+            "ORDER BY child.relname",
+            [table],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+
+    prefix = f"{table}_p"
+    return [
+        (
+            name,
+            (
+                date(int(name[-7:-3]), int(name[-2:]), 1)
+                if name.startswith(prefix)
+                else None
+            ),
+        )
+        for name in names
+    ]
+
+
+def create_partition(table: str, period: date) -> bool:
+    """
+    Create the partition of ``table`` for ``period`` unless it exists,
+    moving the rows of that month out of the default partition. Returns
+    whether it was created.
+    """
+    name = partition_name(table, period)
+    quote = connection.ops.quote_name
+    first, last = period.isoformat(), next_period(period).isoformat()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        if cursor.fetchone()[0]:
+            return False
+
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} "
+            f"(LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {quote(table + DEFAULT_SUFFIX)} "
+            "WHERE period >= %s AND period < %s RETURNING *) "
+            f"INSERT INTO {quote(name)} SELECT * FROM moved",
+            [first, last],
+        )
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} "
+            f"FOR VALUES FROM ('{first}') TO ('{last}')"
+        )
+    return True
+
+
+def detach_partition(table: str, period: date, drop: bool = False) -> bool:
+    """
+    Detach the partition of ``table`` for ``period``, which is then left as
+    a standalone table, or drop it. Returns whether there was one.
+    """
+    name = partition_name(table, period)
+    if name not in dict(partitions(table)):
+        return False
+
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}"
+        )
+        if drop:
+            cursor.execute(f"DROP TABLE {quote(name)}")
+    return True
+
+
+def lock_calls(call_ids):
+    """
+    Serialize the writers of these calls until the end of the transaction,
+    as no unique constraint does it once the call table is partitioned.
+    """
+    if not is_partitioned(PARTITIONED_TABLES[0]):
+        return
+
+    with connection.cursor() as cursor:
+        # In order, so that two batches can't deadlock.
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(id) FROM unnest(%s::bigint[]) id",
+            [sorted(set(call_ids))],
+        )
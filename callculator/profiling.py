@@ -0,0 +1,152 @@
+"""
+Opt-in cProfile captures of live requests.
+
+With ``PROFILING_ENABLED`` unset the middleware removes itself at startup,
+so requests pay nothing. Once enabled, a request is profiled when it
+carries ``PROFILING_TOKEN`` in the ``X-Profile`` header or the ``profile``
+query parameter, or when it is drawn by ``PROFILING_SAMPLE_RATE``. Each
+capture is saved in ``PROFILING_DIR`` as a ``.prof`` file (for pstats or
+snakeviz) next to a ``.txt`` summary of the top functions by cumulative
+time.
+"""
+
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import re
+import uuid
+from pathlib import Path
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+from django.utils import timezone
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_REGEX = re.compile(r"^[\w-]+$")
+
+
+def is_authorized(value: None | str) -> bool:
+    token = settings.PROFILING_TOKEN
+    return bool(token and value) and hmac.compare_digest(value, token)
+
+
+def profile_dir() -> Path:
+    return Path(settings.PROFILING_DIR)
+
+
+def summary(profile, top: int) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+    return stream.getvalue()
+
+
+def save(request, profile) -> str:
+    """Write the ``.prof`` and ``.txt`` files of a capture, return its id."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    match = request.resolver_match
+    view = re.sub(r"\W", "_", match.url_name or "") if match else ""
+    profile_id = (
+        f"{timezone.now():%Y%m%dT%H%M%S}-{view or 'unmatched'}-"
+        f"{uuid.uuid4().hex[:8]}"
+    )
+
+    profile.dump_stats(directory / f"{profile_id}.prof")
+    (directory / f"{profile_id}.txt").write_text(
+        f"{request.method} {request.path}\n\n"
+        + summary(profile, settings.PROFILING_TOP_FUNCTIONS)
+    )
+    prune(directory, settings.PROFILING_KEEP)
+    return profile_id
+
+
+def prune(directory: Path, keep: int):
+    """Drop the oldest captures beyond the ``keep`` most recent ones."""
+    captures = sorted(directory.glob("*.prof"), reverse=True)
+    for path in captures[keep:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".txt").unlink(missing_ok=True)
+
+
+def captures() -> list[str]:
+    return [path.stem for path in sorted(profile_dir().glob("*.prof"))]
+
+
+def start_profile() -> None | cProfile.Profile:
+    """A running profiler, ``None`` while another one runs (Python 3.12+)."""
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None
+    return profile
+
+
+class ProfilingMiddleware:
+    """
+    Profile sampled or authorized requests, sync or async. An async capture
+    also holds whatever else the event loop ran while the request waited.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def should_profile(self, request) -> bool:
+        if is_authorized(
+            request.headers.get(PROFILE_HEADER) or request.GET.get("profile")
+        ):
+            return True
+        rate = settings.PROFILING_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        profile = self.should_profile(request) and start_profile()
+        if not profile:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+
+        return self.attach(response, save(request, profile))
+
+    async def __acall__(self, request):
+        profile = self.should_profile(request) and start_profile()
+        if not profile:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.disable()
+
+        profile_id = await sync_to_async(save)(request, profile)
+        return self.attach(response, profile_id)
+
+    @staticmethod
+    def attach(response, profile_id: str):
+        response["X-Profile-Id"] = profile_id
+        response["X-Profile-Url"] = reverse(
+            "profile-detail", args=[profile_id, "prof"]
+        )
+        return response
@@ -0,0 +1,77 @@
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from callculator.ingest import apply_records
+from callculator.models import QueuedRecord
+from callculator.serializers import CallRecordSerializer
+
+
+def enqueue(payload: dict) -> QueuedRecord:
+    return QueuedRecord.objects.create(payload=payload)
+
+
+def pending():
+    return QueuedRecord.objects.filter(error__isnull=True)
+
+
+def lag() -> float:
+    """Age in seconds of the oldest pending record, with a single lookup."""
+    oldest = pending().order_by("id").values_list("received_at", flat=True)
+    oldest = oldest.first()
+    return (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+
+def stats() -> dict:
+    """Queue depth and age in seconds of the oldest pending record."""
+    return {"depth": pending().count(), "lag": lag()}
+
+
+def process_batch(size: int) -> tuple[int, int]:
+    """
+    Apply up to ``size`` pending records, oldest first.
+
+    Invalid records, and records that can't be applied, are kept in the
+    queue with their errors. Records hitting a transient database error
+    (a lost connection, a deadlock) stay pending and are retried with a
+    later batch. Returns the number of applied and failed records.
+    """
+    with transaction.atomic():
+        batch = pending().order_by("id")
+        if connection.features.has_select_for_update_skip_locked:
+            batch = batch.select_for_update(skip_locked=True)
+        batch = list(batch[:size])
+
+        valid, failed = [], []
+        for queued in batch:
+            serializer = CallRecordSerializer(data=queued.payload)
+            # Counted by the ingest metrics when it was queued
+            if serializer.is_valid(count=False):
+                valid.append((queued, serializer.validated_data))
+            else:
+                queued.error = serializer.errors
+                failed.append(queued)
+
+        try:
+            with transaction.atomic():
+                apply_records([data for _, data in valid])
+        except Exception:
+            # Find the culprits one record at a time
+            applied = []
+            for queued, data in valid:
+                try:
+                    with transaction.atomic():
+                        apply_records([data])
+                    applied.append((queued, data))
+                except OperationalError:
+                    continue
+                except Exception as exc:
+                    queued.error = {"non_field_errors": [str(exc)]}
+                    failed.append(queued)
+            valid = applied
+
+        QueuedRecord.objects.filter(
+            pk__in=[queued.pk for queued, _ in valid]
+        ).delete()
+        QueuedRecord.objects.bulk_update(failed, ["error"])
+
+    return len(valid), len(failed)
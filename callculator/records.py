@@ -0,0 +1,68 @@
+"""
+Bill records straight from database rows.
+
+``call_record`` gives the same record as ``CallSerializer`` renders to
+JSON, without a model instance or DRF fields: callers fetch
+``RECORD_COLUMNS`` with ``values_list`` and records come out as plain
+JSON types, ready for ``dumps``.
+"""
+
+from django.utils.duration import duration_string
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+RECORD_COLUMNS = ("destination", "start", "duration", "cost")
+
+# Same output as the JSON renderer of DRF, minus its U+2028/U+2029 escapes
+encode = JSONEncoder(
+    ensure_ascii=False, allow_nan=False, separators=(",", ":")
+).encode
+
+
+def format_duration(duration) -> str:
+    total_seconds = int(duration.total_seconds())
+    return (
+        f"{total_seconds // 3600}h{total_seconds % 3600 // 60:02}m"
+        f"{total_seconds % 60:02}s"
+    )
+
+
+def format_cost(cost: float) -> str:
+    # Grouping with "_" leaves a single swap to the Brazilian separators.
+    return f"R$ {cost:_.2f}".replace(".", ",").replace("_", ".")
+
+
+def call_record(destination, start, duration, cost) -> dict:
+    """Record of a call in a bill, as rendered by ``CallSerializer``."""
+    if duration:
+        duration = format_duration(duration)
+    elif duration is not None:
+        duration = duration_string(duration)
+
+    if cost:
+        cost = format_cost(cost)
+    elif cost is not None:
+        cost = float(cost)
+
+    return {
+        "destination": destination,
+        "date": start.date().isoformat(),
+        "time": start.time().isoformat(),
+        "duration": duration,
+        "cost": cost,
+    }
+
+
+def record_of(call) -> dict:
+    return call_record(call.destination, call.start, call.duration, call.cost)
+
+
+def dumps(data) -> bytes:
+    """Compact JSON of records, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return encode(data).encode()
@@ -1,10 +1,23 @@
 import re
 from datetime import date, datetime, timedelta
 
-from django.utils import timezone
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 
+from callculator.archive import ArchivedPeriodError
+from callculator.ingest import (
+    TIMESTAMP_FORMAT,
+    apply_record,
+    ingest_record,
+    parse_timestamp,
+    supports_upsert,
+)
+from callculator.metrics import record_ingest
 from callculator.models import Call, CallRecord
+from callculator.partitions import lock_calls
+from callculator.tools import month_range
 
 PHONE_NUMBER_REGEX = re.compile(r"^\d{2}\d{8,9}$")
 
@@ -22,6 +35,44 @@ class HealthCheckResponseSerializer(serializers.Serializer):
         return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
+class LivenessResponseSerializer(serializers.Serializer):
+    service = serializers.CharField(default="callculator")
+    status = serializers.CharField(default="OK")
+    time = serializers.DateTimeField()
+
+
+class DatabaseCheckSerializer(serializers.Serializer):
+    status = serializers.CharField()
+    latency_ms = serializers.FloatField(
+        required=False, help_text="Round trip of SELECT 1"
+    )
+    error = serializers.CharField(
+        required=False, help_text="Exception raised by the check"
+    )
+
+
+class MigrationsCheckSerializer(serializers.Serializer):
+    status = serializers.CharField()
+    unapplied = serializers.ListField(child=serializers.CharField())
+
+
+class QueueCheckSerializer(serializers.Serializer):
+    status = serializers.CharField()
+    lag = serializers.FloatField(
+        help_text="Age in seconds of the oldest waiting record"
+    )
+
+
+class ReadinessResponseSerializer(serializers.Serializer):
+    service = serializers.CharField(default="callculator")
+    status = serializers.CharField(help_text="OK or FAIL")
+    checked_at = serializers.DateTimeField()
+    age = serializers.FloatField(help_text="Seconds since the check ran")
+    database = DatabaseCheckSerializer()
+    migrations = MigrationsCheckSerializer(required=False)
+    queue = QueueCheckSerializer(required=False)
+
+
 class CallRecordSerializer(serializers.Serializer):
     id = serializers.IntegerField(
         help_text="Record unique identifier", read_only=True
@@ -41,6 +92,30 @@ class CallRecordSerializer(serializers.Serializer):
         required=False, help_text="Destination phone number"
     )
 
+    def is_valid(self, *, raise_exception=False, count=True):
+        """
+        Validate the record and count it in the ingest metrics, unless
+        ``count`` is off for a record already counted when it was received.
+        """
+        validated = hasattr(self, "_validated_data")
+        valid = super().is_valid()
+        if count and not validated:
+            record_ingest(self.validated_data.get("type"), self.errors)
+
+        if not valid and raise_exception:
+            raise serializers.ValidationError(self.errors)
+        return valid
+
+    def validate_timestamp(self, value):
+        try:
+            parse_timestamp(value)
+        except ValueError:
+            raise serializers.ValidationError(
+                f"Invalid timestamp. It must be in the format {TIMESTAMP_FORMAT}."
+            )
+
+        return value
+
     def validate(self, data):
         if "source" in data and not PHONE_NUMBER_REGEX.match(data["source"]):
             raise serializers.ValidationError(
@@ -71,33 +146,74 @@ class CallRecordSerializer(serializers.Serializer):
         return data
 
     def create(self, data):
-        call, _ = Call.objects.get_or_create(pk=data["call_id"])
-
-        match data["type"]:
-            case "START":
-                call.source = data["source"]
-                call.destination = data["destination"]
-                call.start = timezone.make_aware(
-                    datetime.strptime(data["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
-                )
-
-            case "END":
-                call.end = timezone.make_aware(
-                    datetime.strptime(data["timestamp"], "%Y-%m-%dT%H:%M:%SZ")
-                )
-            case _:
+        try:
+            return self.store(data)
+        except ArchivedPeriodError as exc:
+            raise serializers.ValidationError({"timestamp": str(exc)})
+
+    def store(self, data):
+        if supports_upsert():
+            call_record = ingest_record(data)
+            return {**data, "id": call_record.id}
+
+        with transaction.atomic():
+            lock_calls([data["call_id"]])
+            call, _ = Call.objects.get_or_create(pk=data["call_id"])
+
+            try:
+                apply_record(call, data)
+            except ValueError:
                 raise serializers.ValidationError(
                     {"type": "Must be 'START' or 'END'"}
                 )
 
-        call.save()
+            call.save()
 
-        call_record = CallRecord.objects.create(
-            record_type=data["type"], call=call
-        )
+            call_record = CallRecord.objects.create(
+                record_type=data["type"], call=call, period=call.period
+            )
 
         return {**data, "id": call_record.id}
 
+    async def acreate(self, data):
+        """
+        Async counterpart of ``create``, for the async ingest view. It is not
+        native: writing a record takes a transaction, and a lock on
+        partitioned tables, and Django has no async transactions, so
+        ``create`` runs whole in one worker thread.
+        """
+        return await sync_to_async(self.create)(data)
+
+
+class CallRecordBulkResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField(
+        help_text="Position of the record in the request body"
+    )
+    status = serializers.ChoiceField(
+        choices=["OK", "ERROR"],
+        help_text="Whether the record was stored",
+    )
+    record = CallRecordSerializer(required=False)
+    errors = serializers.DictField(required=False)
+
+
+class CallRecordBulkResponseSerializer(serializers.Serializer):
+    stored = serializers.IntegerField()
+    failed = serializers.IntegerField()
+    results = CallRecordBulkResultSerializer(many=True)
+
+
+class QueuedRecordSerializer(serializers.Serializer):
+    queue_id = serializers.IntegerField(help_text="Ingest queue entry")
+    received_at = serializers.DateTimeField()
+
+
+class IngestQueueSerializer(serializers.Serializer):
+    depth = serializers.IntegerField(help_text="Records waiting to be rated")
+    lag = serializers.FloatField(
+        help_text="Age in seconds of the oldest waiting record"
+    )
+
 
 class CallSerializer(serializers.Serializer):
     destination = serializers.CharField()
@@ -160,11 +276,16 @@ class BillingResponseSerializer(serializers.Serializer):
 
     @staticmethod
     def get_filtered_calls(phone_number: str, dateref: None | date):
+        if not dateref:
+            return Call.objects.filter(source=phone_number, end__isnull=True)
+
+        month_start, next_month_start = month_range(dateref)
         return Call.objects.filter(
             source=phone_number,
-            end__date__year=dateref.year if dateref else None,
-            end__date__month=dateref.month if dateref else None,
-        )
+            start__isnull=False,
+            end__gte=month_start,
+            end__lt=next_month_start,
+        ).order_by("end", "id")
 
     def to_representation(self, instance):
         phone_number = instance["phone_number"]
@@ -183,3 +304,58 @@ class BillingResponseSerializer(serializers.Serializer):
             "dateref": dateref,
             "records": CallSerializer(calls, many=True).data,
         }
+
+
+class BillingBatchRequestSerializer(serializers.Serializer):
+    dateref = serializers.CharField(
+        required=False,
+        help_text=(
+            "Date reference in the format 'YYYY-MM'. If not provided, "
+            "defaults to the last valid month."
+        ),
+    )
+
+    def get_fields(self):
+        # The limit is read from the settings when a request is validated.
+        return {
+            "phone_numbers": serializers.ListField(
+                child=serializers.CharField(),
+                allow_empty=False,
+                max_length=settings.BILLING_BATCH_MAX_NUMBERS,
+                error_messages={
+                    "max_length": "At most {max_length} phone numbers per "
+                    "request."
+                },
+                help_text="Phone numbers in the format 'AAXXXXXXXXX'",
+            ),
+            **super().get_fields(),
+        }
+
+    def validate_phone_numbers(self, value):
+        invalid = [
+            phone_number
+            for phone_number in value
+            if not PHONE_NUMBER_REGEX.match(phone_number)
+        ]
+        if invalid:
+            raise serializers.ValidationError(
+                f"Invalid phone number format: {', '.join(invalid)}"
+            )
+
+        # Each bill once, in request order
+        return list(dict.fromkeys(value))
+
+
+class BatchBillSerializer(serializers.Serializer):
+    phone_number = serializers.CharField()
+    records = CallSerializer(many=True, read_only=True)
+    call_count = serializers.IntegerField()
+    total_duration = serializers.IntegerField(help_text="Seconds")
+    total_cost = serializers.FloatField()
+
+
+class BillingBatchResponseSerializer(serializers.Serializer):
+    dateref = serializers.DateField()
+    bills = BatchBillSerializer(
+        many=True, help_text="One bill per phone number, in request order"
+    )
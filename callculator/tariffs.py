@@ -0,0 +1,266 @@
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import accumulate
+from time import monotonic
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from callculator.models import Holiday, HolidayCalendar, TariffBand, TariffPlan
+from callculator.tools import MINUTES_PER_DAY, minute_steps
+
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# ``date.toordinal()`` of 0001-01-01 is 1 and that day is a Monday.
+FIRST_MONDAY = 1
+
+
+@dataclass(frozen=True)
+class Table:
+    """
+    Piecewise constant minute cost over ``[0, span)`` minutes.
+
+    ``bounds[i]`` is where segment ``i`` starts, ``rates[i]`` its minute cost,
+    ``costs[i]`` / ``charged[i]`` the cost and charged minutes accumulated
+    before it. Segments without a band cost nothing.
+    """
+
+    span: int
+    bounds: tuple[int, ...]
+    rates: tuple[float, ...]
+    costs: tuple[float, ...]
+    charged: tuple[int, ...]
+
+    @classmethod
+    def build(cls, span, bands):
+        """Build a table from ``(first, last, minute_cost)`` bands."""
+        bands = sorted(bands)
+        bounds, rates = [0], [0.0]
+        for first, last, minute_cost in bands:
+            if not 0 <= first < last <= span:
+                raise ValueError(f"Band {first}-{last} is out of range.")
+            if first < bounds[-1]:
+                raise ValueError(f"Band {first}-{last} overlaps another one.")
+
+            if first > bounds[-1]:
+                bounds.append(first)
+                rates.append(0.0)
+            bounds[-1], rates[-1] = first, float(minute_cost)
+            bounds.append(last)
+            rates.append(0.0)
+
+        if bounds[-1] == span:
+            bounds.pop()
+            rates.pop()
+
+        widths = [b - a for a, b in zip(bounds, [*bounds[1:], span])]
+        costs = accumulate(
+            (width * rate for width, rate in zip(widths, rates)), initial=0.0
+        )
+        charged = accumulate(
+            (width if rate else 0 for width, rate in zip(widths, rates)),
+            initial=0,
+        )
+        return cls(
+            span, tuple(bounds), tuple(rates), tuple(costs), tuple(charged)
+        )
+
+    def until(self, minute: int) -> tuple[float, int]:
+        """Cost and charged minutes of ``[0, minute)``, any minute >= 0."""
+        laps, minute = divmod(minute, self.span)
+        i = bisect_right(self.bounds, minute) - 1
+        rate = self.rates[i]
+        extra = minute - self.bounds[i]
+        return (
+            laps * self.costs[-1] + self.costs[i] + extra * rate,
+            laps * self.charged[-1] + self.charged[i] + (extra if rate else 0),
+        )
+
+    def between(self, first: int, last: int) -> tuple[float, int]:
+        cost_first, charged_first = self.until(first)
+        cost_last, charged_last = self.until(last)
+        return cost_last - cost_first, charged_last - charged_first
+
+    def rate_before(self, minute: int) -> float:
+        """Cost of the last charged minute before ``minute``, 0 if none."""
+        i = bisect_right(self.bounds, (minute - 1) % self.span) - 1
+        # Negative positions wrap around to the end of the span.
+        for position in range(i, i - len(self.rates), -1):
+            if self.rates[position]:
+                return self.rates[position]
+        return 0.0
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
+    """
+    A tariff plan ready to rate calls without touching the database.
+
+    Minutes are counted from 0001-01-01 00:00 (a Monday) on the wall clock of
+    the call start, so a call is rated with two bisect lookups in the weekly
+    table whatever the number of bands, plus one per holiday it crosses.
+    """
+
+    plan_id: int
+    initial_cost: float
+    week: Table
+    holiday: Table
+    holidays: tuple[int, ...]
+
+    @classmethod
+    def compile(cls, plan, bands, holidays=()):
+        """
+        Compile ``plan`` from its ``bands`` and holiday dates.
+
+        Holidays are rated with the ``HOLIDAY`` bands, or like a Sunday when
+        the plan has none.
+        """
+        week, holiday = [], []
+        for band in bands:
+            if band.day == TariffBand.Day.HOLIDAY:
+                holiday.append(
+                    (band.start_minute, band.end_minute, band.minute_cost)
+                )
+            else:
+                offset = band.day * MINUTES_PER_DAY
+                week.append(
+                    (
+                        offset + band.start_minute,
+                        offset + band.end_minute,
+                        band.minute_cost,
+                    )
+                )
+
+        if not holiday:
+            sunday = TariffBand.Day.SUNDAY * MINUTES_PER_DAY
+            holiday = [
+                (first - sunday, last - sunday, minute_cost)
+                for first, last, minute_cost in week
+                if first >= sunday
+            ]
+
+        return cls(
+            plan_id=plan.pk,
+            initial_cost=float(plan.initial_cost),
+            week=Table.build(MINUTES_PER_WEEK, week),
+            holiday=Table.build(MINUTES_PER_DAY, holiday),
+            holidays=tuple(sorted(day.toordinal() for day in holidays)),
+        )
+
+    def minutes(self, start: datetime, end: datetime) -> tuple[float, int]:
+        """
+        Cost and number of the charged minute steps from ``start`` to ``end``.
+
+        As with the global rate, a call ending on an earlier second than it
+        started gives back one charged minute: the last one before its end.
+        """
+        if timezone.is_aware(start):
+            start = timezone.localtime(start)
+        steps = minute_steps(start, end)
+
+        first = (
+            (start.toordinal() - FIRST_MONDAY) * MINUTES_PER_DAY
+            + start.hour * 60
+            + start.minute
+        )
+        last = first + steps
+        cost, charged = self.week.between(first, last)
+
+        lo = bisect_left(
+            self.holidays, first // MINUTES_PER_DAY + FIRST_MONDAY
+        )
+        hi = bisect_right(
+            self.holidays, (last - 1) // MINUTES_PER_DAY + FIRST_MONDAY
+        )
+        for ordinal in self.holidays[lo:hi]:
+            day = (ordinal - FIRST_MONDAY) * MINUTES_PER_DAY
+            overlap = max(first, day), min(last, day + MINUTES_PER_DAY)
+            week_cost, week_charged = self.week.between(*overlap)
+            holiday_cost, holiday_charged = self.holiday.between(
+                *(minute - day for minute in overlap)
+            )
+            cost += holiday_cost - week_cost
+            charged += holiday_charged - week_charged
+
+        if steps and end.second < start.second:
+            day = (last - 1) // MINUTES_PER_DAY
+            if day + FIRST_MONDAY in self.holidays[lo:hi]:
+                cost -= self.holiday.rate_before(last - day * MINUTES_PER_DAY)
+            else:
+                cost -= self.week.rate_before(last)
+            charged -= 1
+
+        return cost, charged
+
+    def cost(self, start: datetime, end: datetime) -> float:
+        return self.initial_cost + self.minutes(start, end)[0]
+
+
+_plans = {}
+_default = {}
+
+
+def _expired(entry):
+    return entry is None or entry[0] < monotonic()
+
+
+def _expiry():
+    return monotonic() + settings.TARIFF_PLAN_CACHE_TIMEOUT
+
+
+def get_plan(pk) -> CompiledPlan:
+    """
+    Return the compiled plan ``pk``, compiling it on a cache miss.
+
+    Plans are kept per process. Changes made in this process drop them at
+    once, changes made elsewhere are picked up after
+    ``TARIFF_PLAN_CACHE_TIMEOUT`` seconds.
+    """
+    entry = _plans.get(pk)
+    if _expired(entry):
+        plan = TariffPlan.objects.get(pk=pk)
+        holidays = (
+            Holiday.objects.filter(
+                calendar_id=plan.holiday_calendar_id
+            ).values_list("date", flat=True)
+            if plan.holiday_calendar_id
+            else ()
+        )
+        entry = _expiry(), CompiledPlan.compile(
+            plan, plan.bands.all(), holidays
+        )
+        _plans[pk] = entry
+    return entry[1]
+
+
+def default_plan_id():
+    entry = _default.get(None)
+    if _expired(entry):
+        entry = _expiry(), (
+            TariffPlan.objects.filter(is_default=True)
+            .values_list("pk", flat=True)
+            .first()
+        )
+        _default[None] = entry
+    return entry[1]
+
+
+def plan_for(call):
+    """Plan to rate ``call`` with, ``None`` to use the global settings."""
+    pk = call.tariff_plan_id or default_plan_id()
+    return None if pk is None else get_plan(pk)
+
+
+@receiver(post_save, sender=TariffPlan)
+@receiver(post_delete, sender=TariffPlan)
+@receiver(post_save, sender=TariffBand)
+@receiver(post_delete, sender=TariffBand)
+@receiver(post_save, sender=HolidayCalendar)
+@receiver(post_delete, sender=HolidayCalendar)
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def invalidate(**kwargs):
+    _plans.clear()
+    _default.clear()
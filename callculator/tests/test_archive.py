@@ -0,0 +1,151 @@
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from callculator.archive import ArchivedPeriodError, open_archive
+from callculator.cache import billing_cache
+from callculator.models import Call
+from callculator.tests.test_records import CALLS, FIRST_END, PHONE_NUMBER
+
+OTHER_NUMBER = "1198765432"
+PARAMS = {"phone_number": PHONE_NUMBER, "dateref": "2024-01"}
+
+
+async def join(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+class TestArchive(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(ARCHIVE_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        calls = []
+        for source in (PHONE_NUMBER, OTHER_NUMBER, OTHER_NUMBER + "0"):
+            for position, (destination, duration, cost) in enumerate(CALLS):
+                call = Call(
+                    source=source,
+                    destination=destination,
+                    start=FIRST_END - timedelta(minutes=position),
+                    end=FIRST_END + timedelta(minutes=position % 4),
+                    duration=duration,
+                    cost=cost,
+                )
+                # As priced by a plan, not by the global rate band.
+                call.day_minutes, call.night_minutes = position, 1
+                calls.append(call)
+        Call.objects.bulk_create(calls)
+
+    def archive(self, *args):
+        stdout = StringIO()
+        call_command("archive_period", "2024-01", *args, stdout=stdout)
+        billing_cache().clear()
+        return stdout.getvalue()
+
+    def fetch(self, url: str, params: dict) -> bytes:
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        if getattr(response, "is_async", False):
+            return async_to_sync(join)(response.streaming_content)
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def responses(self) -> list[bytes]:
+        """Every rendering of the bill, by both billing endpoints."""
+        contents = []
+        for url in ("/callculator/billing/", "/callculator/async/billing/"):
+            for phone_number in (PHONE_NUMBER, OTHER_NUMBER, "11900000000"):
+                params = {**PARAMS, "phone_number": phone_number}
+                contents.append(self.fetch(url, params))
+                contents.append(self.fetch(url, {**params, "stream": "1"}))
+                contents.append(self.fetch(url, {**params, "summary": "1"}))
+
+            params = {**PARAMS, "page_size": 4}
+            while True:
+                content = self.fetch(url, params)
+                contents.append(content)
+                page = self.client.get(url, params).json()
+                if not page["next"]:
+                    break
+                params["cursor"] = page["next"]
+        return contents
+
+    def test_byte_identical(self):
+        expected = self.responses()
+        self.assertIn("Archived 27 calls of 3 subscribers", self.archive())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.responses(), expected)
+
+        # Blocks split between subscribers give the same bills.
+        self.archive("--force", "--block-rows=1")
+        Call.objects.all().delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.responses(), expected)
+
+    def test_lookup(self):
+        self.archive()
+        archive = open_archive(date(2024, 1, 1))
+
+        self.assertEqual(len(archive), 27)
+        self.assertEqual(len(archive.rows(PHONE_NUMBER)), len(CALLS))
+        self.assertEqual(archive.rows(PHONE_NUMBER[:-2]), [])
+        self.assertEqual(archive.rows(PHONE_NUMBER + "00"), [])
+        self.assertIsNone(open_archive(date(2024, 2, 1)))
+
+    def test_refusals(self):
+        with self.assertRaisesMessage(CommandError, "not a closed month"):
+            call_command("archive_period", date.today().strftime("%Y-%m"))
+
+        self.archive()
+        with self.assertRaisesMessage(CommandError, "--force"):
+            self.archive()
+
+    def test_archived_month_is_read_only(self):
+        self.archive()
+
+        call = Call.objects.filter(source=PHONE_NUMBER).first()
+        end = call.end
+        call.end += timedelta(minutes=1)
+        with self.assertRaises(ArchivedPeriodError):
+            call.save()
+        self.assertEqual(Call.objects.get(pk=call.pk).end, end)
+
+        url = "/callculator/callrecord/"
+        record = {"type": "END", "timestamp": "2024-01-20T12:10:00Z"}
+        self.client.post(url, {**record, "call_id": 999}, format="json")
+        start = {
+            "type": "START",
+            "timestamp": "2024-01-20T12:00:00Z",
+            "call_id": 999,
+            "source": PHONE_NUMBER,
+            "destination": OTHER_NUMBER,
+        }
+        response = self.client.post(url, start, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("2024-01", response.data["timestamp"])
+        self.assertIsNone(Call.objects.get(pk=999).start)
+
+        response = self.client.post(f"{url}bulk/", [start], format="json")
+        self.assertEqual(response.data["failed"], 1)
+
+        with self.assertRaisesMessage(CommandError, "2024-01"):
+            call_command("rerate", "--period=2024-01", stdout=StringIO())
+
+        # Other months are not affected.
+        start["timestamp"] = "2024-02-20T12:00:00Z"
+        record["timestamp"] = "2024-02-20T12:10:00Z"
+        self.client.post(url, {**record, "call_id": 1000}, format="json")
+        response = self.client.post(
+            url, {**start, "call_id": 1000}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,88 @@
+from asgiref.sync import sync_to_async
+from rest_framework.test import APITestCase
+
+from callculator.cache import billing_cache
+from callculator.models import Call, CallRecord
+from callculator.tests.test_views import END_RECORD, START_RECORD
+
+
+class TestAsyncViews(APITestCase):
+    def setUp(self):
+        billing_cache().clear()
+
+    async def post(self, data):
+        return await self.async_client.post(
+            "/callculator/async/callrecord/",
+            data,
+            content_type="application/json",
+        )
+
+    async def test_callrecord(self):
+        response = await self.post(START_RECORD)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["source"], "11987654321")
+
+        response = await self.post(END_RECORD)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["id"], (await CallRecord.objects.alatest("pk")).pk
+        )
+
+        call = await Call.objects.aget(pk=1)
+        self.assertAlmostEqual(call.cost, 0.36 + 60 * 0.09)
+        self.assertEqual(await CallRecord.objects.acount(), 2)
+
+    async def test_callrecord_validation(self):
+        response = await self.post({**START_RECORD, "source": "1234"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("source", response.json())
+
+        response = await self.async_client.post(
+            "/callculator/async/callrecord/",
+            "{",
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_billing_matches_sync_endpoint(self):
+        await self.post(START_RECORD)
+        await self.post(END_RECORD)
+        params = {"phone_number": "11987654321", "dateref": "2024-01"}
+
+        for extra in ({}, {"page_size": 1}, {"stream": "true"}):
+            await billing_cache().aclear()
+            expected = await self.async_client.get(
+                "/callculator/billing/", {**params, **extra}
+            )
+            await billing_cache().aclear()
+            response = await self.async_client.get(
+                "/callculator/async/billing/", {**params, **extra}
+            )
+
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                content = b"".join(
+                    [chunk async for chunk in response.streaming_content]
+                )
+                expected = await sync_to_async(b"".join)(
+                    expected.streaming_content
+                )
+                self.assertEqual(content, expected)
+            else:
+                self.assertEqual(response.content, expected.content)
+
+        response = await self.async_client.get(
+            "/callculator/async/billing/", params
+        )
+        etag = response["ETag"]
+        response = await self.async_client.get(
+            "/callculator/async/billing/",
+            params,
+            headers={"If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(
+            "/callculator/async/billing/", {"phone_number": "1"}
+        )
+        self.assertEqual(response.status_code, 400)
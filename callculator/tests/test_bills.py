@@ -0,0 +1,220 @@
+from datetime import date, datetime
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from callculator.bills import bill_lines, check, rebuild
+from callculator.cache import billing_cache
+from callculator.models import Call, MonthlyBill, MonthlyBillLine
+
+
+def aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class TestMonthlyBill(APITestCase):
+    def setUp(self):
+        billing_cache().clear()
+        self.call = Call.objects.create(
+            source="11987654321",
+            destination="21998765432",
+            start=aware(2024, 1, 10, 12, 0, 0),
+            end=aware(2024, 1, 10, 13, 0, 0),
+        )
+
+    def bill(self, period=date(2024, 1, 1)):
+        return MonthlyBill.objects.get(
+            pk=MonthlyBill.make_key("11987654321", period)
+        )
+
+    def records(self, period=date(2024, 1, 1)):
+        key = MonthlyBill.make_key("11987654321", period)
+        return list(bill_lines(key).values_list("record", flat=True))
+
+    def test_updated_when_call_completes(self):
+        Call.objects.create(
+            source="11987654321",
+            destination="21998765432",
+            start=aware(2024, 1, 5, 21, 50, 0),
+        )
+        bill = self.bill()
+        self.assertEqual(bill.call_count, 1)
+
+        call = Call.objects.get(end=None)
+        call.end = aware(2024, 1, 5, 22, 10, 0)
+        call.save()
+
+        bill = self.bill()
+        self.assertEqual(bill.call_count, 2)
+        self.assertEqual(
+            [record["cost"] for record in self.records()],
+            ["R$ 1,26", "R$ 5,76"],
+        )
+        self.assertAlmostEqual(bill.total_cost, 5.76 + 1.26)
+        self.assertEqual(list(check()), [])
+
+    def test_call_moves_between_bills(self):
+        call = Call.objects.get(pk=self.call.pk)
+        call.end = aware(2024, 2, 1, 0, 30, 0)
+        call.save()
+
+        self.assertEqual(self.bill().call_count, 0)
+        self.assertEqual(self.bill(date(2024, 2, 1)).call_count, 1)
+        self.assertEqual(list(check()), [])
+
+    def test_cost_does_not_grow_with_the_bill(self):
+        def save_call():
+            call = Call(
+                source="11987654321",
+                destination="21998765432",
+                start=aware(2024, 1, 20, 12, 0, 0),
+                end=aware(2024, 1, 20, 12, 10, 0),
+            )
+            with CaptureQueriesContext(connection) as queries:
+                call.save()
+            return len(queries)
+
+        queries = save_call()
+        Call.objects.bulk_create(
+            Call(
+                source="11987654321",
+                destination="21998765432",
+                start=aware(2024, 1, 2, 12, 0, 0),
+                end=aware(2024, 1, 2, 12, 1, minute),
+            )
+            for minute in range(50)
+        )
+        rebuild(date(2024, 1, 1))
+        self.assertEqual(self.bill().call_count, 52)
+
+        self.assertEqual(save_call(), queries)
+        self.assertEqual(self.bill().call_count, 53)
+        self.assertEqual(list(check()), [])
+
+    def test_call_not_saved_without_its_bill(self):
+        call = Call.objects.get(pk=self.call.pk)
+        call.end = aware(2024, 2, 1, 0, 30, 0)
+        with mock.patch(
+            "callculator.bills.apply_changes", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                call.save()
+
+        self.assertEqual(Call.objects.get(pk=self.call.pk).end, self.call.end)
+        self.assertEqual(list(check()), [])
+
+    def test_billing_reads_bill(self):
+        # Calls waiting for their bill and the version of the bill are
+        # looked up first
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/callculator/billing/",
+                {"phone_number": "11987654321", "dateref": "2024-01"},
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["records"][0]["cost"], "R$ 5,76")
+
+    def test_rebuild_and_check(self):
+        Call.objects.filter(pk=self.call.pk).update(cost=1.0)
+        self.assertEqual(
+            list(check()), [("11987654321:2024-01", "records differ")]
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("check_monthly_bills", stdout=StringIO())
+
+        MonthlyBill.objects.all().delete()
+        self.assertEqual(
+            list(check(date(2024, 1, 1))),
+            [("11987654321:2024-01", "missing")],
+        )
+
+        call_command("rebuild_monthly_bills", stdout=StringIO())
+        self.assertEqual(self.records()[0]["cost"], "R$ 1,00")
+        self.assertEqual(rebuild(date(2023, 12, 1)), 0)
+        call_command("check_monthly_bills", stdout=StringIO())
+
+
+class TestBillingCache(APITestCase):
+    url = "/callculator/billing/"
+    params = {"phone_number": "11987654321", "dateref": "2024-01"}
+
+    def setUp(self):
+        billing_cache().clear()
+        Call.objects.create(
+            pk=1,
+            source="11987654321",
+            destination="21998765432",
+            start=aware(2024, 1, 10, 12, 0, 0),
+            end=aware(2024, 1, 10, 13, 0, 0),
+        )
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, self.params)
+        etag = response["ETag"]
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+
+        # Each request only looks up pending calls and the bill's version
+        with self.assertNumQueries(6):
+            response = self.client.get(
+                self.url, self.params, HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 304)
+
+            response = self.client.get(
+                self.url,
+                self.params,
+                HTTP_IF_MODIFIED_SINCE=response["Last-Modified"],
+            )
+            self.assertEqual(response.status_code, 304)
+
+            response = self.client.get(
+                self.url, self.params, HTTP_IF_NONE_MATCH='"stale"'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_bill_changed_elsewhere_not_read_from_cache(self):
+        etag = self.client.get(self.url, self.params)["ETag"]
+
+        # Changed by another process, the cache of this one is left as is
+        line = MonthlyBillLine.objects.get(call_id=1)
+        line.record["cost"] = "R$ 1,00"
+        line.save()
+        MonthlyBill.objects.update(updated_at=timezone.now())
+
+        response = self.client.get(
+            self.url, self.params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["records"][0]["cost"], "R$ 1,00")
+
+    def test_late_end_invalidates_cached_month(self):
+        etag = self.client.get(self.url, self.params)["ETag"]
+
+        Call.objects.create(
+            pk=2,
+            source="11987654321",
+            destination="21998765432",
+            start=aware(2024, 1, 20, 12, 0, 0),
+        )
+        self.client.post(
+            "/callculator/callrecord/",
+            {"type": "END", "timestamp": "2024-01-20T12:10:00Z", "call_id": 2},
+            format="json",
+        )
+
+        response = self.client.get(
+            self.url, self.params, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["records"]), 2)
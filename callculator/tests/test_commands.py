@@ -0,0 +1,631 @@
+import gzip
+import json
+import tempfile
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase
+
+from callculator import partitions, queue, tariffs
+from callculator.bills import check, pending_calls
+from callculator.generator import Generator, Profile, copy_text
+from callculator.ingest import apply_records, ingest_record, supports_upsert
+from callculator.models import (
+    Call,
+    CallRecord,
+    MonthlyBill,
+    QueuedRecord,
+    TariffBand,
+    TariffPlan,
+)
+from callculator.tools import day_night_minutes
+
+RECORDS = [
+    {
+        "type": "START",
+        "timestamp": "2024-01-01T12:00:00Z",
+        "call_id": 1,
+        "source": "11987654321",
+        "destination": "21998765432",
+    },
+    {
+        "type": "START",
+        "timestamp": "2024-01-01T21:50:00Z",
+        "call_id": 2,
+        "source": "11987654321",
+        "destination": "21998765432",
+    },
+    {"type": "END", "timestamp": "2024-01-01T13:00:00Z", "call_id": 1},
+    {"type": "END", "timestamp": "2024-01-01T22:10:00Z", "call_id": 2},
+]
+
+
+class ImportCdrsCommandTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.directory.name) / name
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            path.write_text(content)
+        return str(path)
+
+    def call(self, *args, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            "import_cdrs", *args, stdout=stdout, stderr=stderr, **options
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_ndjson(self):
+        lines = [json.dumps(record) for record in RECORDS]
+        lines.insert(2, json.dumps({"type": "END", "call_id": 3}))
+        path = self.write("cdrs.ndjson", "\n".join(lines) + "\n")
+
+        stdout, stderr = self.call(path, chunk_size=2)
+
+        self.assertIn("Imported 4 records (1 skipped)", stdout)
+        self.assertIn("timestamp", stderr)
+        self.assertEqual(CallRecord.objects.count(), 4)
+        self.assertAlmostEqual(Call.objects.get(pk=1).cost, 0.36 + 60 * 0.09)
+        self.assertAlmostEqual(Call.objects.get(pk=2).cost, 0.36 + 10 * 0.09)
+
+    def test_skips_undecodable_lines(self):
+        lines = [json.dumps(record).encode() for record in RECORDS]
+        lines.insert(1, b'{"type": "END", "call_id": "\xff"}')
+        path = self.write("cdrs.ndjson", b"\n".join(lines) + b"\n")
+
+        stdout, stderr = self.call(path)
+
+        self.assertIn("Imported 4 records (1 skipped)", stdout)
+        self.assertIn("utf-8", stderr)
+        self.assertEqual(CallRecord.objects.count(), 4)
+
+    def test_csv_resumes_from_offset(self):
+        header = "type,timestamp,call_id,source,destination\n"
+        rows = [
+            f"{r['type']},{r['timestamp']},{r['call_id']},"
+            f"{r.get('source', '')},{r.get('destination', '')}\n"
+            for r in RECORDS
+        ]
+        path = self.write("cdrs.csv", header + "".join(rows))
+        offset = len(header) + len(rows[0]) + len(rows[1])
+
+        self.call(path, chunk_size=10, offset=offset)
+        self.assertEqual(CallRecord.objects.count(), 2)
+        self.assertFalse(Call.objects.filter(start__isnull=False).exists())
+
+        stdout, _ = self.call(path, chunk_size=1)
+        self.assertIn(f"offset {offset}", stdout)
+        self.assertEqual(CallRecord.objects.count(), 6)
+        self.assertAlmostEqual(Call.objects.get(pk=1).cost, 0.36 + 60 * 0.09)
+
+
+class RunRatingWorkerCommandTest(TestCase):
+    def test_drains_queue(self):
+        for record in reversed(RECORDS):
+            queue.enqueue(record)
+        queue.enqueue({"type": "END", "call_id": 3})
+
+        self.assertEqual(queue.stats()["depth"], 5)
+
+        stdout = StringIO()
+        call_command(
+            "run_rating_worker", once=True, batch_size=2, stdout=stdout
+        )
+
+        self.assertIn("Applied 2 records", stdout.getvalue())
+        self.assertEqual(queue.stats(), {"depth": 0, "lag": 0.0})
+        self.assertEqual(CallRecord.objects.count(), 4)
+        self.assertAlmostEqual(Call.objects.get(pk=2).cost, 0.36 + 10 * 0.09)
+
+        failed = QueuedRecord.objects.get()
+        self.assertIn("timestamp", failed.error)
+
+    def test_records_pending_calls(self):
+        if not supports_upsert():
+            self.skipTest("Records are written without upserts")
+        for record in RECORDS[::2]:
+            ingest_record(record)
+
+        stdout = StringIO()
+        call_command("run_rating_worker", once=True, stdout=stdout)
+
+        self.assertIn("Recorded 1 calls on their bills", stdout.getvalue())
+        self.assertFalse(pending_calls().exists())
+        self.assertEqual(MonthlyBill.objects.get().call_count, 1)
+        self.assertEqual(list(check()), [])
+
+        for record in RECORDS:
+            queue.enqueue(record)
+
+        def apply(records):
+            call_ids = {data["call_id"] for data in records}
+            if 1 in call_ids:
+                raise OperationalError("deadlock detected")
+            if 2 in call_ids:
+                raise ValueError("Bands of plan 1 overlap")
+            return apply_records(records)
+
+        with mock.patch("callculator.queue.apply_records", apply):
+            self.assertEqual(queue.process_batch(10), (0, 2))
+
+        # Records of call 1 are still pending, those of call 2 failed.
+        self.assertEqual(queue.stats()["depth"], 2)
+        self.assertEqual(
+            QueuedRecord.objects.filter(error__isnull=False).count(), 2
+        )
+        self.assertIn(
+            "overlap",
+            QueuedRecord.objects.exclude(error=None)[0].error[
+                "non_field_errors"
+            ][0],
+        )
+
+        self.assertEqual(queue.process_batch(10), (2, 0))
+        self.assertAlmostEqual(Call.objects.get(pk=1).cost, 0.36 + 60 * 0.09)
+
+
+def partitioned() -> bool:
+    return partitions.is_partitioned(partitions.PARTITIONED_TABLES[0])
+
+
+class PartitionsCommandTest(TestCase):
+    def setUp(self):
+        apply_records(RECORDS)
+        apply_records(
+            [
+                {
+                    "type": "START",
+                    "timestamp": "2024-02-01T12:00:00Z",
+                    "call_id": 3,
+                    "source": "11987654321",
+                    "destination": "21998765432",
+                }
+            ]
+        )
+
+    def call(self, *args):
+        stdout = StringIO()
+        call_command("partitions", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_periods(self):
+        self.assertEqual(
+            dict(Call.objects.values_list("pk", "period")),
+            {1: date(2024, 1, 1), 2: date(2024, 1, 1), 3: None},
+        )
+        self.assertEqual(
+            set(CallRecord.objects.values_list("call_id", "period")),
+            {(1, date(2024, 1, 1)), (2, date(2024, 1, 1)), (3, None)},
+        )
+
+    def test_records_follow_their_call(self):
+        apply_records(
+            [
+                {
+                    "type": "END",
+                    "timestamp": "2024-02-10T12:00:00Z",
+                    "call_id": 1,
+                }
+            ]
+        )
+        self.assertEqual(
+            set(CallRecord.objects.filter(call_id=1).values_list("period")),
+            {(date(2024, 2, 1),)},
+        )
+
+        call = Call.objects.get(pk=2)
+        call.end = datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+        call.save()
+        self.assertEqual(
+            set(CallRecord.objects.filter(call_id=2).values_list("period")),
+            {(date(2024, 3, 1),)},
+        )
+
+    def test_not_partitioned(self):
+        if partitioned():
+            self.skipTest("Partitioned call tables")
+        self.assertIn("needs PostgreSQL", self.call("create", "--months=2"))
+        self.assertIn("needs PostgreSQL", self.call("list"))
+        with self.assertRaisesMessage(CommandError, "--drop"):
+            self.call("detach", "--period=2024-01")
+
+    def test_drop_deletes_the_month(self):
+        if partitioned():
+            self.skipTest("Partitioned call tables")
+        stdout = self.call("detach", "--period=2024-01", "--drop")
+
+        self.assertIn("Deleted 2 calls and 4 call records of 2024-01", stdout)
+        self.assertEqual(list(Call.objects.values_list("pk", flat=True)), [3])
+        self.assertEqual(CallRecord.objects.count(), 1)
+
+    def test_detach(self):
+        if not partitioned():
+            self.skipTest("Call tables are not partitioned")
+        with self.assertRaisesMessage(CommandError, "No partitions"):
+            self.call("detach", "--period=2024-01")
+
+        # Only upcoming months are created by the command.
+        for table in partitions.PARTITIONED_TABLES:
+            partitions.create_partition(table, date(2024, 1, 1))
+        self.assertIn(
+            "callculator_call_p2024_01\t2024-01-01", self.call("list")
+        )
+        self.assertEqual(
+            Call.objects.filter(period=date(2024, 1, 1)).count(), 2
+        )
+
+        self.assertIn(
+            "Created 8 partitions", self.call("create", "--months=3")
+        )
+        self.assertIn(
+            "Created 0 partitions", self.call("create", "--months=3")
+        )
+
+        self.assertIn(
+            "Dropped the partitions of 2024-01",
+            self.call("detach", "--period=2024-01", "--drop"),
+        )
+        self.assertEqual(list(Call.objects.values_list("pk", flat=True)), [3])
+        self.assertEqual(CallRecord.objects.count(), 1)
+        self.assertNotIn("p2024_01", self.call("list"))
+
+
+def apply_subscribers():
+    """Apply ``RECORDS`` for their subscriber and for two more."""
+    apply_records(RECORDS)
+    for offset, source in ((10, "1133334444"), (20, "2133334444")):
+        apply_records(
+            [
+                {
+                    **record,
+                    "call_id": record["call_id"] + offset,
+                    **({"source": source} if "source" in record else {}),
+                }
+                for record in RECORDS
+            ]
+        )
+
+
+def skip_in_memory_database(test_case):
+    # Worker processes open their own connections, which can't reach it.
+    if connection.vendor == "sqlite" and connection.is_in_memory_db():
+        test_case.skipTest("Workers can't share an in-memory database")
+
+
+class BillRunCommandTest(TestCase):
+    def setUp(self):
+        apply_subscribers()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = Path(directory.name)
+
+    def call(self, *args):
+        stdout = StringIO()
+        call_command(
+            "bill_run",
+            "--period=2024-01",
+            f"--output={self.output}",
+            "--shards=2",
+            *args,
+            stdout=stdout,
+        )
+        return stdout.getvalue()
+
+    def invoices(self, pattern="*.ndjson"):
+        return [
+            json.loads(line)
+            for path in sorted(self.output.glob(pattern))
+            for line in path.read_text().splitlines()
+        ]
+
+    def test_invoices_match_endpoint(self):
+        self.assertIn("Wrote 3 invoices (6 calls)", self.call())
+
+        invoices = self.invoices()
+        self.assertEqual(
+            [invoice["phone_number"] for invoice in invoices],
+            ["1133334444", "11987654321", "2133334444"],
+        )
+        for invoice in invoices:
+            response = self.client.get(
+                "/callculator/billing/",
+                {
+                    "phone_number": invoice["phone_number"],
+                    "dateref": "2024-01",
+                },
+            )
+            self.assertEqual(invoice, response.json())
+
+    def test_resume(self):
+        self.call()
+        expected = self.invoices()
+        last = sorted(self.output.glob("*.ndjson"))[-1]
+        last.unlink()
+
+        for args in (["--shards=5"], ["--compress"]):
+            with self.assertRaisesMessage(CommandError, "--shards=2,"):
+                self.call(*args)
+
+        # Without --shards, the run resumes with those it was planned with.
+        stdout = StringIO()
+        call_command(
+            "bill_run",
+            "--period=2024-01",
+            f"--output={self.output}",
+            stdout=stdout,
+        )
+        stdout = stdout.getvalue()
+        self.assertIn("1 shards already written", stdout)
+        self.assertIn("Wrote 1 invoices", stdout)
+        self.assertEqual(self.invoices(), expected)
+
+    def test_compress(self):
+        self.call()
+        expected = self.invoices()
+
+        self.call("--restart", "--compress")
+        self.assertEqual(self.invoices(), [])
+        self.assertEqual(
+            [
+                json.loads(line)
+                for path in sorted(self.output.glob("*.ndjson.gz"))
+                for line in gzip.decompress(path.read_bytes()).splitlines()
+            ],
+            expected,
+        )
+
+
+class BillRunWorkersTest(TransactionTestCase):
+    def setUp(self):
+        skip_in_memory_database(self)
+        apply_subscribers()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = Path(directory.name)
+
+    def bills(self, output, *args):
+        call_command(
+            "bill_run",
+            "--period=2024-01",
+            f"--output={output}",
+            "--shards=3",
+            *args,
+            stdout=StringIO(),
+        )
+        return [path.read_text() for path in sorted(output.glob("*.ndjson"))]
+
+    def test_workers(self):
+        expected = self.bills(self.output / "single")
+
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(
+            self.bills(self.output / "pool", "--workers=2"), expected
+        )
+
+
+class RerateCommandTest(TestCase):
+    def setUp(self):
+        apply_records(RECORDS)
+        plan = TariffPlan.objects.create(
+            name="flat", initial_cost=0.5, is_default=True
+        )
+        TariffBand.objects.create(
+            plan=plan,
+            day=TariffBand.Day.MONDAY,
+            start_minute=0,
+            end_minute=24 * 60,
+            minute_cost=0.01,
+        )
+        self.addCleanup(tariffs.invalidate)
+
+    def call(self, **options):
+        stdout = StringIO()
+        call_command("rerate", "--period=2024-01", stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_dry_run(self):
+        stdout = self.call(dry_run=True)
+
+        self.assertIn("Old total 7.02, new total 1.80", stdout)
+        self.assertIn("Would change 2 of 2 calls", stdout)
+        self.assertAlmostEqual(Call.objects.get(pk=1).cost, 0.36 + 60 * 0.09)
+
+    def test_rerate(self):
+        stdout = self.call(chunk_size=1)
+
+        self.assertIn("Changed 2 of 2 calls", stdout)
+        self.assertAlmostEqual(Call.objects.get(pk=1).cost, 0.5 + 60 * 0.01)
+        self.assertAlmostEqual(Call.objects.get(pk=2).cost, 0.5 + 20 * 0.01)
+        self.assertAlmostEqual(MonthlyBill.objects.get().total_cost, 1.8)
+
+        self.assertIn("Changed 0 of 2 calls", self.call())
+
+
+class RerateWorkersTest(TransactionTestCase):
+    def setUp(self):
+        skip_in_memory_database(self)
+        apply_subscribers()
+        plan = TariffPlan.objects.create(
+            name="flat", initial_cost=0.5, is_default=True
+        )
+        TariffBand.objects.create(
+            plan=plan,
+            day=TariffBand.Day.MONDAY,
+            start_minute=0,
+            end_minute=24 * 60,
+            minute_cost=0.01,
+        )
+        self.addCleanup(tariffs.invalidate)
+
+    def test_workers(self):
+        stdout = StringIO()
+        call_command(
+            "rerate", "--period=2024-01", "--workers=2", stdout=stdout
+        )
+
+        self.assertIn("Changed 6 of 6 calls", stdout.getvalue())
+        bills = MonthlyBill.objects.values_list("phone_number", "total_cost")
+        self.assertEqual(len(bills), 3)
+        for phone_number, total_cost in bills:
+            self.assertAlmostEqual(total_cost, 1.8, msg=phone_number)
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_output_and_compare(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = Path(directory.name) / "results.json"
+
+        call_command(
+            "benchmark",
+            "rating",
+            size=50,
+            output=str(output),
+            stdout=StringIO(),
+        )
+        results = json.loads(output.read_text())
+        self.assertEqual(results["suites"]["rating"]["scalar"]["calls"], 50)
+
+        stdout = StringIO()
+        call_command(
+            "benchmark",
+            "rating",
+            size=50,
+            compare=str(output),
+            threshold=10,
+            stdout=stdout,
+        )
+        self.assertIn("No case regressed", stdout.getvalue())
+
+        for result in results["suites"]["rating"].values():
+            result["calls_per_second"] *= 100
+        output.write_text(json.dumps(results))
+
+        stderr = StringIO()
+        with self.assertRaisesMessage(CommandError, "regressed"):
+            call_command(
+                "benchmark",
+                "rating",
+                size=50,
+                compare=str(output),
+                stdout=StringIO(),
+                stderr=stderr,
+            )
+        self.assertIn("rating.scalar:", stderr.getvalue())
+
+
+class GenerateCdrsCommandTest(TestCase):
+    def test_generator_is_deterministic(self):
+        profile = Profile(subscribers=50, calls_per_subscriber=20, seed=3)
+        calls = list(Generator(profile))
+
+        self.assertEqual(len(calls), 1000)
+        self.assertEqual(calls, list(Generator(profile)))
+        self.assertNotEqual(calls, list(Generator(Profile(seed=4))))
+        self.assertEqual(calls[0][1], "11000000000")
+        self.assertEqual(calls[-1][1], "11000000049")
+
+    def test_copy_text(self):
+        self.assertEqual(
+            [
+                copy_text(value)
+                for value in (
+                    None,
+                    "a\\b\tc\nd\r",
+                    timedelta(days=1, seconds=5, microseconds=7),
+                    datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+                    date(2024, 1, 1),
+                    0.5,
+                )
+            ],
+            [
+                r"\N",
+                r"a\\b\tc\nd\r",
+                "1 days 5 seconds 7 microseconds",
+                "2024-01-01T00:00:00+00:00",
+                "2024-01-01",
+                "0.5",
+            ],
+        )
+
+    def test_boundary_share(self):
+        profile = Profile(boundary_share=1, orphan_share=0, long_share=0)
+        rate_start, rate_end = 6 * 3600, 22 * 3600
+
+        for _, _, _, start, end in Generator(profile):
+            start, end = start % 86_400, (end - 1) % 86_400 + 1
+            crossed = [
+                boundary
+                for boundary in (rate_start, rate_end)
+                if start < boundary <= end
+            ]
+            self.assertTrue(crossed or end < start)
+
+    def test_load(self):
+        stdout = StringIO()
+        call_command(
+            "generate_cdrs",
+            subscribers=20,
+            calls_per_subscriber=5,
+            orphan_share=0.2,
+            batch_size=30,
+            stdout=stdout,
+        )
+
+        self.assertIn("Generated", stdout.getvalue())
+        self.assertEqual(Call.objects.count(), 100)
+        orphans = Call.objects.filter(end__isnull=True).count()
+        self.assertGreater(orphans, 0)
+        self.assertEqual(CallRecord.objects.count(), 200 - orphans)
+        self.assertEqual(list(check()), [])
+
+        self.assertFalse(
+            CallRecord.objects.filter(call__end__isnull=False)
+            .exclude(period=F("call__period"))
+            .exists()
+        )
+
+        completed = list(Call.objects.filter(end__isnull=False))
+        self.assertEqual(
+            [(call.day_minutes, call.night_minutes) for call in completed],
+            [day_night_minutes(call.start, call.end) for call in completed],
+        )
+
+        call = completed[0]
+        cost, month = call.cost, call.period
+        call.rate()
+        self.assertAlmostEqual(call.cost, cost)
+        self.assertEqual(call.period, month)
+
+    def test_ndjson(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "cdrs.ndjson"
+
+        call_command(
+            "generate_cdrs",
+            subscribers=10,
+            calls_per_subscriber=3,
+            orphan_share=0,
+            out_of_order_share=1,
+            output=str(path),
+            stdout=StringIO(),
+        )
+
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        self.assertEqual(len(records), 60)
+        self.assertEqual(records[0]["type"], "END")
+        self.assertEqual(records[1]["type"], "START")
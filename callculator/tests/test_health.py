@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.db import DatabaseError, connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from callculator import health
+from callculator.models import QueuedRecord
+
+
+def fail(execute, sql, params, many, context):
+    raise DatabaseError("unreachable")
+
+
+@override_settings(HEALTH_CHECK_BACKGROUND=False, HEALTH_CHECK_INTERVAL=60)
+class TestHealth(APITestCase):
+    def setUp(self):
+        health.readiness.checked = None
+
+    def test_livez(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/callculator/livez/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "OK")
+
+    def test_readyz(self):
+        response = self.client.get("/callculator/readyz/")
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload["status"], "OK")
+        self.assertEqual(payload["database"]["status"], "OK")
+        self.assertGreater(payload["database"]["latency_ms"], 0)
+        self.assertEqual(
+            payload["migrations"], {"status": "OK", "unapplied": []}
+        )
+        self.assertEqual(payload["queue"], {"status": "OK", "lag": 0.0})
+
+        # Cached until the next interval
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                response = self.client.get("/callculator/readyz/")
+                self.client.get("/callculator/health_check/")
+        self.assertEqual(response.json()["checked_at"], payload["checked_at"])
+
+    @override_settings(HEALTH_CHECK_MAX_QUEUE_LAG=60)
+    def test_queue_lag(self):
+        QueuedRecord.objects.create(payload={})
+        QueuedRecord.objects.update(
+            received_at=timezone.now() - timedelta(minutes=5)
+        )
+
+        response = self.client.get("/callculator/readyz/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["queue"]["status"], "FAIL")
+        self.assertGreaterEqual(response.json()["queue"]["lag"], 300)
+
+    def test_database_failure(self):
+        with connection.execute_wrapper(fail):
+            response = self.client.get("/callculator/readyz/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response.json()["database"],
+            {"status": "FAIL", "error": "DatabaseError"},
+        )
+
+        response = self.client.get("/callculator/health_check/")
+        self.assertEqual(response.json()["database"], "FAIL (DatabaseError)")
@@ -0,0 +1,153 @@
+import re
+
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from callculator import metrics, queue
+from callculator.tests.test_views import END_RECORD, START_RECORD
+
+
+def sample(text, name, **labels):
+    """Value of the ``name`` sample having at least ``labels``, else 0."""
+    for line in text.splitlines():
+        match = re.fullmatch(r"(\w+)(?:\{(.*)\})? (\S+)", line)
+        if not match or match[1] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match[2] or ""))
+        if all(found.get(key) == str(value) for key, value in labels.items()):
+            return float(match[3])
+    return 0.0
+
+
+class TestMetrics(APITestCase):
+    url = "/callculator/metrics"
+
+    def scrape(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        return response.content.decode()
+
+    @override_settings(HEALTH_CHECK_BACKGROUND=False)
+    def test_endpoints(self):
+        before = self.scrape()
+
+        self.client.get("/callculator/health_check/")
+        self.client.post("/callculator/callrecord/", START_RECORD, "json")
+        self.client.post("/callculator/callrecord/", END_RECORD, "json")
+        self.client.post(
+            "/callculator/callrecord/",
+            {**END_RECORD, "timestamp": "yesterday"},
+            "json",
+        )
+        self.client.get(
+            "/callculator/billing/",
+            {"phone_number": "11987654321", "dateref": "2024-01"},
+        )
+        after = self.scrape()
+
+        def delta(name, **labels):
+            return sample(after, name, **labels) - sample(
+                before, name, **labels
+            )
+
+        self.assertEqual(
+            delta(
+                "callculator_requests_total",
+                endpoint="callrecord",
+                method="POST",
+                status=200,
+            ),
+            2,
+        )
+        self.assertEqual(
+            delta(
+                "callculator_requests_total", endpoint="callrecord", status=400
+            ),
+            1,
+        )
+        self.assertEqual(
+            delta(
+                "callculator_request_duration_seconds_count",
+                endpoint="health_check",
+            ),
+            1,
+        )
+        self.assertEqual(
+            delta(
+                "callculator_request_duration_seconds_bucket",
+                endpoint="billing",
+                le="+Inf",
+            ),
+            1,
+        )
+        self.assertGreater(
+            delta("callculator_db_queries_sum", endpoint="billing"), 0
+        )
+        self.assertEqual(
+            delta("callculator_rating_calls_total", endpoint="callrecord"), 1
+        )
+        self.assertEqual(
+            delta(
+                "callculator_ingest_records_total",
+                endpoint="callrecord",
+                type="END",
+            ),
+            1,
+        )
+        self.assertEqual(
+            delta(
+                "callculator_ingest_failures_total",
+                endpoint="callrecord",
+                reason="timestamp",
+            ),
+            1,
+        )
+
+    def test_queued_records_counted_once(self):
+        before = self.scrape()
+        self.client.post(
+            "/callculator/callrecord/queue/", START_RECORD, "json"
+        )
+        queue.process_batch(10)
+        after = self.scrape()
+
+        name = "callculator_ingest_records_total"
+        self.assertEqual(
+            sum(
+                sample(after, name, endpoint=endpoint, type="START")
+                - sample(before, name, endpoint=endpoint, type="START")
+                for endpoint in ("callrecord_queue", "other")
+            ),
+            1,
+        )
+
+    def test_render_histogram(self):
+        labels = (("endpoint", 'say "hi"'),)
+        for value in (0, 3, 1000):
+            metrics.observe("callculator_db_queries", labels, value)
+
+        text = metrics.render()
+        prefix = 'callculator_db_queries_bucket{endpoint="say \\"hi\\"",'
+        self.assertIn(prefix + 'le="0"} 1\n', text)
+        self.assertIn(prefix + 'le="5"} 2\n', text)
+        self.assertIn(prefix + 'le="200"} 2\n', text)
+        self.assertIn(prefix + 'le="+Inf"} 3\n', text)
+        self.assertIn("# TYPE callculator_db_queries histogram\n", text)
+
+    def test_connections(self):
+        samples = metrics.pool_samples()
+        if "pool" in connection.settings_dict["OPTIONS"]:
+            self.assertGreater(
+                samples[("callculator_db_pool_size", (("alias", "default"),))],
+                0,
+            )
+        else:
+            self.assertEqual(samples, {})
+        text = metrics.render()
+        self.assertGreater(
+            sample(text, "callculator_db_connections_total", alias="default"),
+            0,
+        )
+        self.assertIn("# TYPE callculator_db_pool_waiting gauge\n", text)
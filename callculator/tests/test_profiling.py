@@ -0,0 +1,103 @@
+import tempfile
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from callculator import profiling
+
+
+class TestProfiling(APITestCase):
+    billing = {"phone_number": "11987654321", "dateref": "2024-01"}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_TOKEN="secret",
+            PROFILING_DIR=directory.name,
+            PROFILING_SAMPLE_RATE=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_profile_on_demand(self):
+        response = self.client.get(
+            "/callculator/billing/", self.billing, HTTP_X_PROFILE="secret"
+        )
+        self.assertEqual(response.status_code, 200)
+        profile_id = response["X-Profile-Id"]
+        self.assertIn("billing", profile_id)
+        self.assertEqual(profiling.captures(), [profile_id])
+
+        summary = self.client.get(
+            f"/callculator/profiles/{profile_id}.txt",
+            HTTP_X_PROFILE="secret",
+        )
+        text = b"".join(summary.streaming_content).decode()
+        self.assertIn("GET /callculator/billing/", text)
+        self.assertIn("cumulative", text)
+        self.assertIn("(billing)", text)
+
+        download = self.client.get(
+            response["X-Profile-Url"], {"profile": "secret"}
+        )
+        self.assertEqual(download.status_code, 200)
+        self.assertIn("attachment", download["Content-Disposition"])
+
+    async def test_async_requests(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(
+            iscoroutinefunction(profiling.ProfilingMiddleware(view))
+        )
+
+        response = await self.async_client.get(
+            "/callculator/async/billing/",
+            self.billing,
+            headers={"X-Profile": "secret"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("async", response["X-Profile-Id"])
+        self.assertEqual(
+            await sync_to_async(profiling.captures)(),
+            [response["X-Profile-Id"]],
+        )
+
+    def test_requires_token(self):
+        response = self.client.get(
+            "/callculator/billing/", self.billing, HTTP_X_PROFILE="wrong"
+        )
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(profiling.captures(), [])
+        self.assertEqual(
+            self.client.get("/callculator/profiles/").status_code, 404
+        )
+
+        listing = self.client.get(
+            "/callculator/profiles/", HTTP_X_PROFILE="secret"
+        )
+        self.assertEqual(listing.json(), {"profiles": []})
+
+    def test_sampling(self):
+        with override_settings(
+            PROFILING_SAMPLE_RATE=1, HEALTH_CHECK_BACKGROUND=False
+        ):
+            response = self.client.get("/callculator/health_check/")
+        self.assertIn("X-Profile-Id", response)
+
+    def test_disabled(self):
+        with override_settings(PROFILING_ENABLED=False):
+            response = self.client.get(
+                "/callculator/billing/", self.billing, HTTP_X_PROFILE="secret"
+            )
+            self.assertNotIn("X-Profile-Id", response)
+            self.assertEqual(
+                self.client.get(
+                    "/callculator/profiles/", HTTP_X_PROFILE="secret"
+                ).status_code,
+                404,
+            )
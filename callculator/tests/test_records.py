@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from callculator import records
+from callculator.cache import billing_cache
+from callculator.models import Call
+from callculator.serializers import CallSerializer
+
+PHONE_NUMBER = "11987654321"
+FIRST_END = timezone.make_aware(datetime(2024, 1, 10, 12, 0, 0))
+
+# (destination, duration, cost) of calls covering the edge cases of
+# CallSerializer: missing and zero values, sub-second durations, costs
+# needing rounding and thousands separators, and odd characters.
+CALLS = [
+    ("21998765432", timedelta(minutes=5, seconds=3), 0.81),
+    ("21998765432", timedelta(0), 0),
+    ("21998765432", None, None),
+    ("21998765432", timedelta(seconds=59, microseconds=999_999), 0.365),
+    ("21998765432", timedelta(days=2, hours=3, seconds=4), 1234567.891),
+    ("21998765432", timedelta(hours=1), 999.995),
+    ("21998765432", timedelta(seconds=1), -12.5),
+    ('a\u00e7\u00e3o \x01"\\', timedelta(seconds=10), 1e-9),
+    ("\u2028", timedelta(microseconds=1), 1e21),
+]
+
+
+def golden(calls) -> bytes:
+    """Records as rendered by CallSerializer, the reference output."""
+    return JSONRenderer().render(CallSerializer(calls, many=True).data)
+
+
+def golden_stream(calls) -> bytes:
+    """Records as the streamed bill used to write them."""
+    serializer = CallSerializer()
+    return (
+        b"["
+        + ",".join(
+            records.encode(serializer.to_representation(call))
+            for call in calls
+        ).encode()
+        + b"]"
+    )
+
+
+class TestCallRecords(APITestCase):
+    def setUp(self):
+        billing_cache().clear()
+        Call.objects.bulk_create(
+            Call(
+                source=PHONE_NUMBER,
+                destination=destination,
+                start=FIRST_END
+                - timedelta(minutes=position, microseconds=position * 7),
+                end=FIRST_END + timedelta(minutes=position),
+                duration=duration,
+                cost=cost,
+            )
+            for position, (destination, duration, cost) in enumerate(CALLS)
+        )
+        self.calls = Call.objects.order_by("end", "id")
+
+    def rows(self):
+        return self.calls.values_list(*records.RECORD_COLUMNS)
+
+    def test_same_bytes_as_serializer(self):
+        rendered = [records.call_record(*row) for row in self.rows()]
+        self.assertEqual(
+            JSONRenderer().render(rendered), golden(list(self.calls))
+        )
+
+    def test_dumps(self):
+        rendered = [records.call_record(*row) for row in self.rows()]
+        expected = golden_stream(list(self.calls))
+        self.assertEqual(records.dumps(rendered), expected)
+
+        self.addCleanup(setattr, records, "orjson", records.orjson)
+        records.orjson = None
+        self.assertEqual(records.dumps(rendered), expected)
+
+    def test_unsaved_call(self):
+        call = Call(
+            destination="21998765432",
+            start=FIRST_END,
+            duration=timedelta(minutes=2),
+            cost=0.54,
+        )
+        self.assertEqual(
+            JSONRenderer().render([records.record_of(call)]), golden([call])
+        )
+
+    def test_endpoint(self):
+        params = {"phone_number": PHONE_NUMBER, "dateref": "2024-01"}
+        expected = golden(list(self.calls))
+
+        for extra in ({}, {"page_size": 100}):
+            content = self.client.get(
+                "/callculator/billing/", {**params, **extra}
+            ).content
+            self.assertIn(b'"records":' + expected, content)
+
+        response = self.client.get(
+            "/callculator/billing/", {**params, "stream": "1"}
+        )
+        content = b"".join(response.streaming_content)
+        self.assertIn(b'"records":' + golden_stream(list(self.calls)), content)
@@ -1,8 +1,14 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
 
+from django.db import connection
+from django.utils import timezone
 from rest_framework.test import APITestCase
 
-from callculator.models import Call, CallRecord
+from callculator import tariffs
+from callculator.bills import check, pending_calls, record_pending
+from callculator.ingest import supports_upsert
+from callculator.models import Call, CallRecord, MonthlyBill
 from callculator.serializers import (
     BillingResponseSerializer,
     CallRecordSerializer,
@@ -10,6 +16,9 @@ from callculator.serializers import (
     HealthCheckResponseSerializer,
 )
 
+# The savepoint of a record's transaction, tests run in one
+RECORD_OVERHEAD = 2
+
 FIXED_TIMESTAMP_START = datetime(2024, 1, 1, 12, 0, 0)
 FIXED_TIMESTAMP_END = datetime(2024, 1, 1, 13, 0, 0)
 
@@ -29,6 +38,8 @@ class TestHealthCheckResponseSerializer(APITestCase):
 
 class TestCallRecordSerializer(APITestCase):
     def setUp(self):
+        # Rating looks the default plan up once, not from an earlier test.
+        tariffs.invalidate()
         self.valid_start_data = {
             "type": "START",
             "timestamp": FIXED_TIMESTAMP_START.strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -63,6 +74,125 @@ class TestCallRecordSerializer(APITestCase):
         serializer.save()
         self.assertEqual(CallRecord.objects.count(), 1)
 
+    def requires_upsert(self):
+        if not supports_upsert():
+            self.skipTest("Records are written without upserts")
+
+    def save(self, data):
+        serializer = CallRecordSerializer(data=data)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def test_record_is_one_upsert_and_one_insert(self):
+        self.requires_upsert()
+
+        with self.assertNumQueries(2 + RECORD_OVERHEAD):
+            self.save(self.valid_end_data)
+
+        call = Call.objects.get(pk=1)
+        self.assertEqual(call.source, "")
+        self.assertIsNone(call.cost)
+
+        with self.assertNumQueries(2 + RECORD_OVERHEAD):
+            self.save({**self.valid_end_data, "call_id": 2})
+
+    def test_rated_once_both_ends_are_known(self):
+        self.requires_upsert()
+        self.save(self.valid_end_data)
+        # Looked up once per process
+        tariffs.default_plan_id()
+
+        # Its cost needs both ends, which only the upsert returns: completing
+        # a call takes one rating update in between. The bill and the period
+        # of its earlier records are brought up to date in batches.
+        with self.assertNumQueries(3 + RECORD_OVERHEAD) as queries:
+            self.save(self.valid_start_data)
+
+        statements = [query["sql"] for query in queries.captured_queries]
+        self.assertIn("ON CONFLICT", statements[1])
+        self.assertRegex(
+            statements[2],
+            r'^UPDATE .* SET "bill_pending" = .*, "duration" = .*, "cost" = ',
+        )
+        self.assertIn('INSERT INTO "callculator_callrecord"', statements[3])
+        self.assertEqual(
+            set(CallRecord.objects.values_list("period", flat=True)),
+            {None, date(2024, 1, 1)},
+        )
+        self.assertFalse(MonthlyBill.objects.exists())
+
+        self.assertEqual(record_pending(), 1)
+        self.assertEqual(
+            set(CallRecord.objects.values_list("period", flat=True)),
+            {date(2024, 1, 1)},
+        )
+        self.assertEqual(
+            MonthlyBill.objects.get(
+                pk=MonthlyBill.make_key("11987654321", date(2024, 1, 1))
+            ).call_count,
+            1,
+        )
+        self.assertFalse(pending_calls().exists())
+
+        call = Call.objects.get(pk=1)
+        self.assertEqual(call.source, "11987654321")
+        self.assertEqual(call.end, timezone.make_aware(FIXED_TIMESTAMP_END))
+        self.assertAlmostEqual(call.cost, 0.36 + 60 * 0.09)
+
+    def test_resent_records_move_the_call(self):
+        for data in [
+            self.valid_start_data,
+            self.valid_end_data,
+            {**self.valid_end_data, "timestamp": "2024-02-01T13:00:00Z"},
+            {**self.valid_start_data, "source": "11912345678"},
+        ]:
+            self.save(data)
+            record_pending()
+
+        self.assertEqual(
+            dict(MonthlyBill.objects.values_list("pk", "call_count")),
+            {
+                "11987654321:2024-01": 0,
+                "11987654321:2024-02": 0,
+                "11912345678:2024-02": 1,
+            },
+        )
+        self.assertEqual(list(check()), [])
+        self.assertEqual(
+            set(CallRecord.objects.values_list("period", flat=True)),
+            {date(2024, 2, 1)},
+        )
+
+    def test_record_is_all_or_nothing(self):
+        self.save(self.valid_end_data)
+        with mock.patch.object(
+            CallRecord.objects, "create", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.save(self.valid_start_data)
+
+        call = Call.objects.get(pk=1)
+        self.assertEqual(call.source, "")
+        self.assertIsNone(call.cost)
+        self.assertEqual(CallRecord.objects.count(), 1)
+
+    def test_pending_call_kept_until_recorded(self):
+        self.requires_upsert()
+        self.save(self.valid_end_data)
+        self.save(self.valid_start_data)
+
+        with mock.patch(
+            "callculator.bills.apply_changes", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                record_pending()
+
+        self.assertEqual(
+            list(pending_calls().values_list("pk", flat=True)), [1]
+        )
+        self.assertEqual(list(check()), [])
+        self.assertFalse(pending_calls().exists())
+
     def test_invalid_phone_number(self):
         invalid_data = self.valid_start_data.copy()
         invalid_data["source"] = "1234"  # Invalid phone number
@@ -118,3 +248,44 @@ class TestBillingResponseSerializer(APITestCase):
         self.assertEqual(data["phone_number"], "11987654321")
         self.assertEqual(len(data["records"]), 1)
         self.assertEqual(data["records"][0]["cost"], "R$ 5,76")
+
+    def test_month_range_boundaries(self):
+        for end in (
+            datetime(2023, 12, 31, 23, 59, 59),
+            datetime(2024, 1, 31, 23, 59, 59),
+            datetime(2024, 2, 1, 0, 0, 0),
+        ):
+            end = timezone.make_aware(end)
+            Call.objects.create(
+                source="11987654321",
+                destination="21998765432",
+                start=end - timedelta(minutes=1),
+                end=end,
+            )
+
+        calls = BillingResponseSerializer.get_filtered_calls(
+            "11987654321", date(2024, 1, 1)
+        )
+        self.assertEqual(calls.count(), 2)
+
+        calls = BillingResponseSerializer.get_filtered_calls(
+            "11987654321", date(2023, 12, 1)
+        )
+        self.assertEqual(calls.count(), 1)
+
+
+class TestBillingQueryPlan(APITestCase):
+    def explain(self):
+        return BillingResponseSerializer.get_filtered_calls(
+            "11987654321", date(2024, 1, 1)
+        ).explain()
+
+    @skipUnless(connection.vendor == "sqlite", "SQLite query plan")
+    def test_sqlite_uses_source_end_index(self):
+        self.assertIn("USING INDEX call_source_end_idx", self.explain())
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL query plan")
+    def test_postgresql_uses_source_end_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn("call_source_end_idx", self.explain())
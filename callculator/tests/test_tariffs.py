@@ -0,0 +1,276 @@
+import random
+from datetime import date, datetime, timedelta
+from importlib import import_module
+
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.forms.models import inlineformset_factory
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from callculator import tariffs
+from callculator.admin import TariffBandFormSet
+from callculator.models import (
+    Call,
+    Holiday,
+    HolidayCalendar,
+    TariffBand,
+    TariffPlan,
+)
+from callculator.tariffs import Table
+from callculator.tools import call_cost_calculator, payable_minutes
+
+WEEKDAYS = [day for day in TariffBand.Day if day != TariffBand.Day.HOLIDAY]
+
+
+def aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class TariffPlanTestCase(TestCase):
+    def setUp(self):
+        tariffs.invalidate()
+        self.addCleanup(tariffs.invalidate)
+
+    def make_plan(self, bands, **fields):
+        plan = TariffPlan.objects.create(
+            name=fields.pop("name", "plan"),
+            initial_cost=fields.pop("initial_cost", 0.36),
+            **fields,
+        )
+        TariffBand.objects.bulk_create(
+            TariffBand(
+                plan=plan,
+                day=day,
+                start_minute=a,
+                end_minute=b,
+                minute_cost=cost,
+            )
+            for day, a, b, cost in bands
+        )
+        tariffs.invalidate()
+        return plan
+
+
+class TableTest(TestCase):
+    def test_between(self):
+        table = Table.build(
+            100, [(10, 20, 1.0), (20, 30, 2.0), (50, 100, 0.5)]
+        )
+
+        self.assertEqual(table.between(0, 10), (0.0, 0))
+        self.assertEqual(table.between(15, 25), (15.0, 10))
+        self.assertEqual(table.between(0, 100), (55.0, 70))
+        self.assertEqual(table.between(95, 215), (62.5, 80))
+
+    def test_overlapping_bands(self):
+        with self.assertRaises(ValueError):
+            Table.build(100, [(10, 30, 1.0), (20, 40, 2.0)])
+
+
+class CompiledPlanTest(TariffPlanTestCase):
+    def test_matches_global_rate(self):
+        plan = self.make_plan(
+            [(day, 6 * 60, 22 * 60, 0.09) for day in WEEKDAYS]
+        )
+        compiled = tariffs.get_plan(plan.pk)
+        rng = random.Random(12)
+
+        for _ in range(1000):
+            start = aware(2024, 1, 1) + timedelta(
+                seconds=rng.randrange(365 * 86_400)
+            )
+            end = start + timedelta(seconds=rng.randrange(3 * 86_400))
+
+            self.assertAlmostEqual(
+                compiled.cost(start, end), call_cost_calculator(start, end)
+            )
+            self.assertEqual(
+                compiled.minutes(start, end)[1], payable_minutes(start, end)
+            )
+
+        # Ending on an earlier second than it started, at night
+        start, end = aware(2024, 1, 2, 2, 17, 51), aware(2024, 1, 2, 3, 27, 31)
+        self.assertAlmostEqual(
+            compiled.cost(start, end), call_cost_calculator(start, end)
+        )
+
+    def test_weekend_and_holidays(self):
+        calendar = HolidayCalendar.objects.create(name="BR")
+        Holiday.objects.create(calendar=calendar, date=date(2024, 1, 1))
+        plan = self.make_plan(
+            [
+                *((day, 0, 24 * 60, 0.10) for day in WEEKDAYS[:5]),
+                (TariffBand.Day.SATURDAY, 0, 24 * 60, 0.05),
+                (TariffBand.Day.SUNDAY, 0, 12 * 60, 0.02),
+            ],
+            initial_cost=0,
+            holiday_calendar=calendar,
+        )
+        compiled = tariffs.get_plan(plan.pk)
+
+        # Sunday 2023-12-31 23:00 to Tuesday 2024-01-02 01:00, with the
+        # Monday holiday rated like a Sunday.
+        cost, charged = compiled.minutes(
+            aware(2023, 12, 31, 23), aware(2024, 1, 2, 1)
+        )
+        self.assertEqual(charged, 12 * 60 + 60)
+        self.assertAlmostEqual(cost, 12 * 60 * 0.02 + 60 * 0.10)
+
+        # The minute given back on the holiday is a holiday minute.
+        cost, charged = compiled.minutes(
+            aware(2024, 1, 1, 10, 0, 30), aware(2024, 1, 1, 10, 10, 10)
+        )
+        self.assertEqual(charged, 9)
+        self.assertAlmostEqual(cost, 9 * 0.02)
+
+        # Friday 23:30 to Saturday 00:30
+        self.assertAlmostEqual(
+            compiled.cost(aware(2024, 1, 5, 23, 30), aware(2024, 1, 6, 0, 30)),
+            30 * 0.10 + 30 * 0.05,
+        )
+
+    def test_many_bands(self):
+        bands = [
+            (day, minute, minute + 30, (minute // 30) / 100)
+            for day in WEEKDAYS
+            for minute in range(0, 24 * 60, 30)
+        ]
+        compiled = tariffs.get_plan(self.make_plan(bands).pk)
+
+        cost = compiled.cost(
+            aware(2024, 1, 1, 0, 15), aware(2024, 1, 1, 1, 15)
+        )
+        self.assertAlmostEqual(cost, 0.36 + 15 * 0 + 30 * 0.01 + 15 * 0.02)
+
+
+class CallTariffPlanTest(TariffPlanTestCase):
+    def rate(self, **fields):
+        call = Call(
+            start=aware(2024, 1, 6, 10),
+            end=aware(2024, 1, 6, 10, 10),
+            **fields,
+        )
+        call.rate()
+        return call
+
+    def test_global_rate_without_plans(self):
+        call = self.rate()
+
+        self.assertIsNone(call.tariff_plan_id)
+        self.assertAlmostEqual(call.cost, 0.36 + 10 * 0.09)
+
+    def test_minutes_split_by_plan(self):
+        self.make_plan(
+            [(TariffBand.Day.SATURDAY, 10 * 60 + 5, 24 * 60, 0.01)],
+            is_default=True,
+        )
+        call = self.rate()
+
+        self.assertEqual((call.day_minutes, call.night_minutes), (5, 5))
+
+    def test_minutes_backfilled_by_plan(self):
+        self.make_plan(
+            [(TariffBand.Day.SATURDAY, 10 * 60 + 5, 24 * 60, 0.01)],
+            is_default=True,
+        )
+        call = self.rate()
+        Call.objects.bulk_create([call])
+        Call.objects.update(day_minutes=None, night_minutes=None)
+
+        name = "0008_call_minutes"
+        state = MigrationLoader(connection).project_state(
+            ("callculator", name)
+        )
+        import_module(f"callculator.migrations.{name}").set_minutes(
+            state.apps, None
+        )
+
+        self.assertEqual(
+            Call.objects.values_list("day_minutes", "night_minutes").get(),
+            (call.day_minutes, call.night_minutes),
+        )
+
+    def test_default_plan(self):
+        plan = self.make_plan(
+            [(TariffBand.Day.SATURDAY, 0, 24 * 60, 0.01)], is_default=True
+        )
+        call = self.rate()
+
+        self.assertIsNone(call.tariff_plan_id)
+        self.assertAlmostEqual(call.cost, 0.36 + 10 * 0.01)
+
+        # Calls without a plan follow the default one.
+        plan.is_default = False
+        plan.save()
+        self.make_plan(
+            [(TariffBand.Day.SATURDAY, 0, 24 * 60, 0.02)],
+            name="new",
+            is_default=True,
+        )
+        call.rate()
+        self.assertAlmostEqual(call.cost, 0.36 + 10 * 0.02)
+
+    def test_explicit_plan_and_invalidation(self):
+        self.make_plan([], name="default", is_default=True)
+        plan = self.make_plan(
+            [(TariffBand.Day.SATURDAY, 0, 24 * 60, 0.01)], name="weekend"
+        )
+        self.assertAlmostEqual(self.rate(tariff_plan=plan).cost, 0.46)
+
+        with self.assertNumQueries(0):
+            self.rate(tariff_plan=plan)
+
+        band = plan.bands.get()
+        band.minute_cost = 0.02
+        band.save()
+        self.assertAlmostEqual(self.rate(tariff_plan=plan).cost, 0.56)
+
+    @override_settings(TARIFF_PLAN_CACHE_TIMEOUT=-1)
+    def test_cache_timeout(self):
+        self.make_plan([], is_default=True)
+        TariffPlan.objects.update(initial_cost=1)
+
+        self.assertAlmostEqual(self.rate().cost, 1)
+
+
+class TariffBandFormSetTest(TestCase):
+    def formset(self, *bands):
+        FormSet = inlineformset_factory(
+            TariffPlan,
+            TariffBand,
+            formset=TariffBandFormSet,
+            fields=["day", "start_minute", "end_minute", "minute_cost"],
+        )
+        data = {
+            "bands-TOTAL_FORMS": len(bands),
+            "bands-INITIAL_FORMS": 0,
+        }
+        for number, (day, first, last) in enumerate(bands):
+            data.update(
+                {
+                    f"bands-{number}-day": day,
+                    f"bands-{number}-start_minute": first,
+                    f"bands-{number}-end_minute": last,
+                    f"bands-{number}-minute_cost": 0.1,
+                }
+            )
+        return FormSet(data, instance=TariffPlan(initial_cost=0))
+
+    def test_overlapping_bands(self):
+        monday, tuesday = TariffBand.Day.MONDAY, TariffBand.Day.TUESDAY
+
+        formset = self.formset((monday, 0, 600), (monday, 600, 1440))
+        self.assertTrue(formset.is_valid(), formset.non_form_errors())
+        self.assertTrue(
+            self.formset((monday, 0, 600), (tuesday, 300, 900)).is_valid()
+        )
+
+        formset = self.formset(
+            (monday, 600, 1440), (tuesday, 0, 60), (monday, 0, 601)
+        )
+        self.assertFalse(formset.is_valid())
+        self.assertEqual(
+            formset.non_form_errors(),
+            ["Monday bands 0-601 and 600-1440 overlap."],
+        )
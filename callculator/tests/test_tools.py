@@ -1,8 +1,18 @@
-from datetime import datetime
+import random
+from datetime import datetime, timedelta, timezone
+from unittest import skipIf
 
+from django.conf import settings
 from django.test import TestCase
 
-from callculator.tools import call_cost_calculator
+from callculator.benchmarks.rating import calls
+from callculator.tools import (
+    batch_call_cost_calculator,
+    call_cost_calculator,
+    day_night_minutes,
+    np,
+    payable_minutes,
+)
 
 
 class CallCostCalculatorTest(TestCase):
@@ -68,3 +78,116 @@ class CallCostCalculatorTest(TestCase):
         self.assertAlmostEqual(
             call_cost_calculator(start, end), expected_cost, places=2
         )
+
+
+class DayNightMinutesTest(TestCase):
+    def test_split(self):
+        start = datetime(2024, 11, 13, 21, 50, 0)
+        self.assertEqual(
+            day_night_minutes(start, datetime(2024, 11, 13, 22, 10, 0)),
+            (10, 10),
+        )
+        # A priced split, out of range, is kept within the whole minutes.
+        end = datetime(2024, 11, 13, 22, 10, 0)
+        self.assertEqual(day_night_minutes(start, end, 15), (15, 5))
+        self.assertEqual(day_night_minutes(start, end, 25), (20, 0))
+
+    def test_never_negative(self):
+        # The rate gives back a night minute it never charged.
+        start = datetime(2024, 11, 13, 2, 0, 30)
+        end = datetime(2024, 11, 13, 2, 5, 10)
+        self.assertEqual(payable_minutes(start, end), -1)
+        self.assertEqual(day_night_minutes(start, end), (0, 4))
+        self.assertEqual(day_night_minutes(start, start), (0, 0))
+        self.assertEqual(day_night_minutes(end, start), (0, 0))
+
+
+def legacy_call_cost_calculator(start, end):
+    counter = start
+    minutes = 0
+    while counter < end:
+        if int(settings.RATE_START) <= counter.hour < int(settings.RATE_END):
+            minutes += 1
+        counter += timedelta(minutes=1)
+
+    payable_time = (minutes * 60 - counter.second + end.second) // 60
+    return float(settings.INITIAL_COST) + (
+        payable_time * float(settings.MINUTE_COST)
+    )
+
+
+class CallCostCalculatorDifferentialTest(TestCase):
+    def assertMatchesLegacy(self, start, end):
+        self.assertEqual(
+            call_cost_calculator(start, end),
+            legacy_call_cost_calculator(start, end),
+            f"{start} -> {end}",
+        )
+
+    def test_random_intervals(self):
+        rng = random.Random(1113)
+        origin = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+        for _ in range(500):
+            start = origin + timedelta(
+                seconds=rng.randrange(366 * 86_400),
+                microseconds=rng.choice([0, rng.randrange(1_000_000)]),
+            )
+            end = start + timedelta(
+                seconds=rng.choice(
+                    [
+                        rng.randrange(-120, 120),
+                        rng.randrange(4 * 3600),
+                        rng.randrange(3 * 86_400),
+                    ]
+                ),
+                microseconds=rng.choice([0, rng.randrange(1_000_000)]),
+            )
+            self.assertMatchesLegacy(start, end)
+
+    def test_band_edges(self):
+        day = datetime(2024, 11, 13)
+        for hour in (5, 6, 21, 22, 23):
+            for second in (0, 1, 59):
+                start = day.replace(hour=hour, minute=59, second=second)
+                for length in (1, 59, 60, 61, 3600, 86_400 + 30):
+                    self.assertMatchesLegacy(
+                        start, start + timedelta(seconds=length)
+                    )
+
+    def test_custom_rate_band(self):
+        start = datetime(2024, 11, 13, 3, 17, 42)
+        for rate_start, rate_end in ((0, 24), (22, 6), (8, 8), (-1, 30)):
+            with self.settings(RATE_START=rate_start, RATE_END=rate_end):
+                for length in (0, 59, 4000, 200_000):
+                    self.assertMatchesLegacy(
+                        start, start + timedelta(seconds=length)
+                    )
+
+
+class BatchCallCostCalculatorTest(TestCase):
+    def setUp(self):
+        self.starts, self.ends = calls(2000, seed=7, max_duration=3 * 86_400)
+        self.starts += [self.ends[0], 1_700_000_030]
+        self.ends += [self.starts[0], 1_700_000_015]
+
+    def assertMatchesScalar(self, payable, costs):
+        for start, end, minutes, cost in zip(
+            self.starts, self.ends, payable, costs
+        ):
+            start = datetime.fromtimestamp(start, timezone.utc)
+            end = datetime.fromtimestamp(end, timezone.utc)
+            self.assertEqual(minutes, payable_minutes(start, end))
+            self.assertEqual(cost, call_cost_calculator(start, end))
+
+    def test_sequences(self):
+        payable, costs = batch_call_cost_calculator(self.starts, self.ends)
+        self.assertEqual(len(costs), len(self.starts))
+        self.assertMatchesScalar(payable, costs)
+
+    @skipIf(np is None, "numpy is not installed")
+    def test_numpy_arrays(self):
+        payable, costs = batch_call_cost_calculator(
+            np.array(self.starts), np.array(self.ends)
+        )
+        self.assertMatchesScalar(payable.tolist(), costs.tolist())
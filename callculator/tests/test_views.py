@@ -0,0 +1,301 @@
+import json
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from callculator.cache import billing_cache
+from callculator.models import Call, CallRecord, QueuedRecord
+from callculator.partitions import is_partitioned
+from callculator.tariffs import default_plan_id
+
+START_RECORD = {
+    "type": "START",
+    "timestamp": "2024-01-01T12:00:00Z",
+    "call_id": 1,
+    "source": "11987654321",
+    "destination": "21998765432",
+}
+END_RECORD = {
+    "type": "END",
+    "timestamp": "2024-01-01T13:00:00Z",
+    "call_id": 1,
+}
+
+
+class TestCallRecordBulk(APITestCase):
+    url = "/callculator/callrecord/bulk/"
+
+    def test_json_array(self):
+        response = self.client.post(
+            self.url, [START_RECORD, END_RECORD], format="json"
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["stored"], 2)
+        self.assertEqual(CallRecord.objects.count(), 2)
+
+        call = Call.objects.get(pk=1)
+        self.assertEqual(call.source, "11987654321")
+        self.assertAlmostEqual(call.cost, 0.36 + 60 * 0.09)
+
+    def test_ndjson(self):
+        body = "\n".join(json.dumps(r) for r in [START_RECORD, END_RECORD])
+        response = self.client.post(
+            self.url, body, content_type="application/x-ndjson"
+        )
+
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["stored"], 2)
+        self.assertIsNotNone(Call.objects.get(pk=1).duration)
+
+    def test_invalid_record_does_not_fail_batch(self):
+        invalid = {**START_RECORD, "call_id": 2, "source": "1234"}
+        bad_timestamp = {**END_RECORD, "timestamp": "yesterday"}
+
+        response = self.client.post(
+            self.url, [START_RECORD, invalid, bad_timestamp], format="json"
+        )
+
+        self.assertEqual(response.data["stored"], 1)
+        self.assertEqual(response.data["failed"], 2)
+        results = response.data["results"]
+        self.assertEqual(results[0]["status"], "OK")
+        self.assertIn("source", results[1]["errors"])
+        self.assertIn("timestamp", results[2]["errors"])
+        self.assertEqual(CallRecord.objects.count(), 1)
+
+    def test_updates_existing_calls_in_one_lookup(self):
+        Call.objects.create(pk=1, source="11987654321")
+        Call.objects.create(pk=2)
+
+        records = [
+            START_RECORD,
+            {**START_RECORD, "call_id": 2},
+            {**END_RECORD, "call_id": 2},
+            {**START_RECORD, "call_id": 3},
+        ]
+        # Call 2 gets completed: its earlier records move to its period and
+        # it goes on its bill, with a lookup of its old line, the bill, its
+        # line and the totals. On partitioned tables the calls are locked
+        # first. The default plan is looked up once per process.
+        default_plan_id()
+        with self.assertNumQueries(11 + is_partitioned("callculator_call")):
+            response = self.client.post(self.url, records, format="json")
+
+        self.assertEqual(response.data["stored"], 4)
+        self.assertEqual(Call.objects.count(), 3)
+        self.assertIsNotNone(Call.objects.get(pk=2).cost)
+
+    def test_requires_list(self):
+        response = self.client.post(self.url, START_RECORD, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+class TestCallRecordQueue(APITestCase):
+    url = "/callculator/callrecord/queue/"
+
+    def test_accepts_without_rating(self):
+        response = self.client.post(self.url, START_RECORD, format="json")
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            QueuedRecord.objects.get().pk, response.data["queue_id"]
+        )
+        self.assertFalse(Call.objects.exists())
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["depth"], 1)
+        self.assertGreaterEqual(response.data["lag"], 0)
+
+    def test_rejects_invalid_record(self):
+        response = self.client.post(
+            self.url, {**START_RECORD, "source": "1"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(QueuedRecord.objects.exists())
+
+
+class TestBillingPagination(APITestCase):
+    url = "/callculator/billing/"
+    params = {"phone_number": "11987654321", "dateref": "2024-01"}
+
+    def setUp(self):
+        billing_cache().clear()
+        first_end = timezone.make_aware(datetime(2024, 1, 10, 12, 0, 0))
+        for minutes in (0, 5, 5, 5, 30, 90, 90):
+            end = first_end + timedelta(minutes=minutes)
+            Call.objects.create(
+                source="11987654321",
+                destination="21998765432",
+                start=end - timedelta(minutes=1 + minutes),
+                end=end,
+            )
+
+    def test_pages_cover_the_month_once(self):
+        expected = self.client.get(self.url, self.params).json()["records"]
+
+        records, cursor = [], None
+        while True:
+            params = {**self.params, "page_size": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertLessEqual(len(response.data["records"]), 2)
+
+            records += response.json()["records"]
+            cursor = response.json()["next"]
+            if not cursor:
+                break
+
+        self.assertEqual(len(records), 7)
+        self.assertEqual(records, expected)
+
+    def test_invalid_page_parameters(self):
+        for params in ({"page_size": 0}, {"page_size": "x"}, {"cursor": "*"}):
+            response = self.client.get(self.url, {**self.params, **params})
+            self.assertEqual(response.status_code, 400)
+
+    def test_stream(self):
+        expected = self.client.get(self.url, self.params, format="json")
+
+        response = self.client.get(self.url, {**self.params, "stream": "1"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b"".join(response.streaming_content), expected.content
+        )
+
+
+class TestBillingBatch(APITestCase):
+    url = "/callculator/billing/batch/"
+    phone_numbers = ["11987654321", "1133334444", "21998765432"]
+
+    def setUp(self):
+        billing_cache().clear()
+        first_end = timezone.make_aware(datetime(2024, 1, 10, 12, 0, 0))
+        for position, source in enumerate(self.phone_numbers[:2] * 3):
+            end = first_end + timedelta(hours=position)
+            call = Call(
+                source=source,
+                destination="21998765432",
+                start=end - timedelta(minutes=position + 1),
+                end=end,
+            )
+            call.save()
+
+    def post(self, data):
+        return self.client.post(self.url, data, format="json")
+
+    def test_same_records_as_single_bills(self):
+        with self.assertNumQueries(1):
+            response = self.post(
+                {"phone_numbers": self.phone_numbers, "dateref": "2024-01"}
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        bills = response.json()["bills"]
+        self.assertEqual(
+            [bill["phone_number"] for bill in bills], self.phone_numbers
+        )
+        for bill in bills:
+            expected = self.client.get(
+                "/callculator/billing/",
+                {"phone_number": bill["phone_number"], "dateref": "2024-01"},
+            ).json()
+            self.assertEqual(bill["records"], expected["records"])
+            self.assertEqual(bill["call_count"], len(expected["records"]))
+
+            calls = Call.objects.filter(source=bill["phone_number"])
+            self.assertEqual(
+                bill["total_duration"],
+                sum(call.duration.total_seconds() for call in calls),
+            )
+            self.assertAlmostEqual(
+                bill["total_cost"], sum(call.cost for call in calls)
+            )
+
+        self.assertEqual(bills[2]["call_count"], 0)
+
+    def test_validation(self):
+        for data in (
+            {},
+            {"phone_numbers": []},
+            {"phone_numbers": "11987654321"},
+            {"phone_numbers": ["11987654321", "123"]},
+            {"phone_numbers": ["11987654321", None]},
+            {"phone_numbers": ["11987654321"], "dateref": "2024-13"},
+        ):
+            response = self.post(data)
+            self.assertEqual(response.status_code, 400, data)
+
+        with self.settings(BILLING_BATCH_MAX_NUMBERS=2):
+            response = self.post({"phone_numbers": self.phone_numbers})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["phone_numbers"],
+            ["At most 2 phone numbers per request."],
+        )
+
+        response = self.post({"phone_numbers": ["11987654321", "123"]})
+        self.assertEqual(
+            response.data["phone_numbers"],
+            ["Invalid phone number format: 123"],
+        )
+
+
+class TestBillingSummary(APITestCase):
+    params = {"phone_number": "11987654321", "dateref": "2024-01"}
+
+    def setUp(self):
+        for start, end in (
+            ("2024-01-01T12:00:00Z", "2024-01-01T13:00:00Z"),
+            ("2024-01-01T21:50:00Z", "2024-01-01T22:10:00Z"),
+            ("2024-01-31T23:00:00Z", "2024-02-01T00:30:00Z"),
+        ):
+            call = Call(
+                source="11987654321",
+                destination="21998765432",
+                start=datetime.fromisoformat(start),
+                end=datetime.fromisoformat(end),
+            )
+            call.save()
+
+    def test_totals(self):
+        expected = {
+            "phone_number": "11987654321",
+            "dateref": "2024-01-01",
+            "call_count": 2,
+            "total_duration": 80 * 60,
+            "total_cost": round(0.36 + 60 * 0.09 + 0.36 + 10 * 0.09, 2),
+            "day_minutes": 70,
+            "night_minutes": 10,
+        }
+        for url in ("/callculator/billing/", "/callculator/async/billing/"):
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {**self.params, "summary": 1})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), expected)
+
+        records = self.client.get("/callculator/billing/", self.params).json()
+        self.assertEqual(len(records["records"]), expected["call_count"])
+
+    def test_empty_month(self):
+        response = self.client.get(
+            "/callculator/billing/",
+            {**self.params, "dateref": "2023-12", "summary": "true"},
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "phone_number": "11987654321",
+                "dateref": "2023-12-01",
+                "call_count": 0,
+                "total_duration": 0,
+                "total_cost": 0,
+                "day_minutes": 0,
+                "night_minutes": 0,
+            },
+        )
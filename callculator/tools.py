@@ -1,17 +1,170 @@
-from datetime import datetime, timedelta
+from array import array
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
 
 from django.conf import settings
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+MINUTES_PER_DAY = 24 * 60
+MICROSECONDS_PER_MINUTE = 60 * 1_000_000
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def rate_band(rate_start=None, rate_end=None) -> tuple[int, int]:
+    """Return the standard rate band as ``[first, last)`` minutes of day."""
+    rate_start = int(settings.RATE_START if rate_start is None else rate_start)
+    rate_end = int(settings.RATE_END if rate_end is None else rate_end)
+
+    first = min(max(rate_start * 60, 0), MINUTES_PER_DAY)
+    last = min(max(rate_end * 60, 0), MINUTES_PER_DAY)
+    return first, max(first, last)
+
+
+def minute_steps(start: datetime, end: datetime) -> int:
+    """Number of one minute steps taken from ``start`` until ``end``."""
+    if not start < end:
+        return 0
+
+    if start.tzinfo is not end.tzinfo and end.tzinfo is not None:
+        end = end.astimezone(start.tzinfo)
+
+    elapsed = end.replace(tzinfo=None) - start.replace(tzinfo=None)
+    microseconds = (
+        elapsed.days * 86_400 + elapsed.seconds
+    ) * 1_000_000 + elapsed.microseconds
+    return -(-microseconds // MICROSECONDS_PER_MINUTE)
+
+
+def band_minutes(minute: int, steps: int, band: tuple[int, int]) -> int:
+    """Count the steps from ``minute`` of day that fall inside ``band``."""
+    first, last = band
+    width = last - first
+
+    def covered(until):
+        days, rest = divmod(until, MINUTES_PER_DAY)
+        return days * width + min(max(rest - first, 0), width)
+
+    return covered(minute + steps) - covered(minute)
+
+
+def payable_minutes(start: datetime, end: datetime, band=None) -> int:
+    """
+    Minutes charged at the standard rate.
+
+    Every minute step starting inside the rate band counts, and a call ending
+    on an earlier second than it started gives back one minute.
+    """
+    band = band or rate_band()
+    steps = minute_steps(start, end)
+    minutes = band_minutes(start.hour * 60 + start.minute, steps, band)
+
+    return (minutes * 60 - start.second + end.second) // 60
+
+
+def month_range(dateref: date) -> tuple[datetime, datetime]:
+    """Return the ``[month_start, next_month_start)`` range of ``dateref``."""
+    month_start = datetime(dateref.year, dateref.month, 1)
+    next_month_start = (
+        month_start.replace(month=dateref.month + 1)
+        if dateref.month < 12
+        else month_start.replace(year=dateref.year + 1, month=1)
+    )
+    return timezone.make_aware(month_start), timezone.make_aware(
+        next_month_start
+    )
+
+
+def day_night_minutes(
+    start: datetime, end: datetime, day: None | int = None
+) -> tuple[int, int]:
+    """
+    Minutes charged inside the standard rate band and outside of it.
+
+    ``day`` is the in-band minutes the call was priced with, those of the
+    global rate band by default. Both counts split the whole minutes of the
+    call, neither goes below 0 where the rate gives back a minute it never
+    charged.
+    """
+    total = max(payable_minutes(start, end, (0, MINUTES_PER_DAY)), 0)
+    if day is None:
+        day = payable_minutes(start, end)
+    day = min(max(day, 0), total)
+    return day, total - day
 
 
 def call_cost_calculator(start: datetime, end: datetime):
-    counter = start
-    minutes = 0
-    while counter < end:
-        if int(settings.RATE_START) <= counter.hour < int(settings.RATE_END):
-            minutes += 1
-        counter += timedelta(minutes=1)
-
-    payable_time = (minutes * 60 - counter.second + end.second) // 60
+    payable_time = payable_minutes(start, end)
     return float(settings.INITIAL_COST) + (
         payable_time * float(settings.MINUTE_COST)
     )
+
+
+def batch_call_cost_calculator(starts, ends, band=None):
+    """
+    Rate many calls at once from epoch timestamps in seconds (UTC).
+
+    Returns ``(payable_minutes, costs)``. NumPy arrays are rated in one
+    vectorized pass and returned as arrays, any other sequence is rated in a
+    single loop and returned as ``array("q")`` / ``array("d")``. Results match
+    ``call_cost_calculator`` call by call, or ``payable_minutes`` with
+    ``band``.
+    """
+    first, last = band or rate_band()
+    width = last - first
+    initial_cost = float(settings.INITIAL_COST)
+    minute_cost = float(settings.MINUTE_COST)
+
+    if np is not None and isinstance(starts, np.ndarray):
+        start_us = np.rint(np.asarray(starts) * 1_000_000).astype(np.int64)
+        end_us = np.rint(np.asarray(ends) * 1_000_000).astype(np.int64)
+
+        steps = np.where(
+            start_us < end_us,
+            -((start_us - end_us) // MICROSECONDS_PER_MINUTE),
+            0,
+        )
+        minute = (start_us // MICROSECONDS_PER_MINUTE) % MINUTES_PER_DAY
+
+        def covered(until):
+            return (until // MINUTES_PER_DAY) * width + np.clip(
+                until % MINUTES_PER_DAY - first, 0, width
+            )
+
+        minutes = covered(minute + steps) - covered(minute)
+        payable = (
+            minutes * 60
+            - (start_us // 1_000_000) % 60
+            + (end_us // 1_000_000) % 60
+        ) // 60
+        return payable, initial_cost + payable * minute_cost
+
+    payable = array("q")
+    costs = array("d")
+    for start, end in zip(starts, ends):
+        start_us = round(start * 1_000_000)
+        end_us = round(end * 1_000_000)
+
+        steps = (
+            -((start_us - end_us) // MICROSECONDS_PER_MINUTE)
+            if start_us < end_us
+            else 0
+        )
+        minute = (start_us // MICROSECONDS_PER_MINUTE) % MINUTES_PER_DAY
+        minutes = band_minutes(minute, steps, (first, last))
+        payable_time = (
+            minutes * 60
+            - (start_us // 1_000_000) % 60
+            + (end_us // 1_000_000) % 60
+        ) // 60
+
+        payable.append(payable_time)
+        costs.append(initial_cost + payable_time * minute_cost)
+
+    return payable, costs
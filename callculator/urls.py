@@ -1,9 +1,13 @@
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
 
 from callculator.apps import CallculatorConfig
+from callculator.views import asynchronous
 from callculator.views.billing import BillingViewSet
 from callculator.views.callrecord import CallRecordViewSet
 from callculator.views.health import HealthCheckViewSet
+from callculator.views.metrics import metrics_view
+from callculator.views.profiling import profile_detail, profile_list
 
 base_path = CallculatorConfig.name
 router = DefaultRouter()
@@ -11,3 +15,23 @@ router = DefaultRouter()
 router.register(base_path, CallRecordViewSet, basename="callrecord")
 router.register(base_path, BillingViewSet, basename="billing")
 router.register(base_path, HealthCheckViewSet, basename="health_check")
+
+urlpatterns = [
+    path(
+        f"{base_path}/async/callrecord/",
+        asynchronous.callrecord,
+        name="async-callrecord",
+    ),
+    path(
+        f"{base_path}/async/billing/",
+        asynchronous.billing,
+        name="async-billing",
+    ),
+    path(f"{base_path}/metrics", metrics_view, name="metrics"),
+    path(f"{base_path}/profiles/", profile_list, name="profile-list"),
+    re_path(
+        rf"^{base_path}/profiles/(?P<profile_id>[\w-]+)\.(?P<extension>prof|txt)$",
+        profile_detail,
+        name="profile-detail",
+    ),
+]
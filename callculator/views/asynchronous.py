@@ -0,0 +1,226 @@
+"""
+Native async endpoints for ASGI deployments.
+
+They mirror the call record and billing endpoints, with the same validation
+and response bodies. Requests are parsed, validated and rendered on the event
+loop and bills are read with the async ORM. Storing a call record takes a
+transaction, which Django can't open from async code: it is written in one
+hop to the sync-to-async thread executor.
+"""
+
+import json
+from datetime import date
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from callculator.archive import open_archive
+from callculator.bills import bill_lines, pending_calls, record_pending
+from callculator.cache import billing_cache
+from callculator.models import MonthlyBill
+from callculator.records import call_record
+from callculator.serializers import (
+    BillingResponseSerializer,
+    CallRecordSerializer,
+)
+from callculator.views.billing import (
+    STREAM_TAIL,
+    SUMMARY_AGGREGATES,
+    archived_bill,
+    archived_page,
+    archived_summary,
+    bill_rows,
+    bill_updates,
+    bill_version,
+    cache_entry,
+    cache_headers,
+    cache_key,
+    page_calls,
+    page_payload,
+    parse_billing_query,
+    stream_batch,
+    stream_head,
+    summary_payload,
+)
+
+
+def render(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+@csrf_exempt
+@require_POST
+async def callrecord(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError as exc:
+        return render({"detail": f"JSON parse error - {exc}"}, status=400)
+
+    serializer = CallRecordSerializer(data=data)
+    if not serializer.is_valid():
+        return render(serializer.errors, status=400)
+
+    try:
+        instance = await serializer.acreate(serializer.validated_data)
+    except serializers.ValidationError as exc:
+        return render(exc.detail, status=400)
+
+    return render(CallRecordSerializer(instance).data)
+
+
+@require_GET
+async def billing(request):
+    query, errors = parse_billing_query(request.GET)
+    if errors:
+        return render(errors, status=400)
+
+    phone_number = query["phone_number"]
+    dateref = query["dateref"]
+
+    if query["summary"]:
+        return render(await get_summary(phone_number, dateref))
+
+    if query["stream"]:
+        return StreamingHttpResponse(
+            stream_bill(phone_number, dateref),
+            content_type="application/json",
+        )
+
+    if query["page_size"]:
+        archive = open_archive(dateref)
+        try:
+            if archive is not None:
+                page = archived_page(
+                    archive.rows(phone_number),
+                    query["page_size"],
+                    query["cursor"],
+                )
+            else:
+                page = [
+                    row
+                    async for row in page_calls(
+                        phone_number,
+                        dateref,
+                        query["page_size"],
+                        query["cursor"],
+                    )
+                ]
+        except ValueError:
+            return render({"cursor": "Invalid cursor."}, status=400)
+
+        return render(
+            page_payload(phone_number, dateref, page, query["page_size"])
+        )
+
+    version = await get_version(phone_number, dateref)
+    key = cache_key(phone_number, dateref, version)
+    cache = billing_cache()
+
+    # Months without a bill yet are read live, they have no version.
+    cached = await cache.aget(key) if version else None
+    if cached is None:
+        cached = cache_entry(*await get_bill(phone_number, dateref), version)
+        if version:
+            await cache.aset(key, cached)
+
+    not_modified = get_conditional_response(
+        request,
+        etag=cached["etag"],
+        last_modified=cached["last_modified"],
+    )
+    if not_modified is not None:
+        for header, value in cache_headers(cached).items():
+            not_modified[header] = value
+        return not_modified
+
+    return render(cached["data"], headers=cache_headers(cached))
+
+
+async def get_version(phone_number: str, dateref: date) -> None | str:
+    """Version of the bill for its cache key and ETag."""
+    archive = open_archive(dateref)
+    if archive is not None:
+        return bill_version(archive.modified)
+
+    if await pending_calls().aexists():
+        await sync_to_async(record_pending)()
+    return bill_version(await bill_updates(phone_number, dateref).afirst())
+
+
+async def get_bill(phone_number: str, dateref: date):
+    """Return the bill and when it last changed."""
+    archive = open_archive(dateref)
+    if archive is not None:
+        return archived_bill(archive, phone_number, dateref)
+
+    lines = [
+        line
+        async for line in bill_lines(
+            MonthlyBill.make_key(phone_number, dateref)
+        ).values_list("record", "bill__updated_at")
+    ]
+    if lines:
+        data = {
+            "phone_number": phone_number,
+            "dateref": dateref,
+            "records": [record for record, _ in lines],
+        }
+        return data, lines[0][1]
+
+    data = {
+        "phone_number": phone_number,
+        "dateref": dateref,
+        "records": [
+            call_record(*row) async for row in bill_rows(phone_number, dateref)
+        ],
+    }
+    return data, timezone.now()
+
+
+async def get_summary(phone_number: str, dateref: date):
+    """Totals of the bill, aggregated by the database."""
+    archive = open_archive(dateref)
+    if archive is not None:
+        return archived_summary(archive, phone_number, dateref)
+
+    calls = BillingResponseSerializer.get_filtered_calls(phone_number, dateref)
+    totals = await calls.aaggregate(**SUMMARY_AGGREGATES)
+    return summary_payload(phone_number, dateref, totals)
+
+
+async def stream_bill(phone_number: str, dateref: date, batch_size=500):
+    yield stream_head(phone_number, dateref)
+
+    archive = open_archive(dateref)
+    if archive is not None:
+        rows = (row[:4] for row in archive.iter_rows(phone_number))
+        first = True
+        while batch := list(islice(rows, batch_size)):
+            yield stream_batch(batch, first)
+            first = False
+        yield STREAM_TAIL
+        return
+
+    # aiterator() of a values_list() queryset runs its query right away, on
+    # the event loop: fetch the batches in the executor instead.
+    rows = bill_rows(phone_number, dateref).iterator(chunk_size=2000)
+    fetch = sync_to_async(lambda: list(islice(rows, batch_size)))
+
+    first = True
+    while batch := await fetch():
+        yield stream_batch(batch, first)
+        first = False
+
+    yield STREAM_TAIL
@@ -1,85 +1,504 @@
-import re
-from datetime import date
+from bisect import bisect_right
+from datetime import date, timedelta
+from itertools import groupby, islice
+from operator import itemgetter
 
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 
-from callculator.serializers import BillingResponseSerializer
+from callculator.archive import open_archive
+from callculator.bills import bill_lines, completed_calls, record_pending
+from callculator.cache import billing_cache, make_etag
+from callculator.models import MonthlyBill
+from callculator.pagination import after_cursor, decode_cursor, encode_cursor
+from callculator.records import RECORD_COLUMNS, call_record, dumps, encode
+from callculator.serializers import (
+    PHONE_NUMBER_REGEX,
+    BillingBatchRequestSerializer,
+    BillingBatchResponseSerializer,
+    BillingResponseSerializer,
+)
+
+STREAM_TAIL = b"]}"
+PAGE_COLUMNS = (*RECORD_COLUMNS, "end", "id")
+SUMMARY_AGGREGATES = {
+    "call_count": Count("id"),
+    "total_duration": Sum("duration"),
+    "total_cost": Sum("cost"),
+    "day_minutes": Sum("day_minutes"),
+    "night_minutes": Sum("night_minutes"),
+}
+
+
+def parse_dateref(dateref: None | str) -> tuple[None | date, None | dict]:
+    """Validate a billing month, defaulting to the last closed one."""
+    if not dateref:
+        today = date.today()
+        last_month = (
+            date(today.year, today.month - 1, 1)
+            if today.month > 1
+            else date(today.year - 1, 12, 1)
+        )
+        return last_month, None
+
+    try:
+        dateref = parse_date(dateref + "-01")
+    except ValueError:
+        dateref = None
+    if not dateref:
+        return None, {"dateref": "Invalid date format. Use 'YYYY-MM'."}
+
+    curr_date = date.today().replace(day=1)
+    if dateref >= curr_date:
+        return None, {
+            "dateref": "There is no avaible billing for this dateref."
+        }
+    return dateref, None
+
+
+def parse_billing_query(params) -> tuple[dict, None | dict]:
+    """Validate billing query parameters, returning ``(query, errors)``."""
+    phone_number = params.get("phone_number")
+
+    if not phone_number:
+        return {}, {"error": "phone_number is required"}
+    if not PHONE_NUMBER_REGEX.match(phone_number):
+        return {}, {"phone_number": "Invalid phone number format"}
+
+    dateref, errors = parse_dateref(params.get("dateref"))
+    if errors:
+        return {}, errors
+
+    page_size = params.get("page_size")
+    cursor = params.get("cursor")
+    if page_size or cursor:
+        try:
+            page_size = int(page_size or settings.BILLING_PAGE_SIZE)
+            if not 0 < page_size <= settings.BILLING_MAX_PAGE_SIZE:
+                raise ValueError
+        except ValueError:
+            return {}, {
+                "page_size": "Must be an integer between 1 and "
+                f"{settings.BILLING_MAX_PAGE_SIZE}."
+            }
+
+    return {
+        "phone_number": phone_number,
+        "dateref": dateref,
+        "page_size": page_size,
+        "cursor": cursor,
+        "stream": params.get("stream") in ("1", "true"),
+        "summary": params.get("summary") in ("1", "true"),
+    }, None
+
+
+def bill_rows(phone_number: str, dateref: date, columns=RECORD_COLUMNS):
+    calls = BillingResponseSerializer.get_filtered_calls(phone_number, dateref)
+    return calls.values_list(*columns)
+
+
+def page_calls(
+    phone_number: str, dateref: date, page_size: int, cursor: None | str
+):
+    """``PAGE_COLUMNS`` of the calls of a page, plus the first of the next."""
+    calls = BillingResponseSerializer.get_filtered_calls(phone_number, dateref)
+    if cursor:
+        calls = after_cursor(calls, cursor)
+    return calls.values_list(*PAGE_COLUMNS)[: page_size + 1]
+
+
+def archived_page(rows: list, page_size: int, cursor: None | str) -> list:
+    """``page_calls`` over the rows of an archived bill."""
+    if cursor:
+        position = bisect_right(
+            rows, decode_cursor(cursor), key=lambda row: row[4:6]
+        )
+        rows = rows[position:]
+    return rows[: page_size + 1]
+
+
+def archived_bill(archive, phone_number: str, dateref: date):
+    """The bill of ``phone_number`` read from an archive, when it changed."""
+    data = {
+        "phone_number": phone_number,
+        "dateref": dateref,
+        "records": [
+            call_record(*row[:4]) for row in archive.rows(phone_number)
+        ],
+    }
+    return data, archive.modified
+
+
+def batch_bill(phone_number: str, rows: list) -> dict:
+    """Records and totals of the bill of ``phone_number`` in a batch."""
+    durations = [row[2] for row in rows if row[2] is not None]
+    return {
+        "phone_number": phone_number,
+        "records": [call_record(*row) for row in rows],
+        "call_count": len(rows),
+        "total_duration": int(sum(durations, timedelta()).total_seconds()),
+        "total_cost": round(sum(row[3] or 0 for row in rows), 2),
+    }
+
+
+def batch_bills(phone_numbers: list[str], dateref: date) -> list[dict]:
+    """
+    Bills of several phone numbers, from one query over the calls of all of
+    them grouped in memory, or from the archive of the month.
+    """
+    archive = open_archive(dateref)
+    if archive is not None:
+        rows = {
+            phone_number: [row[:4] for row in archive.rows(phone_number)]
+            for phone_number in phone_numbers
+        }
+    else:
+        rows = dict.fromkeys(phone_numbers, ())
+        calls = (
+            completed_calls(dateref)
+            .filter(source__in=phone_numbers)
+            .order_by("source", "end", "id")
+            .values_list("source", *RECORD_COLUMNS)
+        )
+        for source, group in groupby(calls, key=itemgetter(0)):
+            rows[source] = [row[1:] for row in group]
+
+    return [
+        batch_bill(phone_number, rows[phone_number])
+        for phone_number in phone_numbers
+    ]
+
+
+def summary_payload(phone_number: str, dateref: date, totals: dict) -> dict:
+    """Bill totals of ``SUMMARY_AGGREGATES``, zero for an empty month."""
+    return {
+        "phone_number": phone_number,
+        "dateref": dateref,
+        "call_count": totals["call_count"],
+        "total_duration": int(
+            (totals["total_duration"] or timedelta()).total_seconds()
+        ),
+        "total_cost": round(totals["total_cost"] or 0, 2),
+        "day_minutes": totals["day_minutes"] or 0,
+        "night_minutes": totals["night_minutes"] or 0,
+    }
+
+
+def archived_summary(archive, phone_number: str, dateref: date) -> dict:
+    """``summary_payload`` of a bill read from an archive."""
+    rows = archive.rows(phone_number)
+    totals = {
+        "call_count": len(rows),
+        "total_duration": sum(
+            (row[2] for row in rows if row[2] is not None), timedelta()
+        ),
+        "total_cost": sum(row[3] or 0 for row in rows),
+        "day_minutes": sum(row[6] or 0 for row in rows),
+        "night_minutes": sum(row[7] or 0 for row in rows),
+    }
+    return summary_payload(phone_number, dateref, totals)
+
+
+def page_payload(phone_number: str, dateref: date, page: list, page_size: int):
+    last = page[page_size - 1] if len(page) > page_size else None
+
+    return {
+        "phone_number": phone_number,
+        "dateref": dateref,
+        "records": [call_record(*row[:4]) for row in page[:page_size]],
+        "next": encode_cursor(last[4], last[5]) if last else None,
+    }
+
+
+def stream_head(phone_number: str, dateref: date) -> bytes:
+    """Opening of a streamed bill, up to its first record."""
+    head = encode({"phone_number": phone_number, "dateref": dateref})
+    return head[:-1].encode() + b',"records":['
+
+
+def stream_batch(rows: list, first: bool) -> bytes:
+    """Records of ``rows`` as they follow each other in a streamed bill."""
+    records = dumps([call_record(*row) for row in rows])[1:-1]
+    return records if first else b"," + records
+
+
+def bill_updates(phone_number: str, dateref: date):
+    """When the monthly bill of ``phone_number`` last changed."""
+    return MonthlyBill.objects.filter(
+        pk=MonthlyBill.make_key(phone_number, dateref)
+    ).values_list("updated_at", flat=True)
+
+
+def bill_version(modified) -> None | str:
+    """Version of a bill that changed at ``modified``, if it exists."""
+    return None if modified is None else f"{modified.timestamp():.6f}"
 
-PHONE_NUMBER_REGEX = re.compile(r"^\d{2}\d{8,9}$")
+
+def cache_key(phone_number: str, dateref: date, version: str) -> str:
+    """Key of a bill in the billing cache, a new one whenever it changes."""
+    return f"{MonthlyBill.make_key(phone_number, dateref)}@{version}"
+
+
+def cache_entry(data: dict, last_modified, version: None | str) -> dict:
+    return {
+        "data": data,
+        "etag": make_etag([version, data]),
+        "last_modified": int(last_modified.timestamp()),
+    }
+
+
+def cache_headers(cached: dict) -> dict:
+    return {
+        "ETag": cached["etag"],
+        "Last-Modified": http_date(cached["last_modified"]),
+    }
 
 
 @extend_schema(
     summary="Billings",
     description="Retrieve billing information by phone number and optional date reference.",
     tags=["billing"],
-    parameters=[
-        OpenApiParameter(
-            name="phone_number",
-            description="Phone number in the format 'AAXXXXXXXXX'",
-            required=True,
-            type=str,
-        ),
-        OpenApiParameter(
-            name="dateref",
-            description="Date reference in the format 'YYYY-MM'. If not provided, defaults to the last valid month.",
-            required=False,
-            type=str,
-        ),
-    ],
-    responses={200: BillingResponseSerializer},
+    responses={200: BillingResponseSerializer, 304: None},
     auth=[],
 )
 class BillingViewSet(viewsets.GenericViewSet):
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="phone_number",
+                description="Phone number in the format 'AAXXXXXXXXX'",
+                required=True,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="dateref",
+                description="Date reference in the format 'YYYY-MM'. If not provided, defaults to the last valid month.",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="page_size",
+                description="Return records in pages of this size, ordered by call end. The response 'next' cursor points to the following page.",
+                required=False,
+                type=int,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Cursor of the page to return, as given by 'next'.",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="summary",
+                description="Return the totals of the bill instead of its records: call_count, total_duration (seconds), total_cost, and the day_minutes and night_minutes charged inside and outside the standard rate band.",
+                required=False,
+                type=bool,
+            ),
+            OpenApiParameter(
+                name="stream",
+                description="Stream every record of the month as it is read from the database.",
+                required=False,
+                type=bool,
+            ),
+        ],
+    )
     @action(methods=["get"], detail=False)
     def billing(self, request, *args, **kwargs):
-        phone_number = request.query_params.get("phone_number")
-        dateref = request.query_params.get("dateref")
+        query, errors = parse_billing_query(request.query_params)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
-        if not phone_number:
-            return Response(
-                {"error": "phone_number is required"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        if not PHONE_NUMBER_REGEX.match(phone_number):
+        phone_number = query["phone_number"]
+        dateref = query["dateref"]
+
+        if query["summary"]:
             return Response(
-                {"phone_number": "Invalid phone number format"},
-                status=status.HTTP_400_BAD_REQUEST,
+                self.get_summary(phone_number, dateref),
+                status=status.HTTP_200_OK,
             )
 
-        if dateref:
-            dateref = parse_date(dateref + "-01")
+        if query["stream"]:
+            return self.stream_bill(phone_number, dateref)
 
-            if not dateref:
-                return Response(
-                    {"dateref": "Invalid date format. Use 'YYYY-MM'."},
-                    status=status.HTTP_400_BAD_REQUEST,
+        if query["page_size"]:
+            try:
+                data = self.get_page(
+                    phone_number, dateref, query["page_size"], query["cursor"]
                 )
-
-            curr_date = date.today().replace(day=1)
-            if dateref >= curr_date:
+            except ValueError:
                 return Response(
-                    {
-                        "dateref": "There is no avaible billing for this dateref."
-                    },
+                    {"cursor": "Invalid cursor."},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-        else:
-            today = date.today()
-            dateref = (
-                date(today.year, today.month - 1, 1)
-                if today.month > 1
-                else date(today.year - 1, 12, 1)
+            return Response(data, status=status.HTTP_200_OK)
+
+        version = self.get_version(phone_number, dateref)
+        key = cache_key(phone_number, dateref, version)
+        cache = billing_cache()
+
+        # Months without a bill yet are read live, they have no version.
+        cached = cache.get(key) if version else None
+        if cached is None:
+            cached = cache_entry(
+                *self.get_bill(phone_number, dateref), version
             )
+            if version:
+                cache.set(key, cached)
 
-        response_serializer = BillingResponseSerializer(
+        not_modified = get_conditional_response(
+            request._request,
+            etag=cached["etag"],
+            last_modified=cached["last_modified"],
+        )
+        if not_modified is not None:
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers=cache_headers(cached),
+            )
+
+        return Response(
+            cached["data"],
+            status=status.HTTP_200_OK,
+            headers=cache_headers(cached),
+        )
+
+    @extend_schema(
+        summary="Batch Billings",
+        description=(
+            "Retrieve the bills of several phone numbers for one month, with "
+            "their totals, from a single query. At most "
+            "BILLING_BATCH_MAX_NUMBERS phone numbers per request."
+        ),
+        request=BillingBatchRequestSerializer,
+        responses={200: BillingBatchResponseSerializer},
+    )
+    @action(
+        methods=["post"],
+        detail=False,
+        url_path="billing/batch",
+        parser_classes=[JSONParser],
+    )
+    def billing_batch(self, request, *args, **kwargs):
+        serializer = BillingBatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        dateref, errors = parse_dateref(
+            serializer.validated_data.get("dateref")
+        )
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
             {
+                "dateref": dateref,
+                "bills": batch_bills(
+                    serializer.validated_data["phone_numbers"], dateref
+                ),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @staticmethod
+    def get_version(phone_number: str, dateref: date) -> None | str:
+        """
+        Version of the bill for its cache key and ETag: when it last changed,
+        in the database so that every process sees it.
+        """
+        archive = open_archive(dateref)
+        if archive is not None:
+            return bill_version(archive.modified)
+
+        record_pending()
+        return bill_version(bill_updates(phone_number, dateref).first())
+
+    @staticmethod
+    def get_bill(phone_number: str, dateref: date):
+        """Return the bill and when it last changed."""
+        archive = open_archive(dateref)
+        if archive is not None:
+            return archived_bill(archive, phone_number, dateref)
+
+        lines = list(
+            bill_lines(
+                MonthlyBill.make_key(phone_number, dateref)
+            ).values_list("record", "bill__updated_at")
+        )
+        if lines:
+            data = {
                 "phone_number": phone_number,
                 "dateref": dateref,
+                "records": [record for record, _ in lines],
             }
+            return data, lines[0][1]
+
+        data = {
+            "phone_number": phone_number,
+            "dateref": dateref,
+            "records": [
+                call_record(*row) for row in bill_rows(phone_number, dateref)
+            ],
+        }
+        return data, timezone.now()
+
+    @staticmethod
+    def get_summary(phone_number: str, dateref: date):
+        """Totals of the bill, aggregated by the database."""
+        archive = open_archive(dateref)
+        if archive is not None:
+            return archived_summary(archive, phone_number, dateref)
+
+        calls = BillingResponseSerializer.get_filtered_calls(
+            phone_number, dateref
         )
+        totals = calls.aggregate(**SUMMARY_AGGREGATES)
+        return summary_payload(phone_number, dateref, totals)
+
+    @staticmethod
+    def get_page(
+        phone_number: str, dateref: date, page_size: int, cursor: None | str
+    ):
+        """One page of records, keyed on ``(end, id)`` after ``cursor``."""
+        archive = open_archive(dateref)
+        if archive is not None:
+            calls = archived_page(
+                archive.rows(phone_number), page_size, cursor
+            )
+        else:
+            calls = page_calls(phone_number, dateref, page_size, cursor)
+        return page_payload(phone_number, dateref, list(calls), page_size)
+
+    @staticmethod
+    def stream_bill(phone_number: str, dateref: date):
+        """
+        Write the bill as records are read, in constant memory: batches of
+        rows from the database, or one block at a time from an archive.
+        """
+        archive = open_archive(dateref)
+        if archive is not None:
+            rows = (row[:4] for row in archive.iter_rows(phone_number))
+        else:
+            rows = bill_rows(phone_number, dateref).iterator(chunk_size=2000)
+
+        def chunks(batch_size=500):
+            yield stream_head(phone_number, dateref)
+
+            first = True
+            while batch := list(islice(rows, batch_size)):
+                yield stream_batch(batch, first)
+                first = False
+
+            yield STREAM_TAIL
 
-        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        return StreamingHttpResponse(chunks(), content_type="application/json")
@@ -1,9 +1,21 @@
+from django.conf import settings
+from django.db import DatabaseError
 from drf_spectacular.utils import extend_schema
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 
-from callculator.serializers import CallRecordSerializer
+from callculator import queue
+from callculator.archive import ArchivedPeriodError
+from callculator.ingest import apply_records
+from callculator.parsers import NDJSONParser
+from callculator.serializers import (
+    CallRecordBulkResponseSerializer,
+    CallRecordSerializer,
+    IngestQueueSerializer,
+    QueuedRecordSerializer,
+)
 
 
 @extend_schema(
@@ -27,3 +39,98 @@ class CallRecordViewSet(viewsets.GenericViewSet):
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        summary="Bulk Call Records",
+        description=(
+            "Submit many call records at once, as a JSON array or as "
+            "newline-delimited JSON (application/x-ndjson). Each record is "
+            "validated on its own, so invalid records are reported without "
+            "failing the rest of the batch."
+        ),
+        request=CallRecordSerializer(many=True),
+        responses={200: CallRecordBulkResponseSerializer},
+    )
+    @action(
+        methods=["post"],
+        detail=False,
+        url_path="callrecord/bulk",
+        parser_classes=[JSONParser, NDJSONParser],
+    )
+    def callrecord_bulk(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return Response(
+                {"error": "Expected a list of call records"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [None] * len(request.data)
+        valid = []
+        for index, item in enumerate(request.data):
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {
+                    "index": index,
+                    "status": "ERROR",
+                    "errors": serializer.errors,
+                }
+
+        chunk_size = settings.CALLRECORD_BULK_CHUNK_SIZE
+        for offset in range(0, len(valid), chunk_size):
+            chunk = valid[offset : offset + chunk_size]
+            try:
+                call_records = apply_records([data for _, data in chunk])
+            except (DatabaseError, ArchivedPeriodError) as exc:
+                for index, _ in chunk:
+                    results[index] = {
+                        "index": index,
+                        "status": "ERROR",
+                        "errors": {"non_field_errors": [str(exc)]},
+                    }
+                continue
+
+            for (index, data), call_record in zip(chunk, call_records):
+                results[index] = {
+                    "index": index,
+                    "status": "OK",
+                    "record": self.get_serializer(
+                        {**data, "id": call_record.id}
+                    ).data,
+                }
+
+        stored = sum(result["status"] == "OK" for result in results)
+        return Response(
+            {
+                "stored": stored,
+                "failed": len(results) - stored,
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    @extend_schema(
+        summary="Queued Call Records",
+        description=(
+            "POST validates a call record, stores it in the ingest queue and "
+            "answers 202 right away; run_rating_worker applies it later. GET "
+            "reports the queue depth and the age in seconds of its oldest "
+            "record."
+        ),
+        request=CallRecordSerializer,
+        responses={202: QueuedRecordSerializer, 200: IngestQueueSerializer},
+    )
+    @action(methods=["get", "post"], detail=False, url_path="callrecord/queue")
+    def callrecord_queue(self, request, *args, **kwargs):
+        if request.method == "GET":
+            return Response(queue.stats(), status=status.HTTP_200_OK)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queued = queue.enqueue(request.data)
+
+        return Response(
+            {"queue_id": queued.pk, "received_at": queued.received_at},
+            status=status.HTTP_202_ACCEPTED,
+        )
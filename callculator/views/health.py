@@ -1,8 +1,9 @@
 from datetime import datetime
 
-from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import extend_schema
+from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -10,12 +11,20 @@ from rest_framework.throttling import AnonRateThrottle
 from rest_framework.viewsets import ViewSet
 
 from callculator.apps import CallculatorConfig
-from callculator.serializers import HealthCheckResponseSerializer
+from callculator.health import readiness
+from callculator.serializers import (
+    HealthCheckResponseSerializer,
+    LivenessResponseSerializer,
+    ReadinessResponseSerializer,
+)
 
 
 @extend_schema(
     summary=_("Health Check endpoint"),
-    description=_("Return simple health check."),
+    description=_(
+        "Return simple health check, with the database status of the last "
+        "readiness check."
+    ),
     responses={200: HealthCheckResponseSerializer},
     tags=["health"],
     auth=[],
@@ -26,13 +35,64 @@ class HealthCheckViewSet(ViewSet):
 
     @action(methods=["get"], detail=False)
     def health_check(self, request):
-        user_count = User.objects.count()
+        database = readiness.get()["database"]
         app_name = CallculatorConfig.name
 
         payload = {
             "service": app_name,
             "status": "OK",
-            "database": f"OK ({user_count})",
+            "database": (
+                f"OK ({database['latency_ms']} ms)"
+                if database["status"] == "OK"
+                else f"FAIL ({database['error']})"
+            ),
             "time": datetime.utcnow().isoformat(),
         }
         return Response(payload)
+
+    @extend_schema(
+        summary=_("Liveness probe"),
+        description=_(
+            "Answer as long as the process serves requests, without any I/O."
+        ),
+        responses={200: LivenessResponseSerializer},
+    )
+    @action(methods=["get"], detail=False, throttle_classes=[])
+    def livez(self, request):
+        return Response(
+            {
+                "service": CallculatorConfig.name,
+                "status": "OK",
+                "time": timezone.now(),
+            }
+        )
+
+    @extend_schema(
+        summary=_("Readiness probe"),
+        description=_(
+            "Result of the last readiness check: SELECT 1 latency, "
+            "unapplied migrations and ingest queue lag. Checks run in the "
+            "background every HEALTH_CHECK_INTERVAL seconds; answers 503 "
+            "when one failed."
+        ),
+        responses={
+            200: ReadinessResponseSerializer,
+            503: ReadinessResponseSerializer,
+        },
+    )
+    @action(methods=["get"], detail=False, throttle_classes=[])
+    def readyz(self, request):
+        result = readiness.get()
+        payload = {
+            "service": CallculatorConfig.name,
+            **result,
+            "age": round(readiness.age(), 3),
+        }
+        return Response(
+            payload,
+            status=(
+                status.HTTP_200_OK
+                if result["status"] == "OK"
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            ),
+        )
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.http import FileResponse, Http404, JsonResponse
+from django.views.decorators.http import require_GET
+
+from callculator import profiling
+
+CONTENT_TYPES = {
+    "prof": "application/octet-stream",
+    "txt": "text/plain; charset=utf-8",
+}
+
+
+def check_access(request):
+    """Hide the captures unless profiling is on and the token is given."""
+    token = request.headers.get(profiling.PROFILE_HEADER) or request.GET.get(
+        "profile"
+    )
+    if not settings.PROFILING_ENABLED or not profiling.is_authorized(token):
+        raise Http404
+
+
+@require_GET
+def profile_list(request):
+    check_access(request)
+    return JsonResponse({"profiles": profiling.captures()})
+
+
+@require_GET
+def profile_detail(request, profile_id, extension):
+    check_access(request)
+    if not profiling.PROFILE_ID_REGEX.match(profile_id):
+        raise Http404
+
+    path = profiling.profile_dir() / f"{profile_id}.{extension}"
+    if not path.is_file():
+        raise Http404
+    return FileResponse(
+        path.open("rb"),
+        as_attachment=extension == "prof",
+        filename=path.name,
+        content_type=CONTENT_TYPES[extension],
+    )
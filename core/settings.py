@@ -74,6 +74,8 @@ if DEBUG:
     INSTALLED_APPS.append("whitenoise.runserver_nostatic")
 
 MIDDLEWARE = [
+    "callculator.metrics.MetricsMiddleware",
+    "callculator.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -108,15 +110,52 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept for DATABASE_CONN_MAX_AGE seconds ("none" for no
+# limit, 0 to close them after each request) and pinged before being reused
+# when DATABASE_CONN_HEALTH_CHECKS is set. Under ASGI, where each request runs
+# in its own thread, set DATABASE_POOL instead to borrow them from a psycopg
+# pool (PostgreSQL with the "pool" extra: psycopg 3 and psycopg_pool).
+DATABASE_CONN_MAX_AGE = os.getenv("DATABASE_CONN_MAX_AGE", "0")
+DATABASE_CONN_MAX_AGE = (
+    None
+    if DATABASE_CONN_MAX_AGE.lower() == "none"
+    else int(DATABASE_CONN_MAX_AGE)
+)
+DATABASE_CONN_HEALTH_CHECKS = (
+    os.getenv("DATABASE_CONN_HEALTH_CHECKS", "true").lower() == "true"
+)
+DATABASE_POOL = os.getenv("DATABASE_POOL", "false").lower() == "true"
+DATABASE_POOL_OPTIONS = {
+    "min_size": int(os.getenv("DATABASE_POOL_MIN_SIZE", 2)),
+    "max_size": int(os.getenv("DATABASE_POOL_MAX_SIZE", 10)),
+    # Seconds to wait for a connection before failing the request
+    "timeout": float(os.getenv("DATABASE_POOL_TIMEOUT", 10)),
+    "max_idle": float(os.getenv("DATABASE_POOL_MAX_IDLE", 600)),
+    "max_lifetime": float(os.getenv("DATABASE_POOL_MAX_LIFETIME", 3600)),
+}
+
 if "DATABASE_URL" in os.environ:
     import dj_database_url
 
-    DATABASES = {"default": dj_database_url.config()}
+    DATABASES = {
+        "default": dj_database_url.config(
+            conn_max_age=DATABASE_CONN_MAX_AGE,
+            conn_health_checks=DATABASE_CONN_HEALTH_CHECKS,
+        )
+    }
+    if DATABASE_POOL:
+        # Django refuses persistent connections on top of a pool.
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"].setdefault("OPTIONS", {})[
+            "pool"
+        ] = DATABASE_POOL_OPTIONS
 else:
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": DATABASE_CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": DATABASE_CONN_HEALTH_CHECKS,
         }
     }
 
@@ -194,3 +233,72 @@ INITIAL_COST = os.getenv("INITIAL_COST", 0.36)
 MINUTE_COST = os.getenv("MINUTE_COST", 0.09)
 RATE_START = os.getenv("RATE_START", 6)
 RATE_END = os.getenv("RATE_END", 22)
+
+# Tariff plans stored in the database take over from the settings above once
+# a call has a plan or a default plan exists. Compiled plans are cached per
+# process for this many seconds.
+TARIFF_PLAN_CACHE_TIMEOUT = int(os.getenv("TARIFF_PLAN_CACHE_TIMEOUT", 60))
+
+# Number of records written per transaction by the bulk call record endpoint
+CALLRECORD_BULK_CHUNK_SIZE = int(os.getenv("CALLRECORD_BULK_CHUNK_SIZE", 1000))
+
+# Cache of rendered bills. Any Django cache backend works: the default keeps
+# an in-process LRU, point BILLING_CACHE_BACKEND to
+# django.core.cache.backends.filebased.FileBasedCache (with a directory as
+# BILLING_CACHE_LOCATION) to share it between workers, or set BILLING_CACHE
+# to the alias of another configured cache.
+# Entries are keyed by the time their bill last changed, read from the
+# database, so a bill changed by any process is never served from the cache.
+BILLING_CACHE_BACKEND = os.getenv(
+    "BILLING_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "billing": {
+        "BACKEND": BILLING_CACHE_BACKEND,
+        "LOCATION": os.getenv("BILLING_CACHE_LOCATION", "billing"),
+        "TIMEOUT": int(os.getenv("BILLING_CACHE_TIMEOUT", 24 * 3600)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("BILLING_CACHE_MAX_ENTRIES", 10_000)),
+        },
+    },
+}
+BILLING_CACHE = os.getenv("BILLING_CACHE", "billing")
+
+# Request metrics served in the Prometheus text format at
+# /callculator/metrics, per process.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Readiness probe at /callculator/readyz/: checked every
+# HEALTH_CHECK_INTERVAL seconds by a background thread, with SELECT 1 bounded
+# by HEALTH_CHECK_TIMEOUT (PostgreSQL). Readiness fails when the oldest queued
+# call record is older than HEALTH_CHECK_MAX_QUEUE_LAG seconds (0: never).
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 1))
+HEALTH_CHECK_BACKGROUND = (
+    os.getenv("HEALTH_CHECK_BACKGROUND", "true").lower() == "true"
+)
+HEALTH_CHECK_MAX_QUEUE_LAG = float(os.getenv("HEALTH_CHECK_MAX_QUEUE_LAG", 0))
+
+# On-demand profiling of requests, off unless PROFILING_ENABLED is set. A
+# request is profiled when it sends PROFILING_TOKEN in the X-Profile header
+# (or the profile query parameter), or at random at PROFILING_SAMPLE_RATE.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_DIR = os.getenv("PROFILING_DIR", BASE_DIR / "profiles")
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", 100))
+PROFILING_TOP_FUNCTIONS = int(os.getenv("PROFILING_TOP_FUNCTIONS", 30))
+
+# Compressed archives of closed months, written by archive_period. Bills of
+# an archived month are served from its file instead of the database.
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", BASE_DIR / "archive")
+
+# Billing pagination
+BILLING_PAGE_SIZE = int(os.getenv("BILLING_PAGE_SIZE", 1000))
+BILLING_MAX_PAGE_SIZE = int(os.getenv("BILLING_MAX_PAGE_SIZE", 10_000))
+
+# Most phone numbers billed by one request to /callculator/billing/batch/
+BILLING_BATCH_MAX_NUMBERS = int(os.getenv("BILLING_BATCH_MAX_NUMBERS", 1000))